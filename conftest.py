@@ -82,6 +82,7 @@ def clean_up_test_directories():
         'test_family',
         'test_party_out',
         'test_tar_write',
+        'test_tribe_dir',
         'tmp1',
     ]
 
@@ -13,20 +13,23 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import copy
 import numpy as np
 import scipy
 import warnings
 
-from multiprocessing import Pool, cpu_count
-from collections import Counter
+from multiprocessing import cpu_count
+from collections import deque
 
 from obspy import Stream
 from obspy.core.event import Catalog
 from obspy.core.event import Event, Pick, WaveformStreamID
 from obspy.core.event import ResourceIdentifier, Comment
 
+from eqcorrscan.utils.correlate import multi_image_normxcorr
 from eqcorrscan.utils.plotting import plot_repicked, detection_multiplot
 from eqcorrscan.utils.debug_log import debug_print
+from eqcorrscan.utils.worker_pool import pool_context
 
 
 class LagCalcError(Exception):
@@ -98,6 +101,72 @@ def _xcorr_interp(ccc, dt):
     return shift, coeff
 
 
+def _xcorr_interp_array(cccs, dt):
+    """
+    Interpolate around the maximum of many correlation functions at once.
+
+    Vectorised version of :func:`_xcorr_interp`: a parabola is fitted to the
+    samples around the maximum of each row, out to where the curvature of the
+    correlation function becomes positive.
+
+    :param cccs: 2D array of cross-correlation functions, one per row.
+    :type cccs: numpy.ndarray
+    :param dt: sample interval
+    :type dt: float
+
+    :return:
+        Position of interpolated maxima in seconds from start of each row,
+        interpolated maximum correlations, and boolean array of unstable fits.
+        Fits are unstable if fewer than 3 samples are around the maximum, or
+        if the fitted parabola opens upwards; for these rows the position and
+        value of the maximum sample are returned.
+    :rtype: tuple
+    """
+    cccs = np.atleast_2d(np.asarray(cccs, dtype=np.float64))
+    n_rows, n_samples = cccs.shape
+    rows = np.arange(n_rows)
+    samples = np.arange(n_samples)
+    peak_index = cccs.argmax(axis=1)
+    peak = cccs[rows, peak_index]
+    curvature = np.zeros_like(cccs)
+    curvature[:, 1:-1] = np.diff(cccs, 2, axis=1)
+    convex = curvature > 0
+    # Fit from after the last convex sample before the peak, to before the
+    # first convex sample after the peak.
+    last_convex = np.maximum.accumulate(
+        np.where(convex, samples, -1), axis=1)
+    first_sample = np.where(
+        peak_index > 0,
+        last_convex[rows, np.maximum(peak_index - 1, 0)] + 1, 0)
+    next_convex = np.minimum.accumulate(
+        np.where(convex, samples, n_samples)[:, ::-1], axis=1)[:, ::-1]
+    last_sample = np.where(
+        peak_index < n_samples - 1,
+        next_convex[rows, np.minimum(peak_index + 1, n_samples - 1)] - 1,
+        n_samples - 1)
+    unstable = (last_sample - first_sample + 1 < 3) | ~np.isfinite(peak)
+    # Least-squares fit of a parabola, with times relative to the peak
+    window = ((samples >= first_sample[:, np.newaxis]) &
+              (samples <= last_sample[:, np.newaxis]))
+    t = (samples - peak_index[:, np.newaxis]) * dt
+    t_sums = [np.where(window, t ** k, 0).sum(axis=1) for k in range(5)]
+    cc = np.where(window, cccs, 0)
+    cc_sums = [(cc * t ** k).sum(axis=1) for k in range(3)]
+    normal = np.array([[t_sums[4], t_sums[3], t_sums[2]],
+                       [t_sums[3], t_sums[2], t_sums[1]],
+                       [t_sums[2], t_sums[1], t_sums[0]]]).transpose(2, 0, 1)
+    normal[unstable] = np.eye(3)
+    coeffs = np.linalg.solve(
+        normal, np.array(cc_sums[::-1]).T[:, :, np.newaxis])[:, :, 0]
+    unstable |= coeffs[:, 0] >= 0
+    a = np.where(unstable, -1.0, coeffs[:, 0])
+    shift = (peak_index * dt) - coeffs[:, 1] / (2.0 * a)
+    coeff = coeffs[:, 2] - coeffs[:, 1] ** 2 / (4 * a)
+    shift[unstable] = peak_index[unstable] * dt
+    coeff[unstable] = peak[unstable]
+    return shift, coeff, unstable
+
+
 def _channel_loop(detection, template, min_cc, detection_id, interpolate, i,
                   pre_lag_ccsum=None, detect_chans=0,
                   horizontal_chans=['E', 'N', '1', '2'], vertical_chans=['Z'],
@@ -151,11 +220,7 @@ def _channel_loop(detection, template, min_cc, detection_id, interpolate, i,
     """
     from eqcorrscan.core.match_filter import normxcorr2
     import math
-    event = Event()
-    s_stachans = {}
-    cccsum = 0
-    checksum = 0
-    used_chans = 0
+    correlations = []
     for tr in template:
         temp_net = tr.stats.network
         temp_sta = tr.stats.station
@@ -174,13 +239,11 @@ def _channel_loop(detection, template, min_cc, detection_id, interpolate, i,
                 print('Image is %i long' % len(image[0].data))
                 print('Template is %i long' % len(tr.data))
                 continue
-            try:
-                shift, cc_max = _xcorr_interp(ccc=ccc, dt=image[0].stats.delta)
-            except IndexError:
+            shift, cc_max, unstable = _xcorr_interp_array(
+                cccs=ccc, dt=image[0].stats.delta)
+            shift, cc_max = shift[0], cc_max[0]
+            if unstable[0]:
                 print('Could not interpolate ccc, not smooth')
-                ccc = normxcorr2(tr.data, image[0].data)
-                cc_max = np.amax(ccc)
-                shift = np.argmax(ccc) * image[0].stats.delta
             # Convert the maximum cross-correlation time to an actual time
             if math.isnan(cc_max):
                 print('Problematic trace, no cross correlation possible')
@@ -203,6 +266,62 @@ def _channel_loop(detection, template, min_cc, detection_id, interpolate, i,
             else:
                 picktime = image[0].stats.starttime + (
                     np.argmax(ccc) * image[0].stats.delta)
+        correlations.append((temp_net, temp_sta, temp_chan, cc_max,
+                             np.amax(ccc), picktime))
+    event = _make_event(
+        correlations=correlations, min_cc=min_cc, detection_id=detection_id,
+        pre_lag_ccsum=pre_lag_ccsum, detect_chans=detect_chans,
+        horizontal_chans=horizontal_chans, vertical_chans=vertical_chans,
+        debug=debug)
+    return i, event
+
+
+def _make_event(correlations, min_cc, detection_id, pre_lag_ccsum=None,
+                detect_chans=0, horizontal_chans=['E', 'N', '1', '2'],
+                vertical_chans=['Z'], debug=0):
+    """
+    Make an event with picks from the correlations of one detection.
+
+    :type correlations: list
+    :param correlations:
+        List of (network, station, channel, cc_max, peak, picktime) for each
+        template channel correlated, in template order. cc_max is the
+        (possibly interpolated) maximum correlation, peak is the maximum of
+        the correlation function.
+    :type min_cc: float
+    :param min_cc: Minimum cross-correlation value to allow a pick to be made.
+    :type detection_id: str
+    :param detection_id: Detection ID to associate the event with.
+    :type pre_lag_ccsum: float
+    :param pre_lag_ccsum:
+        Cross-correlation sum before lag-calc, will check that the
+        cross-correlation sum is increased by lag-calc (using all channels,
+        ignoring min_cc)
+    :type detect_chans: int
+    :param detect_chans:
+        Number of channels originally used in detections, must match the number
+        used here to allow for cccsum checking.
+    :type horizontal_chans: list
+    :param horizontal_chans:
+        List of channel endings for horizontal-channels, on which S-picks will
+        be made.
+    :type vertical_chans: list
+    :param vertical_chans:
+        List of channel endings for vertical-channels, on which P-picks will
+        be made.
+    :type debug: int
+    :param debug: Debug output level 0-5.
+
+    :returns:
+        Event object containing network, station, channel and pick information.
+    :rtype: :class:`obspy.core.event.Event`
+    """
+    event = Event()
+    s_stachans = {}
+    cccsum = 0
+    checksum = 0
+    used_chans = 0
+    for temp_net, temp_sta, temp_chan, cc_max, peak, picktime in correlations:
         debug_print('Maximum cross-corr=%s' % cc_max, 3, debug)
         checksum += cc_max
         used_chans += 1
@@ -220,10 +339,9 @@ def _channel_loop(detection, template, min_cc, detection_id, interpolate, i,
             debug_print('Making S-pick on: %s.%s.%s' %
                         (temp_net, temp_sta, temp_chan), 4, debug)
             if temp_sta not in s_stachans.keys():
-                s_stachans[temp_sta] = ((temp_chan, np.amax(ccc),
-                                         picktime))
+                s_stachans[temp_sta] = ((temp_chan, peak, picktime))
             elif temp_sta in s_stachans.keys():
-                if np.amax(ccc) > s_stachans[temp_sta][1]:
+                if peak > s_stachans[temp_sta][1]:
                     picktime = picktime
                 else:
                     continue
@@ -251,12 +369,193 @@ def _channel_loop(detection, template, min_cc, detection_id, interpolate, i,
         warnings.warn('Cannot check if cccsum is better, used %i channels '
                       'for detection, but %i are used here'
                       % (detect_chans, used_chans))
-    return i, event
+    return event
+
+
+def _template_loop(detection_streams, template, min_cc, detections,
+                   horizontal_chans, vertical_chans, interpolate, debug=0):
+    """
+    Correlate and pick all detections for one template in batches.
+
+    For each template channel, the data for all detections are stacked and
+    correlated with one call to
+    :func:`eqcorrscan.utils.correlate.multi_image_normxcorr`, rather than
+    correlating each detection separately.
+
+    :type detection_streams: list
+    :param detection_streams:
+        List of :class:`obspy.core.stream.Stream` of data for each detection.
+    :type template: obspy.core.stream.Stream
+    :param template: The original template used to detect the detections passed
+    :type min_cc: float
+    :param min_cc: Minimum cross-correlation value to be allowed for a pick.
+    :type detections: list
+    :param detections:
+        List of detections to associate events with an input detection.
+    :type horizontal_chans: list
+    :param horizontal_chans:
+        List of channel endings for horizontal-channels, on which S-picks will
+        be made.
+    :type vertical_chans: list
+    :param vertical_chans:
+        List of channel endings for vertical-channels, on which P-picks will
+        be made.
+    :type interpolate: bool
+    :param interpolate:
+        Interpolate the correlation function to achieve sub-sample precision.
+    :type debug: int
+    :param debug: debug output level 0-5.
+
+    :returns:
+        Catalog object containing Event objects for each detection created by
+        this template.
+    :rtype: :class:`obspy.core.event.Catalog`
+    """
+    from eqcorrscan.core.match_filter import normxcorr2
+    correlations = [[] for _ in detection_streams]
+    for tr in template:
+        debug_print('Working on: %s.%s.%s' % (
+            tr.stats.network, tr.stats.station, tr.stats.channel), 3, debug)
+        # Group images by length and sample interval so they can be stacked
+        images = {}
+        for i, detection_stream in enumerate(detection_streams):
+            image = detection_stream.select(
+                station=tr.stats.station, channel=tr.stats.channel)
+            if len(image) == 0 or sum(image[0].data) == 0:
+                print('No match in image.')
+                continue
+            images.setdefault((len(image[0].data), image[0].stats.delta),
+                              []).append((i, image[0]))
+        for (image_length, delta), group in images.items():
+            if image_length < len(tr.data):
+                cccs = np.array([normxcorr2(tr.data, image.data)[0]
+                                 for _, image in group])
+            else:
+                cccs = multi_image_normxcorr(
+                    tr.data, np.array([image.data for _, image in group]))
+            peaks = cccs.max(axis=1)
+            if interpolate:
+                shifts, cc_maxes, unstable = _xcorr_interp_array(
+                    cccs=cccs, dt=delta)
+                for _ in range(unstable.sum()):
+                    print('Could not interpolate ccc, not smooth')
+            else:
+                shifts, cc_maxes = cccs.argmax(axis=1) * delta, peaks
+            for (i, image), cc_max, peak, shift in zip(
+                    group, cc_maxes, peaks, shifts):
+                if np.isnan(cc_max):
+                    print('Problematic trace, no cross correlation possible')
+                    continue
+                correlations[i].append(
+                    (tr.stats.network, tr.stats.station, tr.stats.channel,
+                     cc_max, peak, image.stats.starttime + shift))
+    temp_catalog = Catalog()
+    temp_catalog.events = [_make_event(
+        correlations=correlations[i], min_cc=min_cc,
+        detection_id=detections[i].id,
+        pre_lag_ccsum=detections[i].detect_val,
+        detect_chans=detections[i].no_chans,
+        horizontal_chans=horizontal_chans, vertical_chans=vertical_chans,
+        debug=debug) for i in range(len(detection_streams))]
+    return temp_catalog
+
+
+def _has_correlations(detection, shift_len):
+    """
+    Check whether a detection has retained correlations for a shift length.
+
+    :type detection: eqcorrscan.core.match_filter.Detection
+    :param detection: Detection to check.
+    :type shift_len: float
+    :param shift_len: Shift length in seconds allowed for picking.
+
+    :rtype: bool
+    """
+    correlations = getattr(detection, 'correlations', None)
+    if not correlations:
+        return False
+    for tr in correlations:
+        shift = int(round(shift_len * tr.stats.sampling_rate))
+        if 2 * shift + 1 > tr.stats.npts:
+            return False
+    return True
+
+
+def _correlation_loop(detections, shift_len, min_cc, horizontal_chans,
+                      vertical_chans, interpolate, debug=0):
+    """
+    Make picks from the correlations retained at detection.
+
+    Rather than correlating the data again, picks are made from the
+    correlation functions kept in `Detection.correlations`, see
+    :meth:`eqcorrscan.core.match_filter.Tribe.detect`.
+
+    :type detections: list
+    :param detections:
+        List of :class:`eqcorrscan.core.match_filter.Detection` with
+        correlations covering shift_len, see :func:`_has_correlations`.
+    :type shift_len: float
+    :param shift_len: Shift length in seconds allowed for picking.
+    :type min_cc: float
+    :param min_cc: Minimum cross-correlation value to be allowed for a pick.
+    :type horizontal_chans: list
+    :param horizontal_chans:
+        List of channel endings for horizontal-channels, on which S-picks will
+        be made.
+    :type vertical_chans: list
+    :param vertical_chans:
+        List of channel endings for vertical-channels, on which P-picks will
+        be made.
+    :type interpolate: bool
+    :param interpolate:
+        Interpolate the correlation function to achieve sub-sample precision.
+    :type debug: int
+    :param debug: debug output level 0-5.
+
+    :returns:
+        Catalog object containing Event objects for each detection.
+    :rtype: :class:`obspy.core.event.Catalog`
+    """
+    # Group correlation functions by length and sample interval to stack
+    groups = {}
+    for i, detection in enumerate(detections):
+        for j, tr in enumerate(detection.correlations):
+            shift = int(round(shift_len * tr.stats.sampling_rate))
+            groups.setdefault((2 * shift + 1, tr.stats.delta), []).append(
+                (i, j, tr, (tr.stats.npts - 1) // 2 - shift))
+    picks = [{} for _ in detections]
+    for (n_samples, delta), group in groups.items():
+        cccs = np.array([tr.data[start:start + n_samples]
+                         for _, _, tr, start in group])
+        peaks = cccs.max(axis=1)
+        if interpolate:
+            shifts, cc_maxes, unstable = _xcorr_interp_array(
+                cccs=cccs, dt=delta)
+            for _ in range(unstable.sum()):
+                print('Could not interpolate ccc, not smooth')
+        else:
+            shifts, cc_maxes = cccs.argmax(axis=1) * delta, peaks
+        for (i, j, tr, start), cc_max, peak, shift in zip(
+                group, cc_maxes, peaks, shifts):
+            if np.isnan(cc_max):
+                print('Problematic trace, no cross correlation possible')
+                continue
+            picks[i].update({j: (
+                tr.stats.network, tr.stats.station, tr.stats.channel, cc_max,
+                peak, tr.stats.starttime + (start * delta) + shift)})
+    temp_catalog = Catalog()
+    temp_catalog.events = [_make_event(
+        correlations=[detection_picks[j] for j in sorted(detection_picks)],
+        min_cc=min_cc, detection_id=detection.id,
+        pre_lag_ccsum=detection.detect_val, detect_chans=detection.no_chans,
+        horizontal_chans=horizontal_chans, vertical_chans=vertical_chans,
+        debug=debug) for detection, detection_picks in zip(detections, picks)]
+    return temp_catalog
 
 
 def _day_loop(detection_streams, template, min_cc, detections,
               horizontal_chans, vertical_chans, interpolate, cores, parallel,
-              debug=0):
+              debug=0, pool=None, batch=True):
     """
     Function to loop through multiple detections for one template.
 
@@ -289,6 +588,15 @@ def _day_loop(detection_streams, template, min_cc, detections,
         Interpolate the correlation function to achieve sub-sample precision.
     :type debug: int
     :param debug: debug output level 0-5.
+    :type pool: :class:`eqcorrscan.utils.worker_pool.WorkerPool`
+    :param pool:
+        Persistent worker pool to run in, if given `parallel` and `cores` are
+        ignored.
+    :type batch: bool
+    :param batch:
+        Correlate all detections for each template channel at once, see
+        :func:`_template_loop`. If True, `parallel`, `cores` and `pool` are
+        ignored.
 
     :returns:
         Catalog object containing Event objects for each detection created by
@@ -297,33 +605,40 @@ def _day_loop(detection_streams, template, min_cc, detections,
     """
     if len(detection_streams) == 0:
         return Catalog()
+    if batch:
+        return _template_loop(
+            detection_streams=detection_streams, template=template,
+            min_cc=min_cc, detections=detections,
+            horizontal_chans=horizontal_chans, vertical_chans=vertical_chans,
+            interpolate=interpolate, debug=debug)
     if not cores:
         num_cores = cpu_count()
     else:
         num_cores = cores
     if num_cores > len(detection_streams):
         num_cores = len(detection_streams)
-    if parallel:
-        pool = Pool(processes=num_cores)
-        debug_print('Made pool of %i workers' % num_cores, 4, debug)
-        # Parallel generation of events for each detection:
-        # results will be a list of (i, event class)
-        results = [pool.apply_async(
-            _channel_loop, (detection_streams[i], ),
-            {'template': template, 'min_cc': min_cc,
-             'detection_id': detections[i].id, 'interpolate': interpolate,
-             'i': i, 'pre_lag_ccsum': detections[i].detect_val,
-             'detect_chans': detections[i].no_chans,
-             'horizontal_chans': horizontal_chans,
-             'vertical_chans': vertical_chans})
-                   for i in range(len(detection_streams))]
-        pool.close()
-        try:
-            events_list = [p.get() for p in results]
-        except KeyboardInterrupt as e:  # pragma: no cover
-            pool.terminate()
-            raise e
-        pool.join()
+    if parallel or pool is not None:
+        with pool_context(pool, processes=num_cores) as worker_pool:
+            debug_print('Using pool of %i workers' % worker_pool.processes,
+                        4, debug)
+            # The template is shared once for all detections
+            shared_template = worker_pool.share(template)
+            try:
+                # Parallel generation of events for each detection:
+                # results will be a list of (i, event class)
+                results = [worker_pool.apply_async(
+                    _channel_loop, (detection_streams[i], ),
+                    {'template': shared_template, 'min_cc': min_cc,
+                     'detection_id': detections[i].id,
+                     'interpolate': interpolate, 'i': i,
+                     'pre_lag_ccsum': detections[i].detect_val,
+                     'detect_chans': detections[i].no_chans,
+                     'horizontal_chans': horizontal_chans,
+                     'vertical_chans': vertical_chans})
+                           for i in range(len(detection_streams))]
+                events_list = [p.get() for p in results]
+            finally:
+                worker_pool.release(shared_template)
         events_list.sort(key=lambda tup: tup[0])  # Sort based on index.
     else:
         events_list = []
@@ -341,11 +656,120 @@ def _day_loop(detection_streams, template, min_cc, detections,
     return temp_catalog
 
 
+def _unit_loop(units, detect_data, shift_len, min_cc, horizontal_chans,
+               vertical_chans, interpolate, cores, parallel, debug=0,
+               pool=None, batch=True, max_windows=None, plot=False):
+    """
+    Compute picks for units of work with a limited number of windows in use.
+
+    Units of detections, of any template, are distributed to a pool of
+    workers as they are free. Data for a unit are only cut and sent to a
+    worker when fewer than `max_windows` detection windows are held by
+    workers, and results are returned as each unit completes.
+
+    :type units: list
+    :param units:
+        List of tuples of (template, delays, detections), where template is
+        a tuple of (template_name, template) and delays is a dictionary of
+        delays keyed by sta.channel.
+    :type detect_data: obspy.core.stream.Stream
+    :param detect_data: Stream to extract detection streams from.
+    :type shift_len: float
+    :param shift_len: Shift length in seconds allowed for picking.
+    :type min_cc: float
+    :param min_cc: Minimum cross-correlation value to be allowed for a pick.
+    :type horizontal_chans: list
+    :param horizontal_chans:
+        List of channel endings for horizontal-channels, on which S-picks will
+        be made.
+    :type vertical_chans: list
+    :param vertical_chans:
+        List of channel endings for vertical-channels, on which P-picks will
+        be made.
+    :type interpolate: bool
+    :param interpolate:
+        Interpolate the correlation function to achieve sub-sample precision.
+    :type cores: int
+    :param cores: Number of workers to use, if False uses all available.
+    :type parallel: bool
+    :param parallel: Whether to run units in parallel or not.
+    :type debug: int
+    :param debug: debug output level 0-5.
+    :type pool: :class:`eqcorrscan.utils.worker_pool.WorkerPool`
+    :param pool:
+        Persistent worker pool to run in, if given `parallel` and `cores` are
+        ignored.
+    :type batch: bool
+    :param batch:
+        Whether to correlate detections of a unit in batches, see
+        :func:`_day_loop`. If False, units are run one at a time using
+        the parallel options of :func:`_day_loop`.
+    :type max_windows: int
+    :param max_windows:
+        Maximum number of detection windows to send to workers at once,
+        defaults to two units for each worker. A unit larger than this is
+        still run, but on its own.
+    :type plot: bool
+    :param plot: Whether to plot the data extracted or not.
+
+    :returns:
+        Generator of tuples of (template, detection streams, Catalog) for
+        each unit as it completes.
+    """
+    def _prepare(template, delays, detections):
+        detect_streams = _prepare_data(
+            detect_data=detect_data, detections=detections,
+            template=template, delays=delays, shift_len=shift_len,
+            plot=plot)
+        return [detect_stream[1] for detect_stream in detect_streams]
+
+    kwargs = {'min_cc': min_cc, 'horizontal_chans': horizontal_chans,
+              'vertical_chans': vertical_chans, 'interpolate': interpolate,
+              'debug': debug}
+    num_cores = min(cores or cpu_count(), len(units))
+    if not batch or (pool is None and (not parallel or num_cores < 2)):
+        for template, delays, detections in units:
+            detect_streams = _prepare(template, delays, detections)
+            yield template, detect_streams, _day_loop(
+                detection_streams=detect_streams, template=template[1],
+                detections=detections, cores=cores, parallel=parallel,
+                pool=pool, batch=batch, **kwargs)
+        return
+    with pool_context(pool, processes=num_cores) as worker_pool:
+        if max_windows is None:
+            max_windows = 2 * worker_pool.processes * max(
+                len(detections) for _, _, detections in units)
+        debug_print('Using pool of %i workers for %i units' % (
+            worker_pool.processes, len(units)), 2, debug)
+        pending = deque()
+        n_windows = 0
+        for template, delays, detections in units:
+            detect_streams = _prepare(template, delays, detections)
+            # Wait for earlier units to free their windows
+            while pending and n_windows + len(detect_streams) > max_windows:
+                _template, _detect_streams, result = pending.popleft()
+                n_windows -= len(_detect_streams)
+                yield _template, _detect_streams, result.get()
+            if len(detect_streams) == 0:
+                yield template, detect_streams, Catalog()
+                continue
+            pending.append((template, detect_streams, worker_pool.apply_async(
+                _template_loop, (detect_streams, template[1]),
+                dict(detections=detections, **kwargs))))
+            n_windows += len(detect_streams)
+        while pending:
+            template, detect_streams, result = pending.popleft()
+            yield template, detect_streams, result.get()
+
+
 def _prepare_data(detect_data, detections, template, delays,
                   shift_len, plot):
     """
     Prepare data for lag_calc - reduce memory here.
 
+    Windows for all detections are cut from each trace of detect_data at
+    once, and the data of the returned traces are views of detect_data.
+
     :type detect_data: obspy.core.stream.Stream
     :param detect_data: Stream to extract detection streams from.
     :type detections: list
@@ -366,60 +790,70 @@ def _prepare_data(detect_data, detections, template, delays,
     :returns: List of detect_streams to be worked on
     :rtype: list
     """
-    detect_streams = []
-    for detection in detections:
-        if detection.template_name != template[0]:
+    from eqcorrscan.core.match_filter import _window_offsets, _window_trace
+
+    detections = [detection for detection in detections
+                  if detection.template_name == template[0]]
+    if len(detections) == 0:
+        return []
+    # Index template trace lengths in seconds by channel
+    template_lengths = {}
+    for tr in template[1]:
+        template_lengths.setdefault(
+            (tr.stats.station, tr.stats.channel),
+            len(tr) / tr.stats.sampling_rate)
+    # Cut windows for all detections from each trace as views of its data
+    windows = [[] for _ in detections]
+    max_delay = 0
+    for tr in detect_data:
+        template_len = template_lengths.get(
+            (tr.stats.station, tr.stats.channel))
+        if template_len is None:
             continue
-        # Stream to be saved for new detection
+        delay = delays[tr.stats.station + '.' + tr.stats.channel]
+        max_delay = max(max_delay, delay)
+        starts, n_samples = _window_offsets(
+            tr, [detection.detect_time + delay for detection in detections],
+            pad=shift_len, length=(2 * shift_len) + template_len)
+        for window, start, n in zip(windows, starts, n_samples):
+            start, end = max(start, 0), min(start + n, tr.stats.npts)
+            window.append(_window_trace(tr, start, tr.data[start:max(
+                start, end)]))
+    detect_streams = []
+    for detection, window in zip(detections, windows):
+        # Check for duplicate traces before filtering the windows, windows
+        # either side of a gap in the data do not overlap
+        cut = {}
+        for tr in window:
+            if len(tr.data) > 0:
+                cut.setdefault((tr.stats.station, tr.stats.channel),
+                               []).append(tr)
+        for key, traces in cut.items():
+            traces.sort(key=lambda tr: tr.stats.starttime)
+            for previous, tr in zip(traces[:-1], traces[1:]):
+                if tr.stats.starttime <= previous.stats.endtime:
+                    msg = ('Multiple channels for %s.%s, likely a data issue'
+                           % (key[0], key[1]))
+                    raise LagCalcError(msg)
         detect_stream = []
-        max_delay = 0
-        for tr in detect_data:
-            template_tr = template[1].select(
-                station=tr.stats.station, channel=tr.stats.channel)
-            if len(template_tr) >= 1:
-                # Save template trace length in seconds
-                template_len = (
-                    len(template_tr[0]) / template_tr[0].stats.sampling_rate)
-            else:
-                continue
-                # If there is no template-data match then skip the rest
-                # of the trace loop.
-            # Grab the delays for the desired template: [(sta, chan, delay)]
-            # Now grab the delay for the desired trace for this template
-            delay = delays[tr.stats.station + '.' + tr.stats.channel]
-            if delay > max_delay:
-                max_delay = delay
-            detect_stream.append(tr.slice(
-                starttime=detection.detect_time - shift_len + delay,
-                endtime=detection.detect_time + delay + shift_len +
-                template_len).copy())
-        for tr in detect_stream:
+        for tr in window:
             if len(tr.data) == 0:
                 msg = ('No data in %s.%s for detection at time %s' %
                        (tr.stats.station, tr.stats.channel,
                         detection.detect_time))
                 warnings.warn(msg)
-                detect_stream.remove(tr)
             elif tr.stats.endtime - tr.stats.starttime < (
-                        2 * shift_len) + template_len:
+                        2 * shift_len) + template_lengths[
+                        (tr.stats.station, tr.stats.channel)]:
                 msg = ("Insufficient data for %s.%s will not use."
                        % (tr.stats.station, tr.stats.channel))
                 warnings.warn(msg)
-                detect_stream.remove(tr)
             elif np.ma.is_masked(tr.data):
                 msg = ("Masked data found for %s.%s, will not use."
                        % (tr.stats.station, tr.stats.channel))
                 warnings.warn(msg)
-                detect_stream.remove(tr)
-        # Check for duplicate traces
-        stachans = [(tr.stats.station, tr.stats.channel)
-                    for tr in detect_stream]
-        c_stachans = Counter(stachans)
-        for key in c_stachans.keys():
-            if c_stachans[key] > 1:
-                msg = ('Multiple channels for %s.%s, likely a data issue'
-                       % (key[0], key[1]))
-                raise LagCalcError(msg)
+            else:
+                detect_stream.append(tr)
         if plot:
             background = detect_data.slice(
                 starttime=detection.detect_time - (shift_len + 5),
@@ -433,8 +867,6 @@ def _prepare_data(detect_data, detections, template, delays,
                 times=[detection.detect_time - shift_len],
                 title='Detection Extracted')
         if not len(detect_stream) == 0:
-            detect_stream = Stream(detect_stream).split()
-            # Make sure there are no masks left over.
             # Create tuple of (template name, data stream)
             detect_streams.append((detection.template_name,
                                    Stream(detect_stream)))
@@ -444,7 +876,8 @@ def _prepare_data(detect_data, detections, template, delays,
 def lag_calc(detections, detect_data, template_names, templates,
              shift_len=0.2, min_cc=0.4, horizontal_chans=['E', 'N', '1', '2'],
              vertical_chans=['Z'], cores=1, interpolate=False,
-             plot=False, parallel=True, debug=0):
+             plot=False, parallel=True, debug=0, pool=None, batch=True,
+             unit_size=100, max_windows=None):
     """
     Main lag-calculation function for detections of specific events.
 
@@ -496,7 +929,25 @@ def lag_calc(detections, detect_data, template_names, templates,
     :param parallel: Turn parallel processing on or off.
     :type debug: int
     :param debug: Debug output level, 0-5 with 5 being the most output.
-
+    :type pool: :class:`eqcorrscan.utils.worker_pool.WorkerPool`
+    :param pool:
+        Persistent worker pool to compute picks in, if given `parallel` and
+        `cores` are ignored.
+    :type batch: bool
+    :param batch:
+        Correlate the data for a batch of detections of a template channel
+        in one call rather than one detection at a time. This is much faster
+        for many detections. Batches of `unit_size` detections, from all
+        templates, are run in parallel if `parallel` is True and more than
+        one core is used, or a pool is given.
+    :type unit_size: int
+    :param unit_size:
+        Number of detections of a template to correlate in each batch.
+    :type max_windows: int
+    :param max_windows:
+        Maximum number of detection windows to have in workers at once,
+        limiting memory use for large numbers of detections. Defaults to two
+        batches for each worker.
 
     :returns:
         Catalog of events with picks.  No origin information is included.
@@ -580,8 +1031,8 @@ def lag_calc(detections, detect_data, template_names, templates,
                  _template.sort(['starttime'])[0].stats.starttime})
         delays.append((template[0], temp_delays))
         del _template
-    # Segregate detections by template, then feed to day_loop
-    initial_cat = Catalog()
+    # Segregate detections by template, then split into units of work
+    units = []
     for template in zipped_templates:
         print('Running lag-calc for template %s' % template[0])
         template_detections = [detection for detection in detections
@@ -592,7 +1043,7 @@ def lag_calc(detections, detect_data, template_names, templates,
         # gered earlier, then adjust the detection by that delay/earliness.
         delaylist = list(t_delays.items())
         delaylist.sort(key=lambda tup: tup[1])
-        for detection in template_detections:
+        for i, detection in enumerate(template_detections):
             # Find the channel with smallest delay on which the detection
             # triggered. Use that delay to reduce the detection-time.
             detection_stachans = list()
@@ -605,54 +1056,61 @@ def lag_calc(detections, detect_data, template_names, templates,
                 if delay_stachan in detection_stachans:
                     earlier = delay[1]
                     break
-            detection.detect_time = detection.detect_time - earlier
             if earlier > 0:
+                # Adjust a shallow copy to leave the input detection intact
+                detection = copy.copy(detection)
+                detection.detect_time = detection.detect_time - earlier
+                template_detections[i] = detection
                 print('Adjusting ' + detection.id + ' by ' + str(earlier))
         debug_print(
             'There are %i detections' % len(template_detections), 2, debug)
-        detect_streams = _prepare_data(
-            detect_data=detect_data, detections=template_detections,
-            template=template, delays=t_delays, shift_len=shift_len,
-            plot=prep_plot)
-        detect_streams = [detect_stream[1] for detect_stream in detect_streams]
-        if len(template_detections) > 0:
-            template_cat = _day_loop(
-                detection_streams=detect_streams, template=template[1],
-                min_cc=min_cc, detections=template_detections,
-                horizontal_chans=horizontal_chans,
-                vertical_chans=vertical_chans, interpolate=interpolate,
-                cores=cores, parallel=parallel, debug=debug)
-            initial_cat += template_cat
-            if plot:
-                for i, event in enumerate(template_cat):
-                    if len(event.picks) == 0:
-                        continue
-                    plot_stream = detect_streams[i].copy()
-                    template_plot = template[1].copy()
-                    pick_stachans = [(pick.waveform_id.station_code,
-                                      pick.waveform_id.channel_code)
-                                     for pick in event.picks]
-                    for tr in plot_stream:
-                        if (tr.stats.station, tr.stats.channel) \
-                                not in pick_stachans:
-                            plot_stream.remove(tr)
-                    for tr in template_plot:
-                        if (tr.stats.station, tr.stats.channel) \
-                                not in pick_stachans:
-                            template_plot.remove(tr)
-                    plot_repicked(template=template_plot, picks=event.picks,
-                                  det_stream=plot_stream)
+        # Split detections into units of work, batches of detections are
+        # split so that they can be balanced across workers.
+        step = unit_size if batch else max(len(template_detections), 1)
+        for i in range(0, len(template_detections), step):
+            units.append(
+                (template, t_delays, template_detections[i:i + step]))
+    initial_cat = Catalog()
+    for template, detect_streams, template_cat in _unit_loop(
+            units=units, detect_data=detect_data, shift_len=shift_len,
+            min_cc=min_cc, horizontal_chans=horizontal_chans,
+            vertical_chans=vertical_chans, interpolate=interpolate,
+            cores=cores, parallel=parallel, debug=debug, pool=pool,
+            batch=batch, max_windows=max_windows, plot=prep_plot):
+        initial_cat += template_cat
+        if plot:
+            for i, event in enumerate(template_cat):
+                if len(event.picks) == 0:
+                    continue
+                plot_stream = detect_streams[i].copy()
+                template_plot = template[1].copy()
+                pick_stachans = [(pick.waveform_id.station_code,
+                                  pick.waveform_id.channel_code)
+                                 for pick in event.picks]
+                for tr in plot_stream:
+                    if (tr.stats.station, tr.stats.channel) \
+                            not in pick_stachans:
+                        plot_stream.remove(tr)
+                for tr in template_plot:
+                    if (tr.stats.station, tr.stats.channel) \
+                            not in pick_stachans:
+                        template_plot.remove(tr)
+                plot_repicked(template=template_plot, picks=event.picks,
+                              det_stream=plot_stream)
     # Order the catalogue to match the input
+    events = {}
+    for event in initial_cat:
+        if str(event.resource_id) in events:
+            raise NotImplementedError('Multiple events with same id,'
+                                      ' should not happen')
+        events[str(event.resource_id)] = event
     output_cat = Catalog()
     for det in detections:
-        event = [e for e in initial_cat if str(e.resource_id) == str(det.id)]
-        if len(event) == 1:
-            output_cat.append(event[0])
-        elif len(event) == 0:
-            print('No picks made for detection: \n%s' % det.__str__())
+        event = events.get(str(det.id))
+        if event is not None:
+            output_cat.append(event)
         else:
-            raise NotImplementedError('Multiple events with same id,'
-                                      ' should not happen')
+            print('No picks made for detection: \n%s' % det.__str__())
     return output_cat
 
 
@@ -23,32 +23,51 @@ import contextlib
 import copy
 import getpass
 import glob
+import gzip
+import hashlib
+import io
 import os
 import re
 import shutil
 import tarfile
 import tempfile
+import threading
 import time
 import warnings
-from collections import Counter
+import weakref
+from collections import Counter, OrderedDict
+from functools import partial
+from multiprocessing.pool import ThreadPool
 from os.path import join
 
+try:
+    from queue import Queue, Full
+except ImportError:  # pragma: no cover
+    from Queue import Queue, Full
+
 import numpy as np
 from obspy import Trace, Catalog, UTCDateTime, Stream, read, read_events
 from obspy.core.event import (
-    Comment, WaveformStreamID, Event, Pick, CreationInfo, ResourceIdentifier)
+    Comment, WaveformStreamID, Event, Pick, CreationInfo, ResourceIdentifier,
+    Origin, Magnitude)
 
 from eqcorrscan.core import template_gen
-from eqcorrscan.core.lag_calc import lag_calc
+from eqcorrscan.core.lag_calc import (
+    lag_calc, _has_correlations, _correlation_loop)
 from eqcorrscan.utils.catalog_utils import _get_origin
-from eqcorrscan.utils.correlate import get_array_xcorr, get_stream_xcorr
+from eqcorrscan.utils.correlate import (
+    get_array_xcorr, get_stream_xcorr, multi_image_normxcorr)
 from eqcorrscan.utils.debug_log import debug_print
 from eqcorrscan.utils.findpeaks import decluster, multi_find_peaks
 from eqcorrscan.utils.plotting import cumulative_detections
 from eqcorrscan.utils.pre_processing import dayproc, shortproc, _check_daylong
 
-CAT_EXT_MAP = {"QUAKEML": "xml", "SC3ML": "xml"}  # , "NORDIC": "out"}
+CAT_EXT_MAP = {"QUAKEML": "xml", "SC3ML": "xml", "NPZ": "npz"}
+# , "NORDIC": "out"}
+DET_FORMATS = ["csv", "npz"]
 # TODO: add in nordic support once bugs fixed upstream - 1.2.0 Obspy PR #2195
+# Integer nanoseconds used for missing times in npz files
+NO_TIME = np.iinfo(np.int64).min
 
 
 @contextlib.contextmanager
@@ -649,7 +668,7 @@ class Party(object):
         return copy.deepcopy(self)
 
     def write(self, filename, format='tar', write_detection_catalog=True,
-              catalog_format="QUAKEML", debug=0):
+              catalog_format="QUAKEML", detection_format="csv", debug=0):
         """
         Write Family out, select output format.
 
@@ -669,9 +688,18 @@ class Party(object):
         :type catalog_format: str
         :param catalog_format:
             What format to write the detection-catalog with. Only Nordic,
-            SC3ML, QUAKEML are supported. Note that not all information is
-            written for all formats (QUAKEML is the most complete, but is
-            slow for IO).
+            SC3ML and QUAKEML are supported. Note that not all
+            information is written for all formats (QUAKEML is the most
+            complete, but is slow for IO). NPZ is a binary, columnar format
+            that is fast to read and write, but only keeps comments, origin
+            times and locations, magnitudes and pick times, channels, phase
+            hints, onsets, polarities and evaluation modes.
+        :type detection_format: str
+        :param detection_format:
+            Format to write the per-family detection files with when writing
+            to 'tar' format. Either 'csv' (human-readable text) or 'npz'
+            (binary, typed columns stored with :func:`numpy.savez`), which is
+            much faster to read for large Parties.
 
         .. NOTE::
             csv format will write out detection objects, all other
@@ -702,6 +730,8 @@ class Party(object):
         """
         if catalog_format not in CAT_EXT_MAP.keys():
             raise TypeError("{0} is not supported".format(catalog_format))
+        if detection_format not in DET_FORMATS:
+            raise TypeError("{0} is not supported".format(detection_format))
         if format.lower() == 'csv':
             if os.path.isfile(filename):
                 raise MatchFilterError(
@@ -723,15 +753,20 @@ class Party(object):
                     for family in self.families:
                         all_cat += family.catalog
                     if not len(all_cat) == 0:
-                        all_cat.write(
-                            join(temp_dir, 'catalog{0}'.format(
+                        _write_catalog(
+                            all_cat, join(temp_dir, 'catalog.{0}'.format(
                                 CAT_EXT_MAP[catalog_format])),
                             format=catalog_format)
                 for i, family in enumerate(self.families):
                     debug_print('Writing family %i' % i, 0, debug)
-                    name = family.template.name + '_detections.csv'
+                    name = family.template.name + '_detections.' + \
+                        detection_format
                     name_to_write = join(temp_dir, name)
-                    _write_family(family=family, filename=name_to_write)
+                    if detection_format == 'npz':
+                        _write_family_npz(
+                            family=family, filename=name_to_write)
+                    else:
+                        _write_family(family=family, filename=name_to_write)
                 with tarfile.open(filename + '.tgz', "w:gz") as tar:
                     tar.add(temp_dir, arcname=os.path.basename(filename))
         else:
@@ -740,7 +775,8 @@ class Party(object):
             self.get_catalog().write(filename=filename, format=format)
         return self
 
-    def read(self, filename=None, read_detection_catalog=True):
+    def read(self, filename=None, read_detection_catalog=True,
+             template_names=None, starttime=None, endtime=None, lazy=False):
         """
         Read a Party from a file.
 
@@ -752,6 +788,21 @@ class Party(object):
         :param read_detection_catalog:
             Whether to read the detection catalog or not, if False, catalog
             will be regenerated - for large catalogs this can be faster.
+        :type template_names: list
+        :param template_names:
+            Names of the families to read, if given only the template
+            waveforms and detection files for these families will be
+            extracted from the archive.  Defaults to reading all families.
+        :type starttime: `obspy.core.utcdatetime.UTCDateTime`
+        :param starttime: Only read detections made at or after this time.
+        :type endtime: `obspy.core.utcdatetime.UTCDateTime`
+        :param endtime: Only read detections made at or before this time.
+        :type lazy: bool
+        :param lazy:
+            Whether to only read the detection columns of families written
+            with `detection_format='npz'`, and build their Detections when
+            `family.detections` is first accessed. Families written as csv
+            are always read in full.
 
         .. rubric:: Example
 
@@ -760,6 +811,7 @@ class Party(object):
         """
         tribe = Tribe()
         families = []
+        read_families = {}
         if filename is None:
             # If there is no filename given, then read the example.
             filename = os.path.join(os.path.dirname(__file__),
@@ -776,35 +828,58 @@ class Party(object):
         for _filename in filenames:
             with tarfile.open(_filename, "r:*") as arc:
                 temp_dir = tempfile.mkdtemp()
-                arc.extractall(path=temp_dir, members=_safemembers(arc))
+                members = _safemembers(arc)
+                if template_names is not None:
+                    members = _party_members(members, template_names)
+                arc.extractall(path=temp_dir, members=members)
             # Read in the detections first, this way, if we read from multiple
             # files then we can just read in extra templates as needed.
             # Read in families here!
             party_dir = glob.glob(temp_dir + os.sep + '*')[0]
-            tribe._read_from_folder(dirname=party_dir)
+            tribe._read_from_folder(
+                dirname=party_dir, template_names=template_names)
             det_cat_file = glob.glob(os.path.join(party_dir, "catalog.*"))
+            all_cat = Catalog()
             if len(det_cat_file) != 0 and read_detection_catalog:
                 try:
-                    all_cat = read_events(det_cat_file[0])
+                    all_cat = _read_catalog(det_cat_file[0])
                 except TypeError as e:
                     print(e)
                     pass
-            else:
-                all_cat = Catalog()
-            for family_file in glob.glob(join(party_dir, '*_detections.csv')):
-                template = [
-                    t for t in tribe if _templates_match(t, family_file)]
-                family = Family(template=template[0] or Template())
-                new_family = True
-                if family.template.name in [f.template.name for f in families]:
-                    family = [
-                        f for f in families if
-                        f.template.name == family.template.name][0]
-                    new_family = False
-                family.detections = _read_family(
-                    fname=family_file, all_cat=all_cat, template=template[0])
-                if new_family:
+            # Index events once, rather than scanning the catalog for every
+            # detection.
+            events = _index_events(all_cat)
+            templates = {t.name: t for t in tribe}
+            family_files = []
+            for detection_format in DET_FORMATS:
+                family_files.extend(glob.glob(join(
+                    party_dir, '*_detections.' + detection_format)))
+            for family_file in family_files:
+                template = templates[_family_template_name(family_file)]
+                if template.name in read_families:
+                    family = read_families[template.name]
+                else:
+                    family = Family(template=template)
+                    read_families.update({template.name: family})
                     families.append(family)
+                family.__dict__.pop('_columns', None)
+                if family_file.endswith('.npz') and lazy:
+                    family.__dict__.pop('detections', None)
+                    family._columns = {
+                        'columns': _read_family_columns(
+                            fname=family_file, starttime=starttime,
+                            endtime=endtime),
+                        'all_cat': events, 'template': template}
+                elif family_file.endswith('.npz'):
+                    family.detections = _read_family_npz(
+                        fname=family_file, all_cat=events,
+                        template=template, starttime=starttime,
+                        endtime=endtime)
+                else:
+                    family.detections = _read_family(
+                        fname=family_file, all_cat=events,
+                        template=template, starttime=starttime,
+                        endtime=endtime)
             shutil.rmtree(temp_dir)
         self.families = families
         return self
@@ -812,13 +887,16 @@ class Party(object):
     def lag_calc(self, stream, pre_processed, shift_len=0.2, min_cc=0.4,
                  horizontal_chans=['E', 'N', '1', '2'], vertical_chans=['Z'],
                  cores=1, interpolate=False, plot=False, parallel=True,
-                 overlap='calculate', process_cores=None, debug=0):
+                 overlap='calculate', process_cores=None, debug=0,
+                 process_cache=None, unit_size=100, max_windows=None):
         """
         Compute picks based on cross-correlation alignment.
 
         :type stream: obspy.core.stream.Stream
         :param stream:
-            All the data needed to cut from - can be a gappy Stream.
+            All the data needed to cut from - can be a gappy Stream. Can be
+            None if all detections have correlations retained, see note
+            below.
         :type pre_processed: bool
         :param pre_processed:
             Whether the stream has been pre-processed or not to match the
@@ -864,6 +942,23 @@ class Party(object):
             `cores`).
         :type debug: int
         :param debug: Debug output level, 0-5 with 5 being the most output.
+        :type process_cache:
+            :class:`eqcorrscan.utils.pre_processing.ProcessedDataCache`
+        :param process_cache:
+            Cache of processed data to re-use processed channels from, and
+            store newly processed channels in. If given, data are processed
+            in chunks as in :meth:`eqcorrscan.core.match_filter.Tribe.detect`
+            so that chunks processed for detection, with the same `overlap`,
+            are re-used.
+        :type unit_size: int
+        :param unit_size:
+            Number of detections of a template to pick in each unit of
+            work, units from all templates are balanced across `cores`
+            workers if `parallel=True`.
+        :type max_windows: int
+        :param max_windows:
+            Maximum number of detection windows to have in workers at once,
+            see :func:`eqcorrscan.core.lag_calc.lag_calc`.
 
         :returns:
             Catalog of events with picks.  No origin information is included.
@@ -888,87 +983,125 @@ class Party(object):
 
         .. Note::
             Picks are corrected for the template pre-pick time.
+
+        .. Note::
+            If detections were made with `retain_correlations` set to at
+            least `shift_len` (see
+            :meth:`eqcorrscan.core.match_filter.Tribe.detect`), picks are made
+            from the correlations retained at detection, and the data are
+            not processed or correlated again for those detections.
         """
         catalog = Catalog()
-        template_groups = [[]]
-        detection_groups = [[]]
-        for master in self.families:
-            master_chans = [(tr.stats.station,
-                             tr.stats.channel) for tr in master.template.st]
-            if len(master_chans) > len(set(master_chans)):
-                warnings.warn(master.template.name +
+        # Group families by processing so that data are processed once for
+        # each set of processing parameters.
+        family_groups = []
+        for family in self.families:
+            chans = [(tr.stats.station, tr.stats.channel)
+                     for tr in family.template.st]
+            if len(chans) > len(set(chans)):
+                warnings.warn(family.template.name +
                               ' has duplicate channels, will not use this '
                               'template for lag-calc as this is not coded')
                 continue
-            for group in template_groups:
-                if master.template in group:
+            for families in family_groups:
+                if families[0].template.same_processing(family.template):
+                    families.append(family)
                     break
             else:
-                new_group = [master.template.copy()]
-                new_det_group = copy.deepcopy(master.detections)
-                for slave in self.families:
-                    if master.template.same_processing(slave.template) and \
-                                    master.template != slave.template:
-                        slave_chans = [
-                            (tr.stats.station,
-                             tr.stats.channel) for tr in slave.template.st]
-                        if len(slave_chans) > len(set(slave_chans)):
-                            continue
-                        else:
-                            new_group.append(slave.template.copy())
-                            new_det_group.extend(
-                                copy.deepcopy(slave.detections))
-                template_groups.append(new_group)
-                detection_groups.append(new_det_group)
-        # template_groups will contain an empty first list
-        for group, det_group in zip(template_groups, detection_groups):
-            if len(group) == 0:
-                template_groups.remove(group)
-                detection_groups.remove(det_group)
+                family_groups.append([family])
         # Process the data for each group and time-chunk
-        for group, det_group in zip(template_groups, detection_groups):
-            lap = 0.0
-            for template in group:
-                starts = [t.stats.starttime for t in
-                          template.st.sort(['starttime'])]
-                if starts[-1] - starts[0] > lap:
-                    lap = starts[-1] - starts[0]
-            if overlap is None:
-                lap = 0.0
-            elif isinstance(overlap, float):
-                lap = overlap
-            if not pre_processed:
-                if process_cores is None:
-                    process_cores = cores
-                processed_streams = _group_process(
-                    template_group=group, cores=process_cores,
-                    parallel=parallel, stream=stream.copy(), debug=debug,
-                    daylong=False,  ignore_length=False, overlap=lap)
-                processed_stream = Stream()
-                for p in processed_streams:
-                    processed_stream += p
-                processed_stream.merge(method=1)
-                print(processed_stream)
-            else:
-                processed_stream = stream
-            temp_cat = lag_calc(
-                detections=det_group, detect_data=processed_stream,
-                template_names=[t.name for t in group],
-                templates=[t.st for t in group], shift_len=shift_len,
-                min_cc=min_cc, horizontal_chans=horizontal_chans,
-                vertical_chans=vertical_chans, cores=cores,
-                interpolate=interpolate, plot=plot, parallel=parallel,
-                debug=debug)
+        for families in family_groups:
+            group = [family.template for family in families]
+            det_group = [detection for family in families
+                         for detection in family.detections]
+            # Pick from correlations retained at detection where possible
+            retained = [d for d in det_group
+                        if _has_correlations(d, shift_len)]
+            temp_cat = Catalog([event for event in _correlation_loop(
+                detections=retained, shift_len=shift_len, min_cc=min_cc,
+                horizontal_chans=horizontal_chans,
+                vertical_chans=vertical_chans, interpolate=interpolate,
+                debug=debug) if len(event.picks) > 0])
+            det_ids = set(str(d.id) for d in retained)
+            det_group = [d for d in det_group if str(d.id) not in det_ids]
+            if len(det_group) > 0:
+                if stream is None:
+                    raise MatchFilterError(
+                        'Detections do not have correlations retained for '
+                        'shift_len=%s, a stream is required' % shift_len)
+                temp_cat += self._group_lag_calc(
+                    group=group, det_group=det_group, stream=stream,
+                    pre_processed=pre_processed, shift_len=shift_len,
+                    min_cc=min_cc, horizontal_chans=horizontal_chans,
+                    vertical_chans=vertical_chans, cores=cores,
+                    interpolate=interpolate, plot=plot, parallel=parallel,
+                    overlap=overlap, process_cores=process_cores,
+                    debug=debug, process_cache=process_cache,
+                    unit_size=unit_size, max_windows=max_windows)
+            det_group += retained
+            pre_picks = {t.name: t.prepick for t in group}
+            det_templates = {str(d.id): d.template_name for d in det_group}
             for event in temp_cat:
-                det = [d for d in det_group
-                       if str(d.id) == str(event.resource_id)][0]
-                pre_pick = [t for t in group
-                            if t.name == det.template_name][0].prepick
+                pre_pick = pre_picks[det_templates[str(event.resource_id)]]
                 for pick in event.picks:
                     pick.time += pre_pick
             catalog += temp_cat
         return catalog
 
+    @staticmethod
+    def _group_lag_calc(group, det_group, stream, pre_processed, shift_len,
+                        min_cc, horizontal_chans, vertical_chans, cores,
+                        interpolate, plot, parallel, overlap, process_cores,
+                        debug, process_cache, unit_size=100,
+                        max_windows=None):
+        """
+        Process data for and run lag-calc on one group of templates.
+
+        See :meth:`eqcorrscan.core.match_filter.Party.lag_calc` for
+        arguments.
+
+        :returns: Catalog of picked events, not corrected for pre-pick.
+        :rtype: obspy.core.event.Catalog
+        """
+        lap = 0.0
+        for template in group:
+            starts = [t.stats.starttime for t in template.st]
+            if max(starts) - min(starts) > lap:
+                lap = max(starts) - min(starts)
+        if overlap is None:
+            lap = 0.0
+        elif isinstance(overlap, float):
+            lap = overlap
+        if not pre_processed:
+            if process_cores is None:
+                process_cores = cores
+            # Process the data covered by all chunks in one pass, unless
+            # chunks processed by Tribe.detect can be re-used from the
+            # cache. The stream is copied when it is sliced for processing.
+            processed_streams = _group_process(
+                template_group=group, cores=process_cores,
+                parallel=parallel, stream=Stream(stream.traces), debug=debug,
+                daylong=False, ignore_length=False, overlap=lap,
+                process_once=process_cache is None,
+                process_cache=process_cache, dtype=np.float32,
+                chunk=False)
+            processed_stream = Stream()
+            for p in processed_streams:
+                processed_stream += p
+            if process_cache is not None:
+                processed_stream.merge(method=1)
+            debug_print(processed_stream, 3, debug)
+        else:
+            processed_stream = stream
+        return lag_calc(
+            detections=det_group, detect_data=processed_stream,
+            template_names=[t.name for t in group],
+            templates=[t.st for t in group], shift_len=shift_len,
+            min_cc=min_cc, horizontal_chans=horizontal_chans,
+            vertical_chans=vertical_chans, cores=cores,
+            interpolate=interpolate, plot=plot, parallel=parallel,
+            debug=debug, unit_size=unit_size, max_windows=max_windows)
+
     def get_catalog(self):
         """
         Get an obspy catalog object from the party.
@@ -1042,6 +1175,22 @@ class Family(object):
             warnings.warn("Setting catalog directly is no-longer supported, "
                           "now generated from detections.")
 
+    def __getattr__(self, name):
+        """
+        Build detections of lazily read families on access.
+
+        Only called when normal attribute look-up fails, which for
+        `detections` is only the case for families read with
+        `Party.read(lazy=True)`.
+        """
+        columns = self.__dict__.get('_columns')
+        if name == 'detections' and columns is not None:
+            self.detections = _npz_detections(**columns)
+            del self.__dict__['_columns']
+            return self.detections
+        raise AttributeError(
+            "'Family' object has no attribute '{0}'".format(name))
+
     @property
     def catalog(self):
         if len(self.__catalog) != len(self.detections):
@@ -1563,7 +1712,7 @@ class Template(object):
 
     def __init__(self, name=None, st=None, lowcut=None, highcut=None,
                  samp_rate=None, filt_order=None, process_length=None,
-                 prepick=None, event=None):
+                 prepick=None, event=None, resample_method='fft'):
         name_regex = re.compile(r"^[a-z_0-9]+$")
         if name is not None and not re.match(name_regex, name):
             raise ValueError("Invalid name: '%s' - Must satisfy the regex "
@@ -1585,6 +1734,7 @@ class Template(object):
         self.filt_order = filt_order
         self.process_length = process_length
         self.prepick = prepick
+        self.resample_method = resample_method
         if event is not None:
             if "eqcorrscan_template_" + temp_name not in \
                     [c.text for c in event.comments]:
@@ -1594,6 +1744,19 @@ class Template(object):
                                                author=getpass.getuser())))
         self.event = event
 
+    def __getattr__(self, name):
+        """
+        Load waveforms for lazily read templates on access.
+
+        Only called when normal attribute look-up fails, which for `st` is
+        only the case for templates read with `Tribe.read(lazy=True)`.
+        """
+        store = self.__dict__.get('_store')
+        if name == 'st' and store is not None:
+            return store.get(self.__dict__['name'])
+        raise AttributeError(
+            "'Template' object has no attribute '{0}'".format(name))
+
     def __repr__(self):
         """
         Print the template.
@@ -1678,7 +1841,10 @@ class Template(object):
         >>> template_a == template_b
         False
         """
-        for key in self.__dict__.keys():
+        keys = [key for key in self.__dict__.keys() if key != '_store']
+        if 'st' not in keys:
+            keys.append('st')
+        for key in keys:
             if key == 'st':
                 self_is_stream = isinstance(self.st, Stream)
                 other_is_stream = isinstance(other.st, Stream)
@@ -1766,9 +1932,14 @@ class Template(object):
         >>> template_b.lowcut = 5.0
         >>> template_a.same_processing(template_b)
         False
+        >>> template_b = template_a.copy()
+        >>> template_b.resample_method = 'polyphase'
+        >>> template_a.same_processing(template_b)
+        False
         """
         for key in self.__dict__.keys():
-            if key in ['name', 'st', 'prepick', 'event', 'template_info']:
+            if key in ['name', 'st', 'prepick', 'event', 'template_info',
+                       '_store']:
                 continue
             if not self.__dict__[key] == other.__dict__[key]:
                 return False
@@ -2089,6 +2260,7 @@ class Template(object):
         self.samp_rate = samp_rate
         self.process_length = process_length
         self.prepick = prepick
+        self.resample_method = kwargs.get('resample_method', 'fft')
         self.event = event
         return self
 
@@ -2310,7 +2482,8 @@ class Tribe(object):
         """
         return copy.deepcopy(self)
 
-    def write(self, filename, compress=True, catalog_format="QUAKEML"):
+    def write(self, filename, compress=True, catalog_format="QUAKEML",
+              cores=None, incremental=False):
         """
         Write the tribe to a file using tar archive formatting.
 
@@ -2324,36 +2497,110 @@ class Tribe(object):
         :type catalog_format: str
         :param catalog_format:
             What format to write the detection-catalog with. Only Nordic,
-            SC3ML, QUAKEML are supported. Note that not all information is
-            written for all formats (QUAKEML is the most complete, but is
-            slow for IO).
+            SC3ML and QUAKEML are supported. Note that not all
+            information is written for all formats (QUAKEML is the most
+            complete, but is slow for IO). NPZ is a binary, columnar format
+            that is fast to read and write, but only keeps comments, origin
+            times and locations, magnitudes and pick times, channels, phase
+            hints, onsets, polarities and evaluation modes.
+        :type cores: int
+        :param cores:
+            Number of threads to use to write template waveforms, defaults
+            to writing serially.
+        :type incremental: bool
+        :param incremental:
+            Whether to only write templates that have changed since the
+            tribe was last written to `filename`, or not. Changes are
+            tracked using checksums stored in a manifest file in the tribe
+            directory, templates that are not in the tribe are removed from
+            the directory, and the directory is kept after compressing.
+            Changed files are appended to the compressed archive rather than
+            re-compressing the whole directory.
 
         .. rubric:: Example
 
         >>> tribe = Tribe(templates=[Template(name='c', st=read())])
         >>> tribe.write('test_tribe')
         Tribe of 1 templates
+        >>> tribe.write('test_tribe_dir', compress=False, incremental=True)
+        Tribe of 1 templates
         """
         if catalog_format not in CAT_EXT_MAP.keys():
             raise TypeError("{0} is not supported".format(catalog_format))
         if not os.path.isdir(filename):
             os.makedirs(filename)
         self._par_write(filename)
-        tribe_cat = Catalog()
-        for t in self.templates:
-            if t.event is not None:
-                tribe_cat.append(t.event)
-        if len(tribe_cat) > 0:
-            tribe_cat.write(
-                os.path.join(filename, 'tribe_cat.{0}'.format(
-                    CAT_EXT_MAP[catalog_format])), format=catalog_format)
-        for template in self.templates:
-            template.st.write(filename + '/' + template.name + '.ms',
-                              format='MSEED')
+        cat_file = os.path.join(
+            filename, 'tribe_cat.{0}'.format(CAT_EXT_MAP[catalog_format]))
+        manifest_file = os.path.join(filename, 'tribe_manifest.csv')
+        if incremental:
+            manifest = _read_manifest(filename)
+            new_manifest = {}
+            to_write = []
+            for template in self.templates:
+                ms_file = os.path.join(filename, template.name + '.ms')
+                old = manifest.get(template.name)
+                if old is not None and os.path.isfile(ms_file) and \
+                        _template_in_file(template, ms_file):
+                    # Lazily read from this directory and not modified.
+                    new_manifest.update({template.name: (
+                        old[0], _event_checksum(template.event))})
+                    continue
+                checksums = (_waveform_checksum(template),
+                             _event_checksum(template.event))
+                new_manifest.update({template.name: checksums})
+                if old is not None and old[0] == checksums[0] and \
+                        os.path.isfile(ms_file):
+                    continue
+                to_write.append(template)
+            removed = False
+            for name in set(manifest.keys()) - set(new_manifest.keys()):
+                ms_file = os.path.join(filename, name + '.ms')
+                if os.path.isfile(ms_file):
+                    os.remove(ms_file)
+                    removed = True
+            write_catalog = not os.path.isfile(cat_file) or (
+                set((k, v[1]) for k, v in manifest.items()) !=
+                set((k, v[1]) for k, v in new_manifest.items()))
+        else:
+            to_write = self.templates
+            write_catalog = True
+            # A manifest left by an incremental write would be out of date
+            if os.path.isfile(manifest_file):
+                os.remove(manifest_file)
+        # The archive of an incremental write is out of date if the
+        # directory is changed without updating it
+        archive_state_file = os.path.join(filename, 'tribe_archive.csv')
+        if not (incremental and compress) and \
+                os.path.isfile(archive_state_file):
+            os.remove(archive_state_file)
+        written = ['template_parameters.csv']
+        if write_catalog:
+            old_cat_files = glob.glob(os.path.join(filename, 'tribe_cat.*'))
+            for old_cat_file in old_cat_files:
+                os.remove(old_cat_file)
+            tribe_cat = Catalog()
+            for t in self.templates:
+                if t.event is not None:
+                    tribe_cat.append(t.event)
+            if len(tribe_cat) > 0:
+                _write_catalog(tribe_cat, cat_file, format=catalog_format)
+                written.append(os.path.basename(cat_file))
+            if incremental and not set(old_cat_files).issubset({cat_file}):
+                removed = True
+        _parallel_write_waveforms(
+            templates=to_write, dirname=filename, cores=cores)
+        written.extend(t.name + '.ms' for t in to_write)
+        if incremental:
+            _write_manifest(filename, new_manifest)
+            written.append('tribe_manifest.csv')
         if compress:
-            with tarfile.open(filename + '.tgz', "w:gz") as tar:
-                tar.add(filename, arcname=os.path.basename(filename))
-            shutil.rmtree(filename)
+            if incremental:
+                _update_archive(filename, names=written, rewrite=removed)
+            else:
+                with tarfile.open(filename + '.tgz', "w:gz") as tar:
+                    tar.add(filename, arcname=os.path.basename(filename))
+                shutil.rmtree(filename)
         return self
 
     def _par_write(self, dirname):
@@ -2367,18 +2614,43 @@ class Tribe(object):
         with open(filename, 'w') as parfile:
             for template in self.templates:
                 for key in template.__dict__.keys():
-                    if key not in ['st', 'event']:
+                    if key not in ['st', 'event', '_store']:
                         parfile.write(key + ': ' +
                                       str(template.__dict__[key]) + ', ')
                 parfile.write('\n')
         return self
 
-    def read(self, filename):
+    def read(self, filename, cores=None, lazy=False, cache_size=None):
         """
         Read a tribe of templates from a tar formatted file.
 
+        Archive members are streamed into memory rather than extracted to
+        disk.
+
         :type filename: str
-        :param filename: File to read templates from.
+        :param filename:
+            File to read templates from, can also be the directory written
+            by `Tribe.write(compress=False)`.
+        :type cores: int
+        :param cores:
+            Number of threads to use to decode template waveforms, defaults
+            to decoding serially.
+        :type lazy: bool
+        :param lazy:
+            Whether to only read template metadata and events, and to read
+            waveforms from an on-disk store when they are first accessed.
+            Compressed archives are extracted to a temporary directory,
+            which is removed when the templates read are garbage collected.
+        :type cache_size: int
+        :param cache_size:
+            Maximum number of template waveforms to keep in memory when
+            `lazy=True`, least recently used waveforms are evicted first.
+            Defaults to no limit.
+
+        .. Note::
+            Waveforms of lazily read templates can be evicted from memory,
+            so in-place changes to `template.st` may be lost. Assign a new
+            stream to `template.st` to keep it in memory.
 
         .. rubric:: Example
 
@@ -2388,48 +2660,126 @@ class Tribe(object):
         >>> tribe_back = Tribe().read('test_tribe.tgz')
         >>> tribe_back == tribe
         True
+        >>> tribe_back = Tribe().read('test_tribe.tgz', lazy=True)
+        >>> tribe_back == tribe
+        True
         """
+        if os.path.isdir(filename):
+            self._read_from_folder(
+                dirname=filename, lazy=lazy, cache_size=cache_size)
+            return self
         with tarfile.open(filename, "r:*") as arc:
+            if not lazy:
+                self._read_from_archive(arc=arc, cores=cores)
+                return self
             temp_dir = tempfile.mkdtemp()
-            arc.extractall(path=temp_dir, members=_safemembers(arc))
-            tribe_dir = glob.glob(temp_dir + os.sep + '*')[0]
-            self._read_from_folder(dirname=tribe_dir)
-        shutil.rmtree(temp_dir)
+            try:
+                arc.extractall(path=temp_dir, members=_safemembers(arc))
+                tribe_dir = glob.glob(temp_dir + os.sep + '*')[0]
+                self._read_from_folder(
+                    dirname=tribe_dir, lazy=True, cache_size=cache_size,
+                    temp_dir=temp_dir)
+            except Exception:
+                shutil.rmtree(temp_dir, True)
+                raise
         return self
 
-    def _read_from_folder(self, dirname):
+    def _read_from_archive(self, arc, cores=None):
+        """
+        Internal streaming archive reader.
+
+        Reads members in archive order in a single pass, so compressed
+        archives are only decompressed once and nothing is written to disk.
+
+        :type arc: :class:`tarfile.TarFile`
+        :param arc: Open archive to read from.
+        :type cores: int
+        :param cores: Number of threads to use to decode waveforms.
+        """
+        parfile, tribe_cat, waveforms = None, Catalog(), {}
+        for member in arc:
+            if not member.isfile():
+                continue
+            basename = member.name.split('/')[-1]
+            if basename == 'template_parameters.csv':
+                parfile = arc.extractfile(member).read()
+            elif basename.startswith('tribe_cat.'):
+                tribe_cat = _read_catalog(
+                    io.BytesIO(arc.extractfile(member).read()))
+            elif basename.endswith('.ms'):
+                waveforms.update(
+                    {basename[:-3]: arc.extractfile(member).read()})
+        if parfile is None:
+            raise MatchFilterError('No template parameter file in archive')
+        templates = _read_template_parameters(
+            io.StringIO(parfile.decode('utf-8')))
+        events = _index_template_events(tribe_cat)
+        previous_template_names = [t.name for t in self.templates]
+        # Don't read in for templates that we already have.
+        templates = [t for t in templates
+                     if t.name not in previous_template_names]
+        for template in templates:
+            if template.name not in waveforms:
+                print('No waveform for template: ' + template.name)
+        templates = [t for t in templates if t.name in waveforms]
+        streams = _parallel_read_waveforms(
+            [waveforms.pop(t.name) for t in templates], cores=cores)
+        for template, st in zip(templates, streams):
+            template.event = events.get(template.name)
+            template.st = st
+        self.templates.extend(templates)
+        return
+
+    def _read_from_folder(self, dirname, template_names=None, lazy=False,
+                          cache_size=None, temp_dir=None):
         """
         Internal folder reader.
 
         :type dirname: str
         :param dirname: Folder to read from.
+        :type template_names: list
+        :param template_names:
+            Names of templates to read, defaults to reading all templates.
+        :type lazy: bool
+        :param lazy: Whether to read waveforms on first access or not.
+        :type cache_size: int
+        :param cache_size: Maximum number of waveforms to cache if lazy.
+        :type temp_dir: str
+        :param temp_dir:
+            Temporary directory holding `dirname`, removed when the store of
+            lazily read waveforms is garbage collected.
         """
         templates = _par_read(dirname=dirname, compressed=False)
-        t_files = glob.glob(dirname + os.sep + '*.ms')
+        if template_names is not None:
+            templates = [t for t in templates if t.name in template_names]
+        t_files = {t_file.split(os.sep)[-1][:-3]: t_file
+                   for t_file in glob.glob(dirname + os.sep + '*.ms')}
         tribe_cat_file = glob.glob(os.path.join(dirname, "tribe_cat.*"))
         if len(tribe_cat_file) != 0:
-            tribe_cat = read_events(tribe_cat_file[0])
+            tribe_cat = _read_catalog(tribe_cat_file[0])
         else:
             tribe_cat = Catalog()
+        events = _index_template_events(tribe_cat)
+        if lazy:
+            store = _TemplateStore(
+                files=t_files, cache_size=cache_size, temp_dir=temp_dir)
         previous_template_names = [t.name for t in self.templates]
+        read_templates = []
         for template in templates:
             if template.name in previous_template_names:
                 # Don't read in for templates that we already have.
                 continue
-            for event in tribe_cat:
-                for comment in event.comments:
-                    if comment.text == 'eqcorrscan_template_' + template.name:
-                        template.event = event
-            t_file = [t for t in t_files
-                      if t.split(os.sep)[-1] == template.name + '.ms']
-            if len(t_file) == 0:
+            template.event = events.get(template.name)
+            if template.name not in t_files:
                 print('No waveform for template: ' + template.name)
-                templates.remove(template)
                 continue
-            elif len(t_file) > 1:
-                print('Multiple waveforms found, using: ' + t_file[0])
-            template.st = read(t_file[0])
-        self.templates.extend(templates)
+            if lazy:
+                del template.st
+                template._store = store
+            else:
+                template.st = read(t_files[template.name])
+            read_templates.append(template)
+        self.templates.extend(read_templates)
         return
 
     def cluster(self, method, **kwargs):
@@ -2468,7 +2818,8 @@ class Tribe(object):
                concurrency=None, cores=None, ignore_length=False,
                group_size=None, overlap="calculate", debug=0,
                full_peaks=False, save_progress=False,
-               process_cores=None, **kwargs):
+               process_cores=None, process_once=False, process_cache=None,
+               prefetch=0, retain_correlations=None, **kwargs):
         """
         Detect using a Tribe of templates within a continuous stream.
 
@@ -2541,6 +2892,33 @@ class Tribe(object):
         :param process_cores:
             Number of processes to use for pre-processing (if different to
             `cores`).
+        :type process_once: bool
+        :param process_once:
+            Whether to process the whole of `stream` once and correlate
+            overlapping chunks of the processed data, or process each chunk
+            separately (default). Processing once avoids re-processing
+            overlapping data, but filter edge-effects will differ slightly
+            at chunk boundaries. Not used if `daylong=True`.
+        :type process_cache:
+            :class:`eqcorrscan.utils.pre_processing.ProcessedDataCache`
+        :param process_cache:
+            Cache of processed data to re-use processed channels from, and
+            store newly processed channels in.
+        :type prefetch: int
+        :param prefetch:
+            Number of processed chunks of data to prepare in a background
+            thread while the current chunk is correlated. Chunks are
+            processed when needed if 0 (default). At most `prefetch` + 2
+            processed chunks are held in memory at once.
+        :type retain_correlations: float
+        :param retain_correlations:
+            Shift length in seconds: if set, the correlation function of
+            each template channel within plus/minus this length of each
+            detection is kept with the detection, so that
+            :meth:`eqcorrscan.core.match_filter.Party.lag_calc` can make
+            picks from them without processing and correlating the data
+            again. Only the data around each detection are correlated
+            channel-by-channel.
 
         :return:
             :class:`eqcorrscan.core.match_filter.Party` of Families of
@@ -2621,21 +2999,16 @@ class Tribe(object):
             length is the number of channels within this template.
         """
         party = Party()
+        # Group on metadata only so that lazily read templates are only
+        # loaded when their group is run.
         template_groups = []
-        for master in self.templates:
+        for template in self.templates:
             for group in template_groups:
-                if master in group:
+                if group[0].same_processing(template):
+                    group.append(template)
                     break
             else:
-                new_group = [master]
-                for slave in self.templates:
-                    if master.same_processing(slave) and master != slave:
-                        new_group.append(slave)
-                template_groups.append(new_group)
-        # template_groups will contain an empty first list
-        for group in template_groups:
-            if len(group) == 0:
-                template_groups.remove(group)
+                template_groups.append([template])
         # now we can compute the detections for each group
         for group in template_groups:
             group_party = _group_detect(
@@ -2645,7 +3018,10 @@ class Tribe(object):
                 daylong=daylong, parallel_process=parallel_process,
                 xcorr_func=xcorr_func, concurrency=concurrency, cores=cores,
                 ignore_length=ignore_length, overlap=overlap, debug=debug,
-                full_peaks=full_peaks, process_cores=process_cores, **kwargs)
+                full_peaks=full_peaks, process_cores=process_cores,
+                process_once=process_once, process_cache=process_cache,
+                prefetch=prefetch, retain_correlations=retain_correlations,
+                **kwargs)
             party += group_party
             if save_progress:
                 party.write("eqcorrscan_temporary_party")
@@ -2661,7 +3037,9 @@ class Tribe(object):
                       concurrency=None, cores=None, ignore_length=False,
                       group_size=None, debug=0, return_stream=False,
                       full_peaks=False, save_progress=False,
-                      process_cores=None, retries=3, **kwargs):
+                      process_cores=None, retries=3, retry_delay=1.0,
+                      prefetch_data=0, waveform_cache=None, resume=False,
+                      **kwargs):
         """
         Detect using a Tribe of templates within a continuous stream.
 
@@ -2723,10 +3101,13 @@ class Tribe(object):
             consumption, if unset will use all templates.
         :type full_peaks: bool
         :param full_peaks: See `eqcorrscan.utils.findpeaks.find_peaks2_short`
-        :type save_progress: bool
+        :type save_progress: bool or str
         :param save_progress:
-            Whether to save the resulting party at every data step or not.
-            Useful for long-running processes.
+            Whether to save progress after every window of data or not.
+            Useful for long-running processes. Detections from each completed
+            window are appended to a journal in the directory
+            "eqcorrscan_temporary_party", or in the directory given if
+            save_progress is a str. See note on resuming below.
         :type process_cores: int
         :param process_cores:
             Number of processes to use for pre-processing (if different to
@@ -2743,6 +3124,24 @@ class Tribe(object):
         :param retries:
             Number of attempts allowed for downloading - allows for transient
             server issues.
+        :type retry_delay: float
+        :param retry_delay:
+            Seconds to wait before the first retry of a failed download, the
+            wait is doubled for every subsequent retry.
+        :type prefetch_data: int
+        :param prefetch_data:
+            Number of data windows to download ahead in a background thread
+            while the current window is processed and correlated. If 0, data
+            are downloaded when needed.
+        :type waveform_cache: str
+        :param waveform_cache:
+            Directory to store downloaded data in as miniseed. Data already
+            in this directory for a window are read rather than downloaded
+            again, so re-runs do not need to re-download.
+        :type resume: bool
+        :param resume:
+            Whether to skip windows already completed in the progress
+            journal, see note on resuming below.
 
         :return:
             :class:`eqcorrscan.core.match_filter.Party` of Families of
@@ -2765,6 +3164,19 @@ class Tribe(object):
             honoured, so detections may occur after the end-time set.  This is
             because data must be run in the correct process-length.
 
+        .. Note::
+            **Resuming:**
+
+            With save_progress set, the detections of each window are written
+            to their own file in the journal directory when the window is
+            complete, and the window is recorded in the journal manifest.
+            Nothing is re-written, so saving progress costs the same for
+            every window. If a run stops, re-running with the same arguments
+            and `resume=True` will skip the windows in the journal, without
+            downloading their data, and will include their detections
+            (read from the journal) in the returned Party. The journal must
+            have been written by the same Tribe with the same `starttime`.
+
         .. warning::
             Plotting within the match-filter routine uses the Agg backend
             with interactive plotting turned off.  This is because the function
@@ -2843,61 +3255,35 @@ class Tribe(object):
             download_groups = int(download_groups) + 1
         else:
             download_groups = int(download_groups)
-        for i in range(download_groups):
-            bulk_info = []
-            for chan_id in template_channel_ids:
-                bulk_info.append((
-                    chan_id[0], chan_id[1], chan_id[2], chan_id[3],
-                    starttime + (i * data_length) - (pad + buff),
-                    starttime + ((i + 1) * data_length) + (pad + buff)))
-            for retry_attempt in range(retries):
-                try:
-                    st = client.get_waveforms_bulk(bulk_info)
-                    break
-                except Exception as e:
-                    print(e)
-                    continue
-            else:
-                raise MatchFilterError(
-                    "Could not download data after {0} attempts".format(
-                        retries))
-            # Get gaps and remove traces as necessary
-            if min_gap:
-                gaps = st.get_gaps(min_gap=min_gap)
-                if len(gaps) > 0:
-                    print("Large gaps in downloaded data")
-                    st.merge()
-                    gappy_channels = list(
-                        set([(gap[0], gap[1], gap[2], gap[3])
-                             for gap in gaps]))
-                    _st = Stream()
-                    for tr in st:
-                        tr_stats = (tr.stats.network, tr.stats.station,
-                                    tr.stats.location, tr.stats.channel)
-                        if tr_stats in gappy_channels:
-                            print("Removing gappy channel: %s" % str(tr))
-                        else:
-                            _st += tr
-                    st = _st
-                    st.split()
-            st.merge()
-            st.trim(starttime=starttime + (i * data_length) - pad,
-                    endtime=starttime + ((i + 1) * data_length) + pad)
-            for tr in st:
-                if not _check_daylong(tr):
-                    st.remove(tr)
-                    print("{0} contains more zeros than non-zero, "
-                          "removed".format(tr.id))
-            for tr in st:
-                if tr.stats.endtime - tr.stats.starttime < \
-                   0.8 * data_length:
-                    st.remove(tr)
-                    print("{0} is less than 80% of the required length"
-                          ", removed".format(tr.id))
+        journal = None
+        if save_progress or resume:
+            journal = "eqcorrscan_temporary_party"
+            if save_progress not in [True, False]:
+                journal = save_progress
+        completed = {}
+        if resume:
+            completed = _read_journal_manifest(journal)
+            for i, (window_start, _, _) in completed.items():
+                if window_start != starttime + (i * data_length):
+                    raise MatchFilterError(
+                        "Journal in {0} was written for different "
+                        "windows".format(journal))
+            party += _read_journal(
+                dirname=journal, templates=self.templates,
+                windows=completed)
+        elif journal is not None:
+            _clear_journal(journal)
+        windows = _client_windows(
+            client=client, template_channel_ids=template_channel_ids,
+            starttime=starttime, data_length=data_length,
+            n_windows=download_groups, pad=pad, buff=buff, min_gap=min_gap,
+            retries=retries, retry_delay=retry_delay,
+            waveform_cache=waveform_cache, skip_windows=completed)
+        for i, st in _prefetch(windows, n_items=prefetch_data):
             if return_stream:
                 stream += st
             try:
-                party += self.detect(
+                window_party = self.detect(
                     stream=st, threshold=threshold,
                     threshold_type=threshold_type, trig_int=trig_int,
                     plotvar=plotvar, daylong=daylong,
@@ -2906,8 +3292,13 @@ class Tribe(object):
                     ignore_length=ignore_length, group_size=group_size,
                     overlap=None, debug=debug, full_peaks=full_peaks,
                     process_cores=process_cores, **kwargs)
-                if save_progress:
-                    party.write("eqcorrscan_temporary_party")
+                party += window_party
+                if journal is not None:
+                    _write_journal_window(
+                        dirname=journal, index=i,
+                        starttime=starttime + (i * data_length),
+                        endtime=starttime + ((i + 1) * data_length),
+                        party=window_party)
             except Exception as e:
                 print('Error, routine incomplete, returning incomplete Party')
                 print('Error: %s' % str(e))
@@ -2986,6 +3377,7 @@ class Tribe(object):
             t.samp_rate = samp_rate
             t.process_length = process_len
             t.prepick = prepick
+            t.resample_method = kwargs.get('resample_method', 'fft')
             event.comments.append(Comment(
                 text="eqcorrscan_template_" + t.name,
                 creation_info=CreationInfo(agency='eqcorrscan',
@@ -2995,6 +3387,79 @@ class Tribe(object):
         return self
 
 
+class _TemplateStore(object):
+    """
+    On-disk store of template waveforms with a least-recently-used cache.
+
+    :type files: dict
+    :param files: Miniseed files keyed by template name.
+    :type cache_size: int
+    :param cache_size:
+        Maximum number of waveforms to keep in memory, defaults to no limit.
+    :type temp_dir: str
+    :param temp_dir:
+        Temporary directory holding the files, removed when the store and
+        all copies of it have been garbage collected.
+    """
+    def __init__(self, files, cache_size=None, temp_dir=None):
+        self.files = files
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._owner, self._finalizer = None, None
+        if temp_dir is not None:
+            self._finalizer = weakref.finalize(
+                self, shutil.rmtree, temp_dir, True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        # Stores in other processes do not own the files
+        state.pop('_owner')
+        state.pop('_finalizer')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._owner, self._finalizer = None, None
+
+    def __deepcopy__(self, memo):
+        """Copies keep the store that owns the files alive."""
+        store = _TemplateStore(
+            files=copy.deepcopy(self.files, memo),
+            cache_size=self.cache_size)
+        if self._finalizer is not None:
+            store._owner = self
+        else:
+            store._owner = self._owner
+        with self._lock:
+            store._cache = copy.deepcopy(self._cache, memo)
+        return store
+
+    def get(self, name):
+        """
+        Get the waveform for a template, reading it from disk if needed.
+
+        :type name: str
+        :param name: Name of the template.
+
+        :return: :class:`obspy.core.stream.Stream`
+        """
+        with self._lock:
+            st = self._cache.pop(name, None)
+            if st is not None:
+                self._cache[name] = st
+                return st
+        st = read(self.files[name])
+        with self._lock:
+            self._cache[name] = st
+            while self.cache_size is not None and \
+                    len(self._cache) > max(self.cache_size, 1):
+                self._cache.popitem(last=False)
+        return st
+
+
 class Detection(object):
     """
     Single detection from detection routines in eqcorrscan.
@@ -3032,11 +3497,17 @@ class Detection(object):
         :func:`eqcorrscan.core.match_filter.Detection.write`
     :type id: str
     :param id: Identification for detection (should be unique).
+    :type correlations: obspy.core.stream.Stream
+    :param correlations:
+        Correlation functions of each template channel around the detection,
+        retained from detection to use for lag-calc, see
+        :meth:`eqcorrscan.core.match_filter.Tribe.detect`. These are not
+        written to file, and are not compared when testing equality.
     """
 
     def __init__(self, template_name, detect_time, no_chans, detect_val,
                  threshold, typeofdet, threshold_type, threshold_input,
-                 chans=None, event=None, id=None):
+                 chans=None, event=None, id=None, correlations=None):
         """Main class of Detection."""
         self.template_name = template_name
         self.detect_time = detect_time
@@ -3051,6 +3522,7 @@ class Detection(object):
         self.threshold_type = threshold_type
         self.threshold_input = threshold_input
         self.event = event
+        self.correlations = correlations
         if id is not None:
             self.id = id
         else:
@@ -3087,7 +3559,9 @@ class Detection(object):
         for key in self.__dict__.keys():
             self_is_event = isinstance(self.event, Event)
             other_is_event = isinstance(other.event, Event)
-            if key == 'event':
+            if key == 'correlations':
+                continue
+            elif key == 'event':
                 if self_is_event and other_is_event:
                     if not _test_event_similarity(
                             self.event, other.event, verbose=verbose):
@@ -3242,15 +3716,29 @@ def _total_microsec(t1, t2):
     return (td.seconds + td.days * 24 * 3600) * 10 ** 6 + td.microseconds
 
 
-def _templates_match(t, family_file):
+def _family_template_name(family_file):
     """
-    Return True if a tribe matches a family file path.
+    Get the name of the template a family file path was written for.
 
-    :type t: Tribe
     :type family_file: str
-    :return: bool
+    :return: str
+
+    .. rubric:: Example
+
+    >>> print(_family_template_name('party/2004_09_28t17_detections.csv'))
+    2004_09_28t17
+    """
+    return family_file.split(os.sep)[-1].split('_detections.')[0]
+
+
+def _index_events(catalog):
+    """
+    Index events in a catalog by the last part of their resource id.
+
+    :type catalog: :class:`obspy.core.event.Catalog`
+    :return: dict of :class:`obspy.core.event.Event`
     """
-    return t.name == family_file.split(os.sep)[-1].split('_detections.csv')[0]
+    return {str(e.resource_id).split('/')[-1]: e for e in catalog}
 
 
 def _test_event_similarity(event_1, event_2, verbose=False, shallow=False):
@@ -3400,7 +3888,9 @@ def _group_detect(templates, stream, threshold, threshold_type, trig_int,
                   plotvar, group_size=None, pre_processed=False, daylong=False,
                   parallel_process=True, xcorr_func=None, concurrency=None,
                   cores=None, ignore_length=False, overlap="calculate",
-                  debug=0, full_peaks=False, process_cores=None, **kwargs):
+                  debug=0, full_peaks=False, process_cores=None,
+                  process_once=False, process_cache=None, prefetch=0,
+                  retain_correlations=None, **kwargs):
     """
     Pre-process and compute detections for a group of templates.
 
@@ -3481,6 +3971,21 @@ def _group_detect(templates, stream, threshold, threshold_type, trig_int,
     :param process_cores:
         Number of processes to use for pre-processing (if different to
         `cores`).
+    :type process_once: bool
+    :param process_once:
+        Whether to process the whole stream once and correlate views of
+        overlapping chunks, or to process each chunk separately.
+    :type process_cache:
+        :class:`eqcorrscan.utils.pre_processing.ProcessedDataCache`
+    :param process_cache: Cache of processed data to use, or None.
+    :type prefetch: int
+    :param prefetch:
+        Number of chunks to process ahead of correlation in a background
+        thread.
+    :type retain_correlations: float
+    :param retain_correlations:
+        Shift length in seconds of correlation functions to keep for each
+        detection, see :func:`eqcorrscan.core.match_filter.match_filter`.
 
     :return:
         :class:`eqcorrscan.core.match_filter.Party` of families of detections.
@@ -3504,10 +4009,13 @@ def _group_detect(templates, stream, threshold, threshold_type, trig_int,
     if not pre_processed:
         if process_cores is None:
             process_cores = cores
-        streams = _group_process(
+        # Chunks are processed as they are needed, rather than all at once
+        streams = _prefetch(_iter_group_process(
             template_group=templates, parallel=parallel_process, debug=debug,
             cores=process_cores, stream=stream, daylong=daylong,
-            ignore_length=ignore_length, overlap=overlap)
+            ignore_length=ignore_length, overlap=overlap,
+            process_once=process_once, process_cache=process_cache,
+            dtype=np.float32), n_items=prefetch)
     else:
         warnings.warn('Not performing any processing on the continuous data.')
         streams = [stream]
@@ -3544,7 +4052,8 @@ def _group_detect(templates, stream, threshold, threshold_type, trig_int,
                 xcorr_func=xcorr_func, concurrency=concurrency,
                 threshold=threshold, threshold_type=threshold_type,
                 trig_int=trig_int, plotvar=plotvar, debug=debug, cores=cores,
-                full_peaks=full_peaks, peak_cores=process_cores, **kwargs)
+                full_peaks=full_peaks, peak_cores=process_cores,
+                retain_correlations=retain_correlations, **kwargs)
             for template in template_group:
                 family = Family(template=template, detections=[])
                 for detection in detections:
@@ -3555,7 +4064,8 @@ def _group_detect(templates, stream, threshold, threshold_type, trig_int,
 
 
 def _group_process(template_group, parallel, debug, cores, stream, daylong,
-                   ignore_length, overlap):
+                   ignore_length, overlap, process_once=False,
+                   process_cache=None, dtype=None, chunk=True):
     """
     Process data into chunks based on template processing length.
 
@@ -3581,16 +4091,52 @@ def _group_process(template_group, parallel, debug, cores, stream, daylong,
         ignore_length=True.  This is not recommended!
     :type overlap: float
     :param overlap: Number of seconds to overlap chunks by.
+    :type process_once: bool
+    :param process_once:
+        Whether to process the whole stream once and return chunks that are
+        views of the processed data, or to process each chunk separately.
+        Chunks share memory where they overlap, so must not be modified in
+        place. Not used if `daylong=True`.
+    :type process_cache:
+        :class:`eqcorrscan.utils.pre_processing.ProcessedDataCache`
+    :param process_cache:
+        Cache to get processed channels from before processing, newly
+        processed channels are added to the cache.
+    :type dtype: numpy.dtype
+    :param dtype:
+        Data type to produce processed data in, see
+        :func:`eqcorrscan.utils.pre_processing.process`.
+    :type chunk: bool
+    :param chunk:
+        Whether to split data processed once into chunks. If False and
+        `process_once=True` the whole processed stream is returned as the
+        only item.
 
     :return: list of processed streams.
     """
+    return list(_iter_group_process(
+        template_group=template_group, parallel=parallel, debug=debug,
+        cores=cores, stream=stream, daylong=daylong,
+        ignore_length=ignore_length, overlap=overlap,
+        process_once=process_once, process_cache=process_cache, dtype=dtype,
+        chunk=chunk))
+
+
+def _iter_group_process(template_group, parallel, debug, cores, stream,
+                        daylong, ignore_length, overlap, process_once=False,
+                        process_cache=None, dtype=None, chunk=True):
+    """
+    Generate processed chunks of data, see :func:`_group_process`.
+
+    Each chunk is processed when it is requested.
+    """
     master = template_group[0]
-    processed_streams = []
     kwargs = {
         'filt_order': master.filt_order,
         'highcut': master.highcut, 'lowcut': master.lowcut,
         'samp_rate': master.samp_rate, 'debug': debug,
-        'parallel': parallel, 'num_cores': cores}
+        'parallel': parallel, 'num_cores': cores,
+        'resample_method': master.resample_method, 'dtype': dtype}
     # Processing always needs to be run to account for gaps - pre-process will
     # check whether filtering and resampling needs to be done.
     if daylong:
@@ -3613,12 +4159,35 @@ def _group_process(template_group, parallel, debug, cores, stream, daylong,
         # We want to use shortproc to allow overlaps
         func = shortproc
         starttime = stream.sort(['starttime'])[0].stats.starttime
+    if process_cache is not None:
+        func = partial(process_cache.process, func)
     endtime = stream.sort(['endtime'])[-1].stats.endtime
     data_len_samps = round((endtime - starttime) * master.samp_rate) + 1
     chunk_len_samps = (master.process_length - overlap) * master.samp_rate
     n_chunks = int(data_len_samps / chunk_len_samps)
     if n_chunks == 0:
         print('Data must be process_length or longer, not computing')
+    if process_once and not daylong and n_chunks > 0:
+        kwargs.update({
+            'starttime': starttime, 'endtime': starttime + (
+                (n_chunks - 1) * (master.process_length - overlap)) +
+            master.process_length})
+        full_stream = stream.slice(starttime=kwargs['starttime'],
+                                   endtime=kwargs['endtime']).copy()
+        for tr in full_stream:
+            tr.data = tr.data[0:int(
+                (kwargs['endtime'] - kwargs['starttime']) *
+                tr.stats.sampling_rate)]
+        processed_stream = func(st=full_stream, **kwargs)
+        if not chunk:
+            yield processed_stream
+            return
+        for chunk_stream in _chunk_views(
+                stream=processed_stream, starttime=starttime,
+                chunk_length=master.process_length,
+                step=master.process_length - overlap, n_chunks=n_chunks):
+            yield chunk_stream
+        return
     for i in range(n_chunks):
         kwargs.update(
             {'starttime': starttime + (i * (master.process_length - overlap))})
@@ -3632,8 +4201,240 @@ def _group_process(template_group, parallel, debug, cores, stream, daylong,
         for tr in chunk_stream:
             tr.data = tr.data[0:int(
                 master.process_length * tr.stats.sampling_rate)]
-        processed_streams.append(func(st=chunk_stream, **kwargs))
-    return processed_streams
+        yield func(st=chunk_stream, **kwargs)
+
+
+def _prefetch(iterable, n_items=0):
+    """
+    Iterate over an iterable, preparing items ahead in a background thread.
+
+    :type iterable: iterable
+    :param iterable: Items to iterate over.
+    :type n_items: int
+    :param n_items:
+        Maximum number of items to prepare ahead of the consumer, if 0 items
+        are generated when requested.
+
+    .. rubric:: Example
+
+    >>> print(list(_prefetch(range(5), n_items=2)))
+    [0, 1, 2, 3, 4]
+    """
+    if not n_items:
+        for item in iterable:
+            yield item
+        return
+    queue = Queue(maxsize=n_items)
+    stop = threading.Event()
+    finished = object()
+
+    def _put(item, error=None):
+        while not stop.is_set():
+            try:
+                queue.put((item, error), timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put(item):
+                    return
+        except Exception as e:
+            _put(finished, e)
+            return
+        _put(finished)
+
+    producer = threading.Thread(target=_produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if error is not None:
+                raise error
+            if item is finished:
+                break
+            yield item
+    finally:
+        # Stop the producer if the consumer stops early
+        stop.set()
+        producer.join()
+
+
+def _client_windows(client, template_channel_ids, starttime, data_length,
+                    n_windows, pad, buff, min_gap=None, retries=3,
+                    retry_delay=1.0, waveform_cache=None, skip_windows=()):
+    """
+    Download and clean data for each window of Tribe.client_detect.
+
+    :type client: `obspy.clients.*.Client`
+    :param client: Any obspy client with a dataselect service.
+    :type template_channel_ids: list
+    :param template_channel_ids:
+        List of (network, station, location, channel) tuples to download.
+    :type starttime: :class:`obspy.core.UTCDateTime`
+    :param starttime: Start-time of the first window.
+    :type data_length: float
+    :param data_length: Length of each window in seconds.
+    :type n_windows: int
+    :param n_windows: Number of windows to download.
+    :type pad: float
+    :param pad: Overlap in seconds to keep either side of each window.
+    :type buff: float
+    :param buff: Extra data in seconds to download either side of the pad.
+    :type min_gap: float
+    :param min_gap: Remove channels with gaps longer than this.
+    :type retries: int
+    :param retries: Number of attempts allowed for each download.
+    :type retry_delay: float
+    :param retry_delay: Seconds to wait before the first retry.
+    :type waveform_cache: str
+    :param waveform_cache: Directory to cache downloaded data in.
+    :type skip_windows: list
+    :param skip_windows: Indexes of windows not to download.
+
+    :return:
+        Generator of tuples of (window index,
+        :class:`obspy.core.stream.Stream`).
+    """
+    for i in range(n_windows):
+        if i in skip_windows:
+            continue
+        bulk_info = []
+        for chan_id in template_channel_ids:
+            bulk_info.append((
+                chan_id[0], chan_id[1], chan_id[2], chan_id[3],
+                starttime + (i * data_length) - (pad + buff),
+                starttime + ((i + 1) * data_length) + (pad + buff)))
+        st = _get_waveforms_bulk(
+            client=client, bulk_info=bulk_info, retries=retries,
+            retry_delay=retry_delay, waveform_cache=waveform_cache)
+        # Get gaps and remove traces as necessary
+        if min_gap:
+            gaps = st.get_gaps(min_gap=min_gap)
+            if len(gaps) > 0:
+                print("Large gaps in downloaded data")
+                st.merge()
+                gappy_channels = list(
+                    set([(gap[0], gap[1], gap[2], gap[3])
+                         for gap in gaps]))
+                _st = Stream()
+                for tr in st:
+                    tr_stats = (tr.stats.network, tr.stats.station,
+                                tr.stats.location, tr.stats.channel)
+                    if tr_stats in gappy_channels:
+                        print("Removing gappy channel: %s" % str(tr))
+                    else:
+                        _st += tr
+                st = _st
+                st.split()
+        st.merge()
+        st.trim(starttime=starttime + (i * data_length) - pad,
+                endtime=starttime + ((i + 1) * data_length) + pad)
+        for tr in st:
+            if not _check_daylong(tr):
+                st.remove(tr)
+                print("{0} contains more zeros than non-zero, "
+                      "removed".format(tr.id))
+        for tr in st:
+            if tr.stats.endtime - tr.stats.starttime < \
+               0.8 * data_length:
+                st.remove(tr)
+                print("{0} is less than 80% of the required length"
+                      ", removed".format(tr.id))
+        yield i, st
+
+
+def _get_waveforms_bulk(client, bulk_info, retries=3, retry_delay=1.0,
+                        waveform_cache=None):
+    """
+    Download data with retries, optionally through an on-disk cache.
+
+    Failed downloads are retried after retry_delay seconds, doubling the
+    wait for every subsequent attempt.
+
+    :type client: `obspy.clients.*.Client`
+    :param client: Any obspy client with a get_waveforms_bulk method.
+    :type bulk_info: list
+    :param bulk_info: Request as for `client.get_waveforms_bulk`.
+    :type retries: int
+    :param retries: Number of attempts allowed.
+    :type retry_delay: float
+    :param retry_delay: Seconds to wait before the first retry.
+    :type waveform_cache: str
+    :param waveform_cache:
+        Directory to cache data in, keyed by the request. Cached data are
+        read rather than downloaded.
+
+    :return: :class:`obspy.core.stream.Stream`
+    """
+    cache_file = None
+    if waveform_cache is not None:
+        request = hashlib.md5(
+            repr(sorted([tuple(str(item) for item in info)
+                         for info in bulk_info])).encode("utf-8"))
+        cache_file = os.path.join(
+            waveform_cache, "{0}.ms".format(request.hexdigest()))
+        if os.path.isfile(cache_file):
+            return read(cache_file, format="MSEED")
+    for retry_attempt in range(retries):
+        try:
+            st = client.get_waveforms_bulk(bulk_info)
+            break
+        except Exception as e:
+            print(e)
+            if retry_attempt < retries - 1:
+                time.sleep(retry_delay * 2 ** retry_attempt)
+            continue
+    else:
+        raise MatchFilterError(
+            "Could not download data after {0} attempts".format(retries))
+    if cache_file is not None and len(st) > 0:
+        if not os.path.isdir(waveform_cache):
+            os.makedirs(waveform_cache)
+        # Write then rename so that interrupted writes are not read later
+        st.write(cache_file + ".tmp", format="MSEED")
+        os.rename(cache_file + ".tmp", cache_file)
+    return st
+
+
+def _chunk_views(stream, starttime, chunk_length, step, n_chunks):
+    """
+    Split a processed stream into overlapping chunks without copying data.
+
+    :type stream: :class:`obspy.core.stream.Stream`
+    :param stream: Processed stream, all traces starting at `starttime`.
+    :type starttime: :class:`obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Start of the first chunk.
+    :type chunk_length: float
+    :param chunk_length: Length of chunks in seconds.
+    :type step: float
+    :param step: Seconds between the starts of consecutive chunks.
+    :type n_chunks: int
+    :param n_chunks: Number of chunks.
+
+    :return: list of :class:`obspy.core.stream.Stream`
+    """
+    chunks = []
+    for i in range(n_chunks):
+        chunk = Stream()
+        for tr in stream:
+            start_sample = int(round(
+                (starttime + i * step - tr.stats.starttime) *
+                tr.stats.sampling_rate))
+            end_sample = start_sample + int(
+                chunk_length * tr.stats.sampling_rate)
+            data = tr.data[start_sample:end_sample]
+            header = tr.stats.copy()
+            header.npts = len(data)
+            header.starttime = (
+                tr.stats.starttime + start_sample * tr.stats.delta)
+            chunk += Trace(data=data, header=header)
+        chunks.append(chunk)
+    return chunks
 
 
 def _par_read(dirname, compressed=True):
@@ -3645,7 +4446,6 @@ def _par_read(dirname, compressed=True):
     :type compressed: bool
     :param compressed: Whether the directory is compressed or not.
     """
-    templates = []
     if compressed:
         arc = tarfile.open(dirname, "r:*")
         members = arc.getmembers()
@@ -3656,13 +4456,32 @@ def _par_read(dirname, compressed=True):
             arc.close()
             raise MatchFilterError(
                 'No template parameter file in archive')
-        parfile = arc.extractfile(_parfile[0])
+        # Later members supersede earlier members of the same name
+        parfile = io.StringIO(
+            arc.extractfile(_parfile[-1]).read().decode('utf-8'))
     else:
         parfile = open(dirname + '/' + 'template_parameters.csv', 'r')
+    templates = _read_template_parameters(parfile)
+    parfile.close()
+    if compressed:
+        arc.close()
+    return templates
+
+
+def _read_template_parameters(parfile):
+    """
+    Read Templates, without waveforms, from an open parameter file.
+
+    :type parfile: file
+    :param parfile: Open, text-mode parameter file.
+
+    :return: list of :class:`eqcorrscan.core.match_filter.Template`
+    """
+    templates = []
     for line in parfile:
         t_in = Template()
         for key_pair in line.rstrip().split(','):
-            if key_pair.split(':')[0].strip() == 'name':
+            if key_pair.split(':')[0].strip() in ['name', 'resample_method']:
                 t_in.__dict__[key_pair.split(':')[0].strip()] = \
                     key_pair.split(':')[-1].strip()
             elif key_pair.split(':')[0].strip() == 'filt_order':
@@ -3678,12 +4497,346 @@ def _par_read(dirname, compressed=True):
                 except ValueError:
                     pass
         templates.append(t_in)
-    parfile.close()
-    if compressed:
-        arc.close()
     return templates
 
 
+def _index_template_events(catalog):
+    """
+    Index template events by the template name stored in their comments.
+
+    :type catalog: :class:`obspy.core.event.Catalog`
+    :param catalog: Catalog of template events.
+
+    :return: dict of :class:`obspy.core.event.Event` keyed by template name.
+    """
+    events = {}
+    for event in catalog:
+        for comment in event.comments:
+            if comment.text and comment.text.startswith(
+                    'eqcorrscan_template_'):
+                events.update(
+                    {comment.text[len('eqcorrscan_template_'):]: event})
+    return events
+
+
+def _parallel_read_waveforms(waveforms, cores=None):
+    """
+    Decode in-memory miniseed waveforms.
+
+    :type waveforms: list
+    :param waveforms: List of bytes of miniseed data.
+    :type cores: int
+    :param cores:
+        Number of threads to decode with, decoding happens in libmseed which
+        releases the GIL.
+
+    :return: list of :class:`obspy.core.stream.Stream`
+    """
+    def _read_bytes(waveform):
+        return read(io.BytesIO(waveform), format='MSEED')
+
+    if cores is None or cores == 1 or len(waveforms) < 2:
+        return [_read_bytes(waveform) for waveform in waveforms]
+    pool = ThreadPool(processes=min(cores, len(waveforms)))
+    try:
+        streams = pool.map(_read_bytes, waveforms)
+    finally:
+        pool.close()
+        pool.join()
+    return streams
+
+
+def _parallel_write_waveforms(templates, dirname, cores=None):
+    """
+    Write template waveforms to miniseed files named by template name.
+
+    :type templates: list
+    :param templates: List of :class:`eqcorrscan.core.match_filter.Template`
+    :type dirname: str
+    :param dirname: Directory to write to.
+    :type cores: int
+    :param cores: Number of threads to write with.
+    """
+    def _write_template(template):
+        template.st.write(os.path.join(dirname, template.name + '.ms'),
+                          format='MSEED')
+
+    if cores is None or cores == 1 or len(templates) < 2:
+        for template in templates:
+            _write_template(template)
+        return
+    pool = ThreadPool(processes=min(cores, len(templates)))
+    try:
+        pool.map(_write_template, templates)
+    finally:
+        pool.close()
+        pool.join()
+    return
+
+
+def _waveform_checksum(template):
+    """
+    Checksum of template parameters and waveform data.
+
+    :type template: :class:`eqcorrscan.core.match_filter.Template`
+    :param template: Template to get the checksum for.
+
+    :return: str
+    """
+    checksum = hashlib.md5()
+    for key in sorted(template.__dict__.keys()):
+        if key not in ['st', 'event', '_store']:
+            checksum.update(
+                '{0}: {1}'.format(key, template.__dict__[key]).encode())
+    if template.st is not None:
+        for tr in sorted(template.st, key=lambda tr: tr.id):
+            checksum.update('{0} {1} {2} {3}'.format(
+                tr.id, tr.stats.starttime, tr.stats.sampling_rate,
+                tr.data.dtype).encode())
+            checksum.update(np.ascontiguousarray(tr.data).tobytes())
+    return checksum.hexdigest()
+
+
+def _event_checksum(event):
+    """
+    Checksum of a template event.
+
+    :type event: :class:`obspy.core.event.Event`
+    :param event: Event to get the checksum for.
+
+    :return: str
+    """
+    if event is None:
+        return 'None'
+    # The representation of event attributes is retained through QuakeML
+    # round-trips, unlike pickles of the event.
+    attributes = sorted((key, value) for key, value in event.__dict__.items()
+                        if not key.startswith('_'))
+    return hashlib.md5(repr(attributes).encode()).hexdigest()
+
+
+def _template_in_file(template, filename):
+    """
+    Check whether a template was lazily read from a file and not modified.
+
+    :type template: :class:`eqcorrscan.core.match_filter.Template`
+    :param template: Template to check.
+    :type filename: str
+    :param filename: Miniseed file to check against.
+
+    :return: bool
+    """
+    store = template.__dict__.get('_store')
+    if store is None or 'st' in template.__dict__:
+        return False
+    source = store.files.get(template.name)
+    return source is not None and _resolved(source) == _resolved(filename)
+
+
+def _read_manifest(dirname):
+    """
+    Read the checksum manifest of a tribe directory.
+
+    :type dirname: str
+    :param dirname: Tribe directory.
+
+    :return: dict of (waveform, event) checksums keyed by template name.
+    """
+    manifest = {}
+    manifest_file = os.path.join(dirname, 'tribe_manifest.csv')
+    if not os.path.isfile(manifest_file):
+        return manifest
+    with open(manifest_file, 'r') as f:
+        for line in f:
+            name, waveform_checksum, event_checksum = [
+                part.strip() for part in line.split(',')]
+            manifest.update({name: (waveform_checksum, event_checksum)})
+    return manifest
+
+
+def _write_manifest(dirname, manifest):
+    """
+    Write the checksum manifest of a tribe directory.
+
+    :type dirname: str
+    :param dirname: Tribe directory.
+    :type manifest: dict
+    :param manifest: (waveform, event) checksums keyed by template name.
+    """
+    with open(os.path.join(dirname, 'tribe_manifest.csv'), 'w') as f:
+        for name in sorted(manifest.keys()):
+            f.write('{0}, {1}, {2}\n'.format(name, *manifest[name]))
+
+
+def _update_archive(dirname, names, rewrite=False):
+    """
+    Update the compressed tar archive of an incrementally written directory.
+
+    The files in `names` are appended to `dirname + '.tgz'` as a new gzip
+    member, so unchanged files are not re-compressed. Archive members are
+    written without end-of-archive blocks, and appended files supersede
+    earlier members of the same name when the archive is read. The whole
+    directory is re-archived if `rewrite` is True, if the archive was not
+    written by the last update, or if more than half of the archived data
+    have been superseded.
+
+    :type dirname: str
+    :param dirname: Directory to archive.
+    :type names: list
+    :param names: Names of files in `dirname` that have changed.
+    :type rewrite: bool
+    :param rewrite:
+        Whether to re-archive the whole directory, needed if files have been
+        removed from it.
+    """
+    archive = dirname + '.tgz'
+    state_file = os.path.join(dirname, 'tribe_archive.csv')
+    state = None
+    if os.path.isfile(state_file):
+        with open(state_file, 'r') as f:
+            state = [int(part) for part in f.read().split(',')]
+    files = [name for name in sorted(os.listdir(dirname))
+             if name != os.path.basename(state_file)]
+    sizes = {name: os.path.getsize(os.path.join(dirname, name))
+             for name in files}
+    names = sorted(set(names))
+    if rewrite or state is None or not os.path.isfile(archive) or \
+            os.path.getsize(archive) != state[0] or \
+            state[1] + sum(sizes[name] for name in names) > \
+            2 * sum(sizes.values()):
+        names, archived, mode = files, 0, 'wb'
+    else:
+        archived, mode = state[1], 'ab'
+    arcname = os.path.basename(dirname)
+    with gzip.open(archive, mode) as f:
+        for name in names:
+            info = tarfile.TarInfo(arcname + '/' + name)
+            info.size = sizes[name]
+            info.mtime = os.path.getmtime(os.path.join(dirname, name))
+            f.write(info.tobuf())
+            with open(os.path.join(dirname, name), 'rb') as member:
+                shutil.copyfileobj(member, f)
+            remainder = info.size % tarfile.BLOCKSIZE
+            if remainder:
+                f.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            archived += info.size
+    with open(state_file, 'w') as f:
+        f.write('{0}, {1}'.format(os.path.getsize(archive), archived))
+    return
+
+
+def _write_journal_window(dirname, index, starttime, endtime, party):
+    """
+    Append the detections of a completed window to a progress journal.
+
+    Detections are written to their own file, then the window is appended to
+    the journal manifest, so windows in the manifest are always complete.
+
+    :type dirname: str
+    :param dirname: Journal directory, created if needed.
+    :type index: int
+    :param index: Index of the window.
+    :type starttime: `obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Start of the window.
+    :type endtime: `obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: End of the window.
+    :type party: :class:`eqcorrscan.core.match_filter.Party`
+    :param party: Detections made in the window.
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    filename = 'window_{0:06d}_detections.npz'.format(index)
+    detections = [d for family in party for d in family.detections]
+    _write_family_npz(
+        family=Family(template=None, detections=detections),
+        filename=os.path.join(dirname, filename + '.tmp'))
+    os.rename(os.path.join(dirname, filename + '.tmp'),
+              os.path.join(dirname, filename))
+    with open(os.path.join(dirname, 'journal_manifest.csv'), 'a') as f:
+        f.write('{0}, {1}, {2}, {3}\n'.format(
+            index, starttime, endtime, filename))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _clear_journal(dirname):
+    """
+    Remove the windows and manifest of a progress journal.
+
+    :type dirname: str
+    :param dirname: Journal directory.
+    """
+    windows = _read_journal_manifest(dirname)
+    if len(windows) > 0:
+        warnings.warn("Removing previous progress journal in {0}".format(
+            dirname))
+    for _, _, filename in windows.values():
+        os.remove(os.path.join(dirname, filename))
+    manifest_file = os.path.join(dirname, 'journal_manifest.csv')
+    if os.path.isfile(manifest_file):
+        os.remove(manifest_file)
+
+
+def _read_journal_manifest(dirname):
+    """
+    Read the manifest of completed windows of a progress journal.
+
+    :type dirname: str
+    :param dirname: Journal directory.
+
+    :return:
+        dict of (starttime, endtime, filename) of completed windows keyed by
+        window index.
+    """
+    windows = {}
+    manifest_file = os.path.join(dirname, 'journal_manifest.csv')
+    if not os.path.isfile(manifest_file):
+        return windows
+    with open(manifest_file, 'r') as f:
+        for line in f:
+            parts = [part.strip() for part in line.split(',')]
+            if len(parts) != 4 or not os.path.isfile(
+                    os.path.join(dirname, parts[3])):
+                # Incomplete final line from an interrupted run
+                continue
+            windows.update({int(parts[0]): (
+                UTCDateTime(parts[1]), UTCDateTime(parts[2]), parts[3])})
+    return windows
+
+
+def _read_journal(dirname, templates, windows=None):
+    """
+    Assemble a Party from the windows of a progress journal.
+
+    :type dirname: str
+    :param dirname: Journal directory.
+    :type templates: list
+    :param templates: Templates that made the detections.
+    :type windows: dict
+    :param windows:
+        Windows to read, as returned by `_read_journal_manifest`, defaults to
+        all completed windows.
+
+    :return: :class:`eqcorrscan.core.match_filter.Party`
+    """
+    if windows is None:
+        windows = _read_journal_manifest(dirname)
+    families = OrderedDict(
+        (template.name, Family(template=template)) for template in templates)
+    for index in sorted(windows.keys()):
+        for detection in _read_family_npz(
+                fname=os.path.join(dirname, windows[index][2]), all_cat={},
+                template=None):
+            family = families.get(detection.template_name)
+            if family is None:
+                raise MatchFilterError(
+                    "Template {0} in journal is not in the Tribe".format(
+                        detection.template_name))
+            detection._calculate_event(template=family.template)
+            family.detections.append(detection)
+    return Party(families=list(families.values()))
+
+
 def _resolved(x):
     return os.path.realpath(os.path.abspath(x))
 
@@ -3725,6 +4878,211 @@ def _safemembers(members):
             yield finfo
 
 
+def _party_members(members, template_names):
+    """
+    Select the members of a Party archive needed for a set of templates.
+
+    :type members: list
+    :param members: Iterable of :class:`tarfile.TarInfo` to select from.
+    :type template_names: list
+    :param template_names: Names of the templates to keep.
+
+    :return: generator of :class:`tarfile.TarInfo`
+    """
+    keep = set()
+    for name in template_names:
+        keep.add(name + '.ms')
+        for detection_format in DET_FORMATS:
+            keep.add(name + '_detections.' + detection_format)
+    for finfo in members:
+        basename = finfo.name.split('/')[-1]
+        if finfo.isdir() or basename in keep or \
+                basename == 'template_parameters.csv' or \
+                basename.startswith('tribe_cat.') or \
+                basename.startswith('catalog.'):
+            yield finfo
+
+
+def _write_catalog(catalog, filename, format="QUAKEML"):
+    """
+    Write a catalog to file in one of the formats in CAT_EXT_MAP.
+
+    :type catalog: :class:`obspy.core.event.Catalog`
+    :param catalog: Catalog to write.
+    :type filename: str
+    :param filename: File to write to.
+    :type format: str
+    :param format: Format to write in.
+    """
+    if format == "NPZ":
+        _write_catalog_npz(catalog=catalog, filename=filename)
+    else:
+        catalog.write(filename, format=format)
+    return
+
+
+def _read_catalog(fname):
+    """
+    Read a catalog written by `_write_catalog`.
+
+    :type fname: str
+    :param fname: Filename or open binary file to read from.
+
+    :return: :class:`obspy.core.event.Catalog`
+    """
+    if not hasattr(fname, 'read'):
+        with open(fname, 'rb') as f:
+            return _read_catalog(f)
+    # npz files are zip archives
+    is_npz = fname.read(4) == b'PK\x03\x04'
+    fname.seek(0)
+    if is_npz:
+        return _read_catalog_npz(fname)
+    return read_events(fname)
+
+
+def _write_catalog_npz(catalog, filename):
+    """
+    Write a catalog to a binary, columnar numpy file.
+
+    Only resource ids, comments, origin locations and times, magnitudes and
+    picks (time, waveform id, phase hint, onset, polarity and evaluation
+    mode) are written. Times are stored as integer nanoseconds, and the rows
+    of each event are indexed by offset columns.
+
+    :type catalog: :class:`obspy.core.event.Catalog`
+    :param catalog: Catalog to write.
+    :type filename: str
+    :param filename: File to write to.
+    """
+    def _str(value):
+        return '' if value is None else str(value)
+
+    def _float(value):
+        return np.nan if value is None else value
+
+    def _ns(time):
+        return NO_TIME if time is None else time.ns
+
+    rows = {key: [] for key in [
+        'event_id', 'preferred_origin_id', 'preferred_magnitude_id',
+        'comment_text', 'origin_id', 'origin_time', 'origin_latitude',
+        'origin_longitude', 'origin_depth', 'magnitude_id', 'magnitude_mag',
+        'magnitude_type', 'pick_id', 'pick_time', 'pick_network',
+        'pick_station', 'pick_location', 'pick_channel', 'pick_phase_hint',
+        'pick_onset', 'pick_polarity', 'pick_evaluation_mode']}
+    offsets = {key: [0] for key in ['comment', 'origin', 'magnitude', 'pick']}
+    for event in catalog:
+        rows['event_id'].append(str(event.resource_id))
+        rows['preferred_origin_id'].append(_str(event.preferred_origin_id))
+        rows['preferred_magnitude_id'].append(
+            _str(event.preferred_magnitude_id))
+        rows['comment_text'].extend(
+            [_str(comment.text) for comment in event.comments])
+        for origin in event.origins:
+            rows['origin_id'].append(str(origin.resource_id))
+            rows['origin_time'].append(_ns(origin.time))
+            rows['origin_latitude'].append(_float(origin.latitude))
+            rows['origin_longitude'].append(_float(origin.longitude))
+            rows['origin_depth'].append(_float(origin.depth))
+        for magnitude in event.magnitudes:
+            rows['magnitude_id'].append(str(magnitude.resource_id))
+            rows['magnitude_mag'].append(_float(magnitude.mag))
+            rows['magnitude_type'].append(_str(magnitude.magnitude_type))
+        for pick in event.picks:
+            waveform_id = pick.waveform_id or WaveformStreamID()
+            rows['pick_id'].append(str(pick.resource_id))
+            rows['pick_time'].append(_ns(pick.time))
+            rows['pick_network'].append(_str(waveform_id.network_code))
+            rows['pick_station'].append(_str(waveform_id.station_code))
+            rows['pick_location'].append(
+                _str(waveform_id.location_code))
+            rows['pick_channel'].append(_str(waveform_id.channel_code))
+            rows['pick_phase_hint'].append(_str(pick.phase_hint))
+            rows['pick_onset'].append(_str(pick.onset))
+            rows['pick_polarity'].append(_str(pick.polarity))
+            rows['pick_evaluation_mode'].append(_str(pick.evaluation_mode))
+        for key, attribute in [('comment', 'comments'), ('origin', 'origins'),
+                               ('magnitude', 'magnitudes'),
+                               ('pick', 'picks')]:
+            offsets[key].append(
+                offsets[key][-1] + len(event.__dict__[attribute]))
+    columns = {}
+    for key, values in rows.items():
+        if key in ['origin_time', 'pick_time']:
+            columns[key] = np.array(values, dtype=np.int64)
+        elif key in ['origin_latitude', 'origin_longitude', 'origin_depth',
+                     'magnitude_mag']:
+            columns[key] = np.array(values, dtype=np.float64)
+        else:
+            columns[key] = np.array(values, dtype=np.str_)
+    for key, values in offsets.items():
+        columns[key + '_offset'] = np.array(values, dtype=np.int64)
+    with open(filename, 'wb') as f:
+        np.savez(f, **columns)
+    return
+
+
+def _read_catalog_npz(fname):
+    """
+    Read a catalog written by `_write_catalog_npz`.
+
+    :type fname: str
+    :param fname: Filename or open binary file to read from.
+
+    :return: :class:`obspy.core.event.Catalog`
+    """
+    def _str(value):
+        return value if len(value) > 0 else None
+
+    def _float(value):
+        return None if np.isnan(value) else value
+
+    def _time(ns):
+        return None if ns == NO_TIME else UTCDateTime(ns=ns)
+
+    with np.load(fname, allow_pickle=False) as columns:
+        columns = {key: columns[key].tolist() for key in columns.files}
+    catalog = Catalog()
+    for i, event_id in enumerate(columns['event_id']):
+        event = Event(resource_id=ResourceIdentifier(event_id))
+        if len(columns['preferred_origin_id'][i]) > 0:
+            event.preferred_origin_id = ResourceIdentifier(
+                columns['preferred_origin_id'][i])
+        if len(columns['preferred_magnitude_id'][i]) > 0:
+            event.preferred_magnitude_id = ResourceIdentifier(
+                columns['preferred_magnitude_id'][i])
+        for j in range(*columns['comment_offset'][i:i + 2]):
+            event.comments.append(Comment(text=columns['comment_text'][j]))
+        for j in range(*columns['origin_offset'][i:i + 2]):
+            event.origins.append(Origin(
+                resource_id=ResourceIdentifier(columns['origin_id'][j]),
+                time=_time(columns['origin_time'][j]),
+                latitude=_float(columns['origin_latitude'][j]),
+                longitude=_float(columns['origin_longitude'][j]),
+                depth=_float(columns['origin_depth'][j])))
+        for j in range(*columns['magnitude_offset'][i:i + 2]):
+            event.magnitudes.append(Magnitude(
+                resource_id=ResourceIdentifier(columns['magnitude_id'][j]),
+                mag=_float(columns['magnitude_mag'][j]),
+                magnitude_type=_str(columns['magnitude_type'][j])))
+        for j in range(*columns['pick_offset'][i:i + 2]):
+            event.picks.append(Pick(
+                resource_id=ResourceIdentifier(columns['pick_id'][j]),
+                time=_time(columns['pick_time'][j]),
+                waveform_id=WaveformStreamID(
+                    network_code=columns['pick_network'][j],
+                    station_code=columns['pick_station'][j],
+                    location_code=columns['pick_location'][j],
+                    channel_code=columns['pick_channel'][j]),
+                phase_hint=_str(columns['pick_phase_hint'][j]),
+                onset=_str(columns['pick_onset'][j]),
+                polarity=_str(columns['pick_polarity'][j]),
+                evaluation_mode=_str(columns['pick_evaluation_mode'][j])))
+        catalog.append(event)
+    return catalog
+
+
 def _write_family(family, filename):
     """
     Write a family to a csv file.
@@ -3738,6 +5096,9 @@ def _write_family(family, filename):
         for detection in family.detections:
             det_str = ''
             for key in detection.__dict__.keys():
+                if key == 'correlations':
+                    # Correlations are only kept in memory for lag_calc
+                    continue
                 if key == 'event' and detection.__dict__[key] is not None:
                     value = str(detection.event.resource_id)
                 elif key in ['threshold', 'detect_val', 'threshold_input']:
@@ -3749,12 +5110,190 @@ def _write_family(family, filename):
     return
 
 
-def _read_family(fname, all_cat, template):
+def _write_family_npz(family, filename):
+    """
+    Write a family to a binary, columnar numpy file.
+
+    Each Detection attribute is stored as a typed column, detection times
+    are stored as integer nanoseconds and channels are stored as indexes
+    into a table of unique (station, channel) pairs.
+
+    :type family: :class:`eqcorrscan.core.match_filter.Family`
+    :param family: Family to write to file
+    :type filename: str
+    :param filename: File to write to.
+    """
+    chan_table = {}
+    chan_index, chan_offset = [], [0]
+    for detection in family.detections:
+        for chan in detection.chans:
+            if chan is None:
+                continue
+            chan = tuple(chan)
+            if chan not in chan_table:
+                chan_table.update({chan: len(chan_table)})
+            chan_index.append(chan_table[chan])
+        chan_offset.append(len(chan_index))
+    if len(chan_table) == 0:
+        chan_array = np.empty((0, 2), dtype=np.str_)
+    else:
+        chan_array = np.array(sorted(chan_table, key=chan_table.get),
+                              dtype=np.str_)
+    detections = family.detections
+    columns = {
+        'template_name': np.array(
+            [d.template_name for d in detections], dtype=np.str_),
+        'detect_time': np.array(
+            [d.detect_time.ns for d in detections], dtype=np.int64),
+        'no_chans': np.array(
+            [d.no_chans for d in detections], dtype=np.int32),
+        'detect_val': np.array(
+            [d.detect_val for d in detections], dtype=np.float32),
+        'threshold': np.array(
+            [d.threshold for d in detections], dtype=np.float32),
+        'threshold_input': np.array(
+            [d.threshold_input for d in detections], dtype=np.float64),
+        'threshold_type': np.array(
+            [d.threshold_type for d in detections], dtype=np.str_),
+        'typeofdet': np.array(
+            [d.typeofdet for d in detections], dtype=np.str_),
+        'id': np.array([d.id for d in detections], dtype=np.str_),
+        'event': np.array(
+            [str(d.event.resource_id) if d.event is not None else ''
+             for d in detections], dtype=np.str_),
+        'chan_table': chan_array,
+        'chan_index': np.array(chan_index, dtype=np.int32),
+        'chan_offset': np.array(chan_offset, dtype=np.int64)}
+    with open(filename, 'wb') as f:
+        np.savez(f, **columns)
+    return
+
+
+def _read_family_npz(fname, all_cat, template, starttime=None,
+                     endtime=None):
+    """
+    Internal function to read binary family files.
+
+    Columns are loaded on access, so the detection-time column is used to
+    select detections before any other column is decoded.
+
+    :type fname: str
+    :param fname: Filename
+    :type all_cat: dict
+    :param all_cat:
+        Detection events keyed by resource id (see `_index_events`), can be
+        empty, in which case events will be regenerated from the template.
+    :type template: :class:`eqcorrscan.core.match_filter.Template`
+    :param template:
+        Template used to regenerate events if needed, if None events are not
+        regenerated.
+    :type starttime: `obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Only read detections made at or after this time.
+    :type endtime: `obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Only read detections made at or before this time.
+
+    :return: list of Detection
+    """
+    return _npz_detections(
+        columns=_read_family_columns(
+            fname=fname, starttime=starttime, endtime=endtime),
+        all_cat=all_cat, template=template)
+
+
+def _read_family_columns(fname, starttime=None, endtime=None):
+    """
+    Read the columns of the selected detections from a binary family file.
+
+    :type fname: str
+    :param fname: Filename
+    :type starttime: `obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Only read detections made at or after this time.
+    :type endtime: `obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Only read detections made at or before this time.
+
+    :return:
+        dict of column arrays of the selected detections, with the channels
+        of each detection as a list of (station, channel) tuples.
+    """
+    with np.load(fname, allow_pickle=False) as columns:
+        detect_times = columns['detect_time']
+        mask = np.ones(len(detect_times), dtype=bool)
+        if starttime is not None:
+            mask &= detect_times >= UTCDateTime(starttime).ns
+        if endtime is not None:
+            mask &= detect_times <= UTCDateTime(endtime).ns
+        indexes = np.flatnonzero(mask)
+        rows = {key: columns[key][indexes] for key in [
+            'template_name', 'no_chans', 'detect_val', 'threshold',
+            'threshold_input', 'threshold_type', 'typeofdet', 'id', 'event']}
+        rows['detect_time'] = detect_times[indexes]
+        if len(indexes) == 0:
+            rows['chans'] = []
+            return rows
+        chan_table = [tuple(chan) for chan in columns['chan_table'].tolist()]
+        chan_index = columns['chan_index']
+        chan_offset = columns['chan_offset']
+    rows['chans'] = [
+        [chan_table[j] for j in
+         chan_index[chan_offset[index]:chan_offset[index + 1]]]
+        for index in indexes]
+    return rows
+
+
+def _npz_detections(columns, all_cat, template):
+    """
+    Build Detections from the columns read by `_read_family_columns`.
+
+    :type columns: dict
+    :param columns: Column arrays of detections.
+    :type all_cat: dict
+    :param all_cat:
+        Detection events keyed by resource id (see `_index_events`), can be
+        empty, in which case events will be regenerated from the template.
+    :type template: :class:`eqcorrscan.core.match_filter.Template`
+    :param template:
+        Template used to regenerate events if needed, if None events are not
+        regenerated.
+
+    :return: list of Detection
+    """
+    rows = {key: value.tolist() for key, value in columns.items()
+            if key != 'chans'}
+    detections = []
+    for i, chans in enumerate(columns['chans']):
+        detection = Detection(
+            template_name=rows['template_name'][i],
+            detect_time=UTCDateTime(ns=rows['detect_time'][i]),
+            no_chans=rows['no_chans'][i], detect_val=rows['detect_val'][i],
+            threshold=rows['threshold'][i],
+            threshold_input=rows['threshold_input'][i],
+            threshold_type=rows['threshold_type'][i],
+            typeofdet=rows['typeofdet'][i], chans=chans or None,
+            id=rows['id'][i],
+            event=all_cat.get(rows['event'][i].split('/')[-1]))
+        if len(all_cat) == 0 and template is not None:
+            detection._calculate_event(template=template)
+        detections.append(detection)
+    return detections
+
+
+def _read_family(fname, all_cat, template, starttime=None, endtime=None):
     """
     Internal function to read csv family files.
 
     :type fname: str
     :param fname: Filename
+    :type all_cat: dict
+    :param all_cat:
+        Detection events keyed by resource id (see `_index_events`), can be
+        empty, in which case events will be regenerated from the template.
+    :type template: :class:`eqcorrscan.core.match_filter.Template`
+    :param template: Template used to regenerate events if needed.
+    :type starttime: `obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Only read detections made at or after this time.
+    :type endtime: `obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Only read detections made at or before this time.
+
     :return: list of Detection
     """
     detections = []
@@ -3769,9 +5308,7 @@ def _read_family(fname, all_cat, template):
                     if len(all_cat) == 0:
                         gen_event = True
                         continue
-                    el = [e for e in all_cat
-                          if str(e.resource_id).split('/')[-1] == value][0]
-                    det_dict.update({'event': el})
+                    det_dict.update({'event': all_cat[value.split('/')[-1]]})
                 elif key == 'detect_time':
                     det_dict.update(
                         {'detect_time': UTCDateTime(value)})
@@ -3786,6 +5323,11 @@ def _read_family(fname, all_cat, template):
                     continue
                 else:
                     det_dict.update({key: float(value)})
+            if starttime is not None and \
+                    det_dict['detect_time'] < starttime:
+                continue
+            if endtime is not None and det_dict['detect_time'] > endtime:
+                continue
             detection = Detection(**det_dict)
             if gen_event:
                 detection._calculate_event(template=template)
@@ -3793,19 +5335,24 @@ def _read_family(fname, all_cat, template):
     return detections
 
 
-def read_tribe(fname):
+def read_tribe(fname, cores=None, lazy=False, cache_size=None):
     """
     Read a Tribe of templates from a tar archive.
 
     :param fname: Filename to read from
+    :param cores: Number of threads to use to decode template waveforms.
+    :param lazy: Whether to read template waveforms on first access or not.
+    :param cache_size:
+        Maximum number of template waveforms to keep in memory if lazy.
     :return: :class:`eqcorrscan.core.match_filter.Tribe`
     """
     tribe = Tribe()
-    tribe.read(filename=fname)
+    tribe.read(filename=fname, cores=cores, lazy=lazy, cache_size=cache_size)
     return tribe
 
 
-def read_party(fname=None, read_detection_catalog=True):
+def read_party(fname=None, read_detection_catalog=True, template_names=None,
+               starttime=None, endtime=None, lazy=False):
     """
     Read detections and metadata from a tar archive.
 
@@ -3817,11 +5364,25 @@ def read_party(fname=None, read_detection_catalog=True):
     :param read_detection_catalog:
         Whether to read the detection catalog or not, if False, catalog
         will be regenerated - for large catalogs this can be faster.
+    :type template_names: list
+    :param template_names:
+        Names of the families to read, defaults to reading all families.
+    :type starttime: `obspy.core.utcdatetime.UTCDateTime`
+    :param starttime: Only read detections made at or after this time.
+    :type endtime: `obspy.core.utcdatetime.UTCDateTime`
+    :param endtime: Only read detections made at or before this time.
+    :type lazy: bool
+    :param lazy:
+        Whether to build the Detections of families written with
+        `detection_format='npz'` when they are first accessed, rather than
+        on reading.
 
     :return: :class:`eqcorrscan.core.match_filter.Party`
     """
     party = Party()
-    party.read(filename=fname, read_detection_catalog=read_detection_catalog)
+    party.read(filename=fname, read_detection_catalog=read_detection_catalog,
+               template_names=template_names, starttime=starttime,
+               endtime=endtime, lazy=lazy)
     return party
 
 
@@ -3924,6 +5485,11 @@ def extract_from_stream(stream, detections, pad=5.0, length=30.0):
     """
     Extract waveforms for a list of detections from a stream.
 
+    The stream is indexed once, and the windows for all picks on a channel
+    are found together; only picks whose windows are not within a single
+    trace are cut with :meth:`obspy.core.stream.Stream.slice`. See
+    :func:`extract_array_from_stream` to extract into one array.
+
     :type stream: obspy.core.stream.Stream
     :param stream: Stream containing the detections.
     :type detections: list
@@ -3937,23 +5503,219 @@ def extract_from_stream(stream, detections, pad=5.0, length=30.0):
         list of :class:`obspy.core.stream.Stream`, one for each detection.
     :type: list
     """
-    streams = []
-    for detection in detections:
-        cut_stream = Stream()
-        for pick in detection.event.picks:
-            tr = stream.select(station=pick.waveform_id.station_code,
-                               channel=pick.waveform_id.channel_code)
-            if len(tr) == 0:
-                print('No data in stream for pick:')
-                print(pick)
-                continue
-            cut_stream += tr.slice(
-                starttime=pick.time - pad,
-                endtime=pick.time - pad + length).copy()
-        streams.append(cut_stream)
+    index = _index_stream(stream)
+    picks = [(i, pick) for i, detection in enumerate(detections)
+             for pick in detection.event.picks]
+    windows = {}
+    for key, positions in _group_picks(picks).items():
+        traces = index.get(key, [])
+        if len(traces) != 1:
+            continue
+        starts, n_samples = _window_offsets(
+            traces[0], [picks[p][1].time for p in positions], pad, length)
+        for p, start, n in zip(positions, starts, n_samples):
+            if start >= 0 and start + n <= traces[0].stats.npts:
+                windows.update({p: (traces[0], start, n)})
+    streams = [Stream() for _ in detections]
+    for p, (i, pick) in enumerate(picks):
+        if p in windows:
+            tr, start, n = windows[p]
+            streams[i] += _window_trace(
+                tr, start, tr.data[start:start + n].copy())
+            continue
+        tr = Stream(index.get((pick.waveform_id.station_code,
+                               pick.waveform_id.channel_code), []))
+        if len(tr) == 0:
+            print('No data in stream for pick:')
+            print(pick)
+            continue
+        streams[i] += tr.slice(
+            starttime=pick.time - pad,
+            endtime=pick.time - pad + length).copy()
     return streams
 
 
+def extract_array_from_stream(stream, detections, pad=5.0, length=30.0,
+                              return_streams=False):
+    """
+    Extract waveforms for a list of detections from a stream into one array.
+
+    Windows for all picks on a channel are cut in one NumPy operation. All
+    picked channels must have the same sampling rate. If a detection has more
+    than one pick on a channel, only the first is used.
+
+    :type stream: obspy.core.stream.Stream
+    :param stream: Stream containing the detections.
+    :type detections: list
+    :param detections: list of eqcorrscan.core.match_filter.detection
+    :type pad: float
+    :param pad: Pre-detection extract time in seconds.
+    :type length: float
+    :param length: Total extracted length in seconds.
+    :type return_streams: bool
+    :param return_streams:
+        Whether to also return the windows as a list of Streams, one for each
+        detection, with trace data that are views of the array.
+
+    :returns:
+        Array of shape (n_detections, n_channels, n_samples), list of
+        (station, channel) for the second axis and boolean array of shape
+        (n_detections, n_channels) of which windows were extracted. Windows
+        without data, or with only part of the window in the stream, are
+        zeros. If return_streams is True, the list of Streams is returned as
+        a fourth item.
+
+    .. rubric:: Example
+
+    >>> from obspy import Trace, Stream, UTCDateTime
+    >>> from obspy.core.event import Event, Pick, WaveformStreamID
+    >>> stream = Stream([Trace(
+    ...     data=np.arange(1000, dtype=np.float32), header={
+    ...         'station': sta, 'channel': 'HHZ', 'sampling_rate': 10.0})
+    ...     for sta in ['A', 'B']])
+    >>> detections = []
+    >>> for time in [10, 50]:
+    ...     detection = Detection(
+    ...         template_name='a', detect_time=UTCDateTime(time), no_chans=1,
+    ...         detect_val=1, threshold=0.5, typeofdet='corr',
+    ...         threshold_type='abs', threshold_input=0.5)
+    ...     detection.event = Event(picks=[Pick(
+    ...         time=UTCDateTime(time), waveform_id=WaveformStreamID(
+    ...             station_code='A', channel_code='HHZ'))])
+    ...     detections.append(detection)
+    >>> data, chans, valid = extract_array_from_stream(
+    ...     stream, detections, pad=1.0, length=2.0)
+    >>> print(data.shape)
+    (2, 1, 21)
+    >>> print(chans)
+    [('A', 'HHZ')]
+    >>> print(data[:, 0, 0].tolist())
+    [90.0, 490.0]
+    """
+    index = _index_stream(stream)
+    picks = [(i, pick) for i, detection in enumerate(detections)
+             for pick in detection.event.picks]
+    groups = _group_picks(picks)
+    chans = list(groups.keys())
+    sampling_rates = set(tr.stats.sampling_rate for key in chans
+                         for tr in index.get(key, []))
+    if len(sampling_rates) > 1:
+        raise MatchFilterError(
+            "Picked channels have different sampling rates: {0}".format(
+                sampling_rates))
+    sampling_rate = sampling_rates.pop() if sampling_rates else 1.0
+    n_samples = int(round(length * sampling_rate)) + 1
+    dtypes = [tr.data.dtype for key in chans for tr in index.get(key, [])]
+    data = np.zeros((len(detections), len(chans), n_samples),
+                    dtype=np.result_type(*dtypes) if dtypes else np.float64)
+    valid = np.zeros((len(detections), len(chans)), dtype=bool)
+    sources = {}
+    for j, key in enumerate(chans):
+        # Only use the first pick of each detection on this channel
+        first = OrderedDict()
+        for p in groups[key]:
+            first.setdefault(picks[p][0], p)
+        positions = list(first.values())
+        detection_index = np.array(list(first.keys()), dtype=np.int64)
+        for tr in index.get(key, []):
+            starts, _ = _window_offsets(
+                tr, [picks[p][1].time for p in positions], pad, length)
+            use = ((starts >= 0) & (starts + n_samples <= tr.stats.npts) &
+                   ~valid[detection_index, j])
+            if not use.any():
+                continue
+            data[detection_index[use], j] = tr.data[
+                starts[use, np.newaxis] + np.arange(n_samples)]
+            valid[detection_index[use], j] = True
+            if return_streams:
+                for d, start in zip(detection_index[use], starts[use]):
+                    sources.update({(d, j): (tr, start)})
+    if not return_streams:
+        return data, chans, valid
+    streams = [Stream() for _ in detections]
+    for (d, j), (tr, start) in sorted(sources.items()):
+        streams[d] += _window_trace(tr, start, data[d, j])
+    return data, chans, valid, streams
+
+
+def _index_stream(stream):
+    """
+    Index the traces of a stream by station and channel.
+
+    :returns: dict of lists of traces keyed by (station, channel).
+    """
+    index = OrderedDict()
+    for tr in stream:
+        index.setdefault(
+            (tr.stats.station, tr.stats.channel), []).append(tr)
+    return index
+
+
+def _group_picks(picks):
+    """
+    Group picks by station and channel.
+
+    :type picks: list
+    :param picks: List of (detection index, pick) tuples.
+
+    :returns: dict of lists of positions in picks keyed by (station, channel).
+    """
+    groups = OrderedDict()
+    for p, (_, pick) in enumerate(picks):
+        groups.setdefault(
+            (pick.waveform_id.station_code, pick.waveform_id.channel_code),
+            []).append(p)
+    return groups
+
+
+def _round_away(x):
+    """Round to the nearest integer, with halves rounded away from zero."""
+    return (np.sign(x) * np.floor(np.abs(x) + 0.5)).astype(np.int64)
+
+
+def _window_offsets(tr, pick_times, pad, length):
+    """
+    Compute the samples of a trace cut around many picks.
+
+    Offsets are computed as :meth:`obspy.core.trace.Trace.slice` would for
+    a window from pick - pad to pick - pad + length.
+
+    :type tr: obspy.core.trace.Trace
+    :param tr: Trace to cut from.
+    :type pick_times: list
+    :param pick_times: List of `obspy.core.utcdatetime.UTCDateTime`
+    :type pad: float
+    :param pad: Pre-pick time in seconds.
+    :type length: float
+    :param length: Window length in seconds.
+
+    :returns:
+        Arrays of the first sample of each window and the number of samples
+        in each window. Start samples may be negative, and windows may extend
+        beyond the end of the trace.
+    """
+    trace_start = tr.stats.starttime.ns
+    starttimes = np.array([t.ns for t in pick_times], dtype=np.int64) - \
+        int(round(pad * 1e9))
+    endtimes = starttimes + int(round(length * 1e9))
+    starts = _round_away(np.round(
+        (starttimes - trace_start) / 1e9, 6) * tr.stats.sampling_rate)
+    # Slicing moves the start-time to the first sample kept
+    window_start = trace_start + np.round(
+        np.maximum(starts, 0) * tr.stats.delta * 1e9).astype(np.int64)
+    n_samples = _round_away(np.round(
+        (endtimes - window_start) / 1e9, 6) * tr.stats.sampling_rate) + 1
+    return starts, n_samples
+
+
+def _window_trace(tr, start, data):
+    """Make a trace of data cut from tr starting at sample start."""
+    header = tr.stats.copy()
+    header.starttime = tr.stats.starttime + start * tr.stats.delta
+    header.npts = len(data)
+    return Trace(data=data, header=header)
+
+
 def normxcorr2(template, image):
     """
     Thin wrapper to eqcorrscan.utils.correlate functions.
@@ -4002,7 +5764,8 @@ def match_filter(template_names, template_list, st, threshold,
                  xcorr_func=None, concurrency=None, cores=None,
                  debug=0, plot_format='png', output_cat=False,
                  output_event=True, extract_detections=False,
-                 arg_check=True, full_peaks=False, peak_cores=None, **kwargs):
+                 arg_check=True, full_peaks=False, peak_cores=None,
+                 retain_correlations=None, **kwargs):
     """
     Main matched-filter detection function.
 
@@ -4081,6 +5844,14 @@ def match_filter(template_names, template_list, st, threshold,
     :param peak_cores:
         Number of processes to use for parallel peak-finding (if different to
         `cores`).
+    :type retain_correlations: float
+    :param retain_correlations:
+        Shift length in seconds: if set, the correlation function of each
+        template channel within plus/minus this length of each detection is
+        kept in `Detection.correlations`, for use by
+        :meth:`eqcorrscan.core.match_filter.Party.lag_calc`. Only the data
+        around each detection are correlated again channel-by-channel, so
+        this adds little memory or time to detection.
 
     .. note::
         **Returns:**
@@ -4281,9 +6052,11 @@ def match_filter(template_names, template_list, st, threshold,
             msg = 'Data are not equal length, padding short traces'
             warnings.warn(msg)
             start_pad = np.zeros(int(tr.stats.sampling_rate *
-                                     (tr.stats.starttime - min_start_time)))
+                                     (tr.stats.starttime - min_start_time)),
+                                 dtype=tr.data.dtype)
             end_pad = np.zeros(int(tr.stats.sampling_rate *
-                                   (max_end_time - tr.stats.endtime)))
+                                   (max_end_time - tr.stats.endtime)),
+                               dtype=tr.data.dtype)
             # In some cases there will be one sample missing when sampling
             # time-stamps are not set consistently between channels, this
             # results in start_pad and end_pad being len==0
@@ -4293,10 +6066,12 @@ def match_filter(template_names, template_list, st, threshold,
                 if (tr.stats.starttime - min_start_time) > (
                    max_end_time - tr.stats.endtime):
                     start_pad = np.zeros(
-                        int(longest_trace_length - tr.stats.npts))
+                        int(longest_trace_length - tr.stats.npts),
+                        dtype=tr.data.dtype)
                 else:
                     end_pad = np.zeros(
-                        int(longest_trace_length - tr.stats.npts))
+                        int(longest_trace_length - tr.stats.npts),
+                        dtype=tr.data.dtype)
             tr.data = np.concatenate([start_pad, tr.data, end_pad])
     # Perform check that all template lengths are internally consistent
     for i, temp in enumerate(template_list):
@@ -4449,7 +6224,12 @@ def match_filter(template_names, template_list, st, threshold,
                       stream[0].stats.starttime.datetime.strftime('%Y%j')]),
             4, debug)
         if all_peaks[i]:
-            for peak in all_peaks[i]:
+            if retain_correlations is not None:
+                correlations = _retained_correlations(
+                    stream=stream, template=templates[i],
+                    indexes=[peak[1] for peak in all_peaks[i]],
+                    shift_len=retain_correlations)
+            for j, peak in enumerate(all_peaks[i]):
                 detecttime = (
                         stream[0].stats.starttime +
                         peak[1] / stream[0].stats.sampling_rate)
@@ -4460,6 +6240,8 @@ def match_filter(template_names, template_list, st, threshold,
                     threshold_type=threshold_type, threshold_input=threshold)
                 if output_cat or output_event:
                     detection._calculate_event(template_st=templates[i])
+                if retain_correlations is not None:
+                    detection.correlations = correlations[j]
                 detections.append(detection)
                 if output_cat:
                     det_cat.append(detection.event)
@@ -4476,6 +6258,68 @@ def match_filter(template_names, template_list, st, threshold,
         return detections, det_cat, detection_streams
 
 
+def _retained_correlations(stream, template, indexes, shift_len):
+    """
+    Correlate each channel of a template with the data around detections.
+
+    Only the correlations within shift_len of each detection are computed,
+    with one call to
+    :func:`eqcorrscan.utils.correlate.multi_image_normxcorr` per channel for
+    all detections, so the correlations of each channel are never held for
+    the whole of the data.
+
+    :type stream: obspy.core.stream.Stream
+    :param stream: Data correlated, as used for correlation.
+    :type template: obspy.core.stream.Stream
+    :param template: Template correlated, as used for correlation.
+    :type indexes: list
+    :param indexes: Samples of the detections in the correlation sum.
+    :type shift_len: float
+    :param shift_len: Length in seconds to keep either side of the detection.
+
+    :returns:
+        List of Streams of correlation functions, one for each index, each
+        starting at the time of the start of the template channel, shift_len
+        before the detection. Channels without data, or too close to the
+        ends of the data, are not included.
+    :rtype: list
+    """
+    sampling_rate = template[0].stats.sampling_rate
+    shift = int(round(shift_len * sampling_rate))
+    starttime = stream[0].stats.starttime
+    template_start = min(tr.stats.starttime for tr in template)
+    correlations = [Stream() for _ in indexes]
+    for tr in template:
+        if tr.stats.get('not_in_original') or np.isnan(tr.data).any():
+            continue
+        image = stream.select(id=tr.id)
+        if len(image) == 0:
+            continue
+        image = image[0]
+        # Correlations are shifted by the delay of the channel in the template
+        pad = int(round(sampling_rate * (
+            tr.stats.starttime - template_start)))
+        offset = int(round(sampling_rate * (
+            image.stats.starttime - starttime)))
+        length = 2 * shift + len(tr.data)
+        starts = [index - shift + pad for index in indexes]
+        keep = [k for k, start in enumerate(starts)
+                if start - offset >= 0 and
+                start - offset + length <= image.stats.npts]
+        if len(keep) == 0:
+            continue
+        cccs = multi_image_normxcorr(tr.data, np.array([
+            image.data[starts[k] - offset:starts[k] - offset + length]
+            for k in keep]))
+        for k, ccc in zip(keep, cccs):
+            correlations[k] += Trace(data=ccc, header={
+                'network': tr.stats.network, 'station': tr.stats.station,
+                'location': tr.stats.location, 'channel': tr.stats.channel,
+                'sampling_rate': sampling_rate,
+                'starttime': starttime + starts[k] / sampling_rate})
+    return correlations
+
+
 if __name__ == "__main__":
     import doctest
 
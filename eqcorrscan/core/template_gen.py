@@ -78,7 +78,8 @@ def template_gen(method, lowcut, highcut, samp_rate, filt_order,
                  length, prepick, swin, process_len=86400,
                  all_horiz=False, delayed=True, plot=False, debug=0,
                  return_event=False, min_snr=None, parallel=False,
-                 num_cores=False, save_progress=False, **kwargs):
+                 num_cores=False, save_progress=False, resample_method='fft',
+                 **kwargs):
     """
     Generate processed and cut waveforms for use as templates.
 
@@ -134,6 +135,10 @@ def template_gen(method, lowcut, highcut, samp_rate, filt_order,
     :param save_progress:
         Whether to save the resulting party at every data step or not.
         Useful for long-running processes.
+    :type resample_method: str
+    :param resample_method:
+        Method to resample data with, see
+        :func:`eqcorrscan.utils.pre_processing.process`.
 
     :returns: List of :class:`obspy.core.stream.Stream` Templates
     :rtype: list
@@ -143,6 +148,10 @@ def template_gen(method, lowcut, highcut, samp_rate, filt_order,
 
         - `from_client` requires:
             :param str client_id: string passable by obspy to generate Client
+            :param client:
+                Client to use instead of client_id, any object with a
+                `get_waveforms` method, e.g. an
+                :class:`eqcorrscan.utils.archive_read.SDSArchive`
             :param `obspy.core.event.Catalog` catalog:
                 Catalog of events to generate template for
             :param float data_pad: Pad length for data-downloads in seconds
@@ -240,7 +249,9 @@ def template_gen(method, lowcut, highcut, samp_rate, filt_order,
             catalog=catalog, process_len=process_len, template_length=length,
             data_pad=data_pad)
         if method == 'from_client':
-            client = FDSNClient(kwargs.get('client_id', None))
+            client = kwargs.get('client', None)
+            if client is None:
+                client = FDSNClient(kwargs.get('client_id', None))
             available_stations = []
         else:
             client = SeisHubClient(kwargs.get('url', None), timeout=10)
@@ -312,12 +323,13 @@ def template_gen(method, lowcut, highcut, samp_rate, filt_order,
                     st=st, lowcut=lowcut, highcut=highcut,
                     filt_order=filt_order, samp_rate=samp_rate, debug=debug,
                     parallel=parallel, starttime=UTCDateTime(starttime),
-                    num_cores=num_cores)
+                    num_cores=num_cores, resample_method=resample_method)
             else:
                 st = pre_processing.shortproc(
                     st=st, lowcut=lowcut, highcut=highcut,
                     filt_order=filt_order, parallel=parallel,
-                    samp_rate=samp_rate, debug=debug, num_cores=num_cores)
+                    samp_rate=samp_rate, debug=debug, num_cores=num_cores,
+                    resample_method=resample_method)
         data_start = min([tr.stats.starttime for tr in st])
         data_end = max([tr.stats.endtime for tr in st])
 
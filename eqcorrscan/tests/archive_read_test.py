@@ -0,0 +1,155 @@
+"""
+Functions for testing the utils.archive_read functions.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import numpy as np
+
+from obspy import UTCDateTime, read
+
+from eqcorrscan.utils.archive_read import (
+    read_data, ArchiveIndex, SDSArchive, _check_available_data)
+
+
+class ArchiveReadTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.testing_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)), 'test_data',
+            'day_vols')
+        cls.day = UTCDateTime(2012, 3, 26)
+
+    def setUp(self):
+        self.archive = tempfile.mkdtemp()
+        shutil.copytree(self.testing_path, os.path.join(
+            self.archive, 'day_vols'))
+        self.day_dir = os.path.join(
+            self.archive, 'day_vols', 'Y2012', 'R086.01')
+
+    def tearDown(self):
+        shutil.rmtree(self.archive, ignore_errors=True)
+
+    def test_read_day_vols(self):
+        """Check that reading through an index file gets the data."""
+        index_file = os.path.join(self.archive, 'index.sqlite')
+        stachans = [('WHYM', 'SHZ'), ('EORO', 'SZ'), ('FOZ', 'HHZ')]
+        for _ in range(2):
+            st = read_data(
+                os.path.join(self.archive, 'day_vols'), 'day_vols',
+                self.day, stachans, index_file=index_file)
+            self.assertEqual(sorted(tr.stats.station for tr in st),
+                             ['EORO', 'WHYM'])
+            whym = read(os.path.join(
+                self.day_dir, 'WHYM.AF..SHZ.2012.086'))[0]
+            self.assertEqual(st.select(station='WHYM')[0].stats.starttime,
+                             whym.stats.starttime)
+            self.assertTrue(np.array_equal(
+                st.select(station='WHYM')[0].data, whym.data))
+        self.assertTrue(os.path.isfile(index_file))
+
+    def test_read_directory(self):
+        """Check reading from a generic directory archive."""
+        st = read_data(self.archive, 'directory', self.day + 3600,
+                       [('GOVA', 'SHZ')], length=600)
+        self.assertEqual(len(st), 1)
+        self.assertEqual(st[0].stats.starttime, self.day + 3600)
+        self.assertEqual(st[0].stats.endtime, self.day + 4200)
+        # No data on the next day
+        self.assertEqual(_check_available_data(
+            self.archive, 'directory', self.day + 86400), [])
+
+    def test_index_update(self):
+        """Check that only new and changed files are re-read."""
+        with ArchiveIndex(os.path.join(self.archive, 'index.sqlite')) as \
+                index:
+            self.assertEqual(index.update(self.day_dir), 3)
+            self.assertEqual(index.update(self.day_dir), 0)
+            self.assertEqual(
+                index.available(self.day, self.day + 86400),
+                [('EORO', 'SHZ'), ('GOVA', 'SHZ'), ('WHYM', 'SHZ')])
+        # The index should persist
+        with ArchiveIndex(os.path.join(self.archive, 'index.sqlite')) as \
+                index:
+            self.assertEqual(index.update(self.day_dir), 0)
+            eoro = os.path.join(self.day_dir, 'EORO.AF..SHZ.2012.086')
+            st = read(eoro)
+            st[0].stats.station = 'EOR2'
+            time.sleep(0.01)
+            st.write(eoro, format='MSEED')
+            os.remove(os.path.join(self.day_dir, 'GOVA.AF..SHZ.2012.086'))
+            with open(os.path.join(self.day_dir, 'README'), 'w') as f:
+                f.write('Not a waveform file')
+            self.assertEqual(index.update(self.day_dir), 2)
+            self.assertEqual(index.update(self.day_dir), 0)
+            self.assertEqual(
+                index.available(self.day, self.day + 86400),
+                [('EOR2', 'SHZ'), ('WHYM', 'SHZ')])
+            self.assertEqual(index.get_files(
+                'EOR*', 'S?Z', self.day, self.day + 10), [eoro])
+            self.assertEqual(index.get_files(
+                'EOR2', 'SHZ', self.day + 86400, self.day + 86410), [])
+
+    def _make_sds(self):
+        """Write the test day-volumes, and the following day, as SDS."""
+        root = os.path.join(self.archive, 'sds')
+        for tr in read(os.path.join(self.day_dir, '*')):
+            for _ in range(2):
+                path = os.path.join(
+                    root, '2012', tr.stats.network, tr.stats.station,
+                    tr.stats.channel + '.D')
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                tr.write(os.path.join(path, '.'.join([
+                    tr.id, 'D', '2012', tr.stats.starttime.strftime('%j')])),
+                    format='MSEED')
+                tr.stats.starttime += 86400
+        return root
+
+    def test_read_sds(self):
+        """Check windowed, cached and concurrent reads from SDS."""
+        root = self._make_sds()
+        archive = SDSArchive(root, cache_size=2, max_workers=2)
+        full = read(os.path.join(self.day_dir, 'WHYM*'))[0]
+        st = archive.get_waveforms(
+            'AF', 'WHYM', '', 'SHZ', self.day + 600, self.day + 660)
+        self.assertEqual(len(st), 1)
+        self.assertTrue(np.array_equal(st[0].data, full.data[600:661]))
+        # Windows across day files should be joined
+        st = archive.get_waveforms(
+            'AF', 'WHYM', '*', 'SHZ', self.day + 86340, self.day + 86460)
+        self.assertEqual(len(st), 1)
+        self.assertEqual(st[0].stats.npts, 121)
+        self.assertTrue(np.array_equal(
+            st[0].data, np.concatenate([full.data[-60:], full.data[:61]])))
+        # Files for WHYM should now be cached
+        self.assertEqual(archive.misses, 2)
+        archive.get_waveforms(
+            'AF', 'WHYM', '', 'SHZ', self.day + 3600, self.day + 3660)
+        self.assertEqual((archive.hits, archive.misses), (2, 2))
+        bulk = [('AF', sta, '', 'SHZ', self.day + 1000, self.day + 2000)
+                for sta in ['EORO', 'GOVA', 'WHYM']]
+        bulk_st = archive.get_waveforms_bulk(bulk)
+        for args, tr in zip(bulk, bulk_st):
+            self.assertEqual(tr, archive.get_waveforms(*args)[0])
+        self.assertLessEqual(len(archive._cache), 2)
+        # Read through read_data
+        self.assertEqual(
+            _check_available_data(root, 'SDS', self.day),
+            [('EORO', 'SHZ'), ('GOVA', 'SHZ'), ('WHYM', 'SHZ')])
+        st = read_data(archive, 'SDS', self.day + 86400,
+                       [('WHYM', 'SZ'), ('FOZ', 'HHZ')], length=3600)
+        self.assertEqual(len(st), 1)
+        self.assertEqual(st[0].stats.starttime, self.day + 86400)
+        self.assertTrue(np.array_equal(st[0].data, full.data[:3601]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,8 +10,12 @@ import unittest
 import pytest
 import os
 import glob
+import shutil
+import tempfile
 import warnings
 
+import numpy as np
+
 from obspy.clients.fdsn import Client
 from obspy import UTCDateTime
 from obspy import read
@@ -24,6 +28,9 @@ from eqcorrscan.utils.clustering import empirical_svd, empirical_SVD
 from eqcorrscan.utils.clustering import SVD_2_stream, svd_to_stream
 from eqcorrscan.utils.clustering import corr_cluster, dist_mat_km
 from eqcorrscan.utils.clustering import space_cluster, space_time_cluster
+from eqcorrscan.utils.clustering import (
+    extract_detections, read_extracted_detections)
+from eqcorrscan.core.match_filter import Detection
 
 
 @pytest.mark.network
@@ -319,6 +326,83 @@ class ClusteringTestWarnings(unittest.TestCase):
                             in str(w[0].message))
 
 
+class ExtractDetectionsTests(unittest.TestCase):
+    """Test extracting detections from a day-volume archive."""
+    @classmethod
+    def setUpClass(cls):
+        cls.testing_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)), 'test_data')
+        cls.archive = os.path.join(cls.testing_path, 'day_vols')
+        cls.day_st = read(os.path.join(
+            cls.archive, 'Y2012', 'R086.01', '*'))
+        cls.templates = [
+            ('temp1', read(os.path.join(cls.testing_path, 'temp1.ms'))),
+            ('temp2', read(os.path.join(cls.testing_path, 'temp2.ms')))]
+        cls.detections = [Detection(
+            template_name=template_name, detect_time=detect_time,
+            no_chans=2, chans=['WHYM', 'EORO'], detect_val=2, threshold=1.2,
+            typeofdet='corr', threshold_type='MAD', threshold_input=8.0)
+            for template_name, detect_time in [
+                ('temp1', UTCDateTime(2012, 3, 26, 18, 5)),
+                ('temp2', UTCDateTime(2012, 3, 26, 9, 15)),
+                ('temp1', UTCDateTime(2012, 3, 26, 9, 17)),
+                ('temp1', UTCDateTime(2012, 3, 27, 1))]]
+
+    def test_extract_by_day(self):
+        """Check that windows match the data, in order, for all days."""
+        for cores in [1, 2]:
+            extracted = extract_detections(
+                list(self.detections), self.templates, archive=self.archive,
+                arc_type='day_vols', extract_len=20.0, cores=cores)
+            self.assertEqual(len(extracted), 4)
+            for st, detect_time in zip(extracted, [
+                    UTCDateTime(2012, 3, 26, 9, 15),
+                    UTCDateTime(2012, 3, 26, 9, 17),
+                    UTCDateTime(2012, 3, 26, 18, 5)]):
+                self.assertEqual(sorted(tr.stats.station for tr in st),
+                                 ['EORO', 'WHYM'])
+                for tr in st:
+                    day_tr = self.day_st.select(id=tr.id)[0]
+                    self.assertEqual(tr.stats.starttime, detect_time - 10)
+                    self.assertTrue(np.array_equal(
+                        tr.data, day_tr.slice(
+                            detect_time - 10, detect_time + 10).data))
+            # No data for the last day
+            self.assertEqual(len(extracted[-1]), 0)
+
+    def test_extract_npz(self):
+        """Check writing one file per template and day."""
+        extracted = extract_detections(
+            list(self.detections), self.templates, archive=self.archive,
+            arc_type='day_vols', extract_len=20.0)
+        outdir = tempfile.mkdtemp()
+        try:
+            extract_detections(
+                list(self.detections), self.templates, archive=self.archive,
+                arc_type='day_vols', extract_len=20.0, outdir=outdir,
+                output_format='npz', cores=2)
+            self.assertEqual(
+                sorted(glob.glob(os.path.join(outdir, '*', '*'))),
+                [os.path.join(outdir, 'temp1', '2012-03-26.npz'),
+                 os.path.join(outdir, 'temp1', '2012-03-27.npz'),
+                 os.path.join(outdir, 'temp2', '2012-03-26.npz')])
+            temp1 = read_extracted_detections(
+                os.path.join(outdir, 'temp1', '2012-03-26.npz'))
+            self.assertEqual(len(temp1), 2)
+            for st, extracted_st in zip(temp1, extracted[1:3]):
+                self.assertEqual(len(st), len(extracted_st))
+                for tr, extracted_tr in zip(st, extracted_st):
+                    self.assertEqual(tr.id, extracted_tr.id)
+                    self.assertEqual(tr.stats.starttime,
+                                     extracted_tr.stats.starttime)
+                    self.assertTrue(np.array_equal(
+                        tr.data, extracted_tr.data))
+            self.assertEqual([len(st) for st in read_extracted_detections(
+                os.path.join(outdir, 'temp1', '2012-03-27.npz'))], [0])
+        finally:
+            shutil.rmtree(outdir)
+
+
 if __name__ == '__main__':
     """
     Run core tests
@@ -349,6 +349,20 @@ class TestArrayCorrelateFunctions:
         for name, cc in array_ccs.items():
             assert np.isclose(cc[0, starting_index], 1., atol=self.atol)
 
+    def test_multi_image(self, array_template, array_stream):
+        """ ensure correlating windows of the stream at once gives the same
+        answer as correlating the whole stream """
+        starts = np.arange(0, len(array_stream) - 400, 350)
+        images = np.array([array_stream[start: start + 400]
+                           for start in starts])
+        ccs = corr.multi_image_normxcorr(array_template[0], images)
+        assert ccs.shape == (len(starts), 201)
+        cc, _ = corr.fftw_normxcorr(
+            array_template[0:1], array_stream, pads=[0])
+        for start, image_cc in zip(starts, ccs):
+            assert np.allclose(image_cc, cc[0, start: start + 201],
+                               atol=self.atol)
+
     def test_non_zero_median(self, array_ccs_low_amp):
         """ Ensure that the median of correlations returned is non-zero,
         this happens with v.0.2.7 when the amplitudes are low."""
@@ -378,6 +392,21 @@ class TestStreamCorrelateFunctions:
         for cc_name, cc in zip(cc_names[2:], cc_list[2:]):
             assert np.allclose(cc_1, cc, atol=self.atol)
 
+    def test_unstacked_xcorr(self, multichannel_templates,
+                             multichannel_stream):
+        """ ensure per-channel correlations sum to the stacked output """
+        for name, func in stream_funcs.items():
+            stacked, no_chans, _ = func(
+                multichannel_templates, multichannel_stream, cores=1)
+            cccs, unstacked_chans, _ = func(
+                multichannel_templates, multichannel_stream, cores=1,
+                stack=False)
+            assert cccs.ndim == 3
+            assert cccs.shape[0] == stacked.shape[0]
+            assert np.array_equal(no_chans, unstacked_chans)
+            assert np.allclose(cccs.sum(axis=1), stacked,
+                               atol=self.atol * 10)
+
     def test_gappy_multi_channel_xcorr(self, gappy_stream_cc_dict):
         """
         test various correlation methods with multiple channels and a gap.
@@ -11,13 +11,17 @@ import os
 import numpy as np
 import warnings
 
-from obspy import read_events, read
+from obspy import read_events, read, Stream, Trace, UTCDateTime
 from obspy.io.nordic.core import readwavename
 
 from eqcorrscan.core.lag_calc import _channel_loop, _xcorr_interp, LagCalcError
-from eqcorrscan.core.lag_calc import _day_loop, _prepare_data
+from eqcorrscan.core.lag_calc import _xcorr_interp_array
+from eqcorrscan.core.lag_calc import _day_loop, _prepare_data, lag_calc
+from eqcorrscan.core.lag_calc import _correlation_loop, _has_correlations
 from eqcorrscan.core.match_filter import normxcorr2, Detection
 from eqcorrscan.core.template_gen import from_meta_file
+from eqcorrscan.utils.pre_processing import shortproc
+from eqcorrscan.utils.worker_pool import WorkerPool
 
 warnings.simplefilter("always")
 
@@ -42,6 +46,7 @@ class TestMethods(unittest.TestCase):
                 tr.stats.channel = tr.stats.channel[0] + tr.stats.channel[-1]
             item.update({'st': st, 'sfile': os.path.join(
                 cls.testing_path, item['sfile'])})
+            setattr(cls, item['name'] + '_data', st.copy())
             setattr(cls, item['name'], from_meta_file(
                 meta_file=item['sfile'], lowcut=5, highcut=15, samp_rate=40,
                 filt_order=4, length=3, swin='all', prepick=0.05,
@@ -193,11 +198,39 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(len(catalog), 2)
 
     def test_prepare_data(self):
+        # Data must cover the template length and shift_len either side
+        detect_data = shortproc(
+            st=self.detection_data.copy(), lowcut=5, highcut=15,
+            filt_order=4, samp_rate=40)
         detect_streams = _prepare_data(
-            detect_data=self.detection, detections=[self.detections[0]],
+            detect_data=detect_data, detections=[self.detections[0]],
             template=('test_template', self.template),
             delays=self.delays, shift_len=0.5, plot=False)
         self.assertEqual(len(detect_streams), 1)
+        for tr in detect_streams[0][1]:
+            template_tr = self.template.select(
+                station=tr.stats.station, channel=tr.stats.channel)[0]
+            self.assertGreaterEqual(
+                tr.stats.endtime - tr.stats.starttime,
+                1.0 + (template_tr.stats.endtime -
+                       template_tr.stats.starttime))
+        # Gaps in the data outside of the windows should not matter
+        gappy_data = detect_data.copy()
+        gap_start = self.detections[0].detect_time + max(
+            self.delays.values()) + 10
+        gappy_data.cutout(starttime=gap_start, endtime=gap_start + 5)
+        self.assertEqual(len(gappy_data), 2 * len(detect_data))
+        gappy_streams = _prepare_data(
+            detect_data=gappy_data, detections=[self.detections[0]],
+            template=('test_template', self.template),
+            delays=self.delays, shift_len=0.5, plot=False)
+        self.assertEqual(len(gappy_streams), 1)
+        self.assertEqual(len(gappy_streams[0][1]), len(detect_streams[0][1]))
+        for tr, gappy_tr in zip(detect_streams[0][1].sort(),
+                                gappy_streams[0][1].sort()):
+            self.assertEqual(tr.id, gappy_tr.id)
+            self.assertEqual(tr.stats.starttime, gappy_tr.stats.starttime)
+            self.assertTrue(np.array_equal(tr.data, gappy_tr.data))
 
     def test_no_matching_template(self):
         detect_streams = _prepare_data(
@@ -225,6 +258,189 @@ class TestMethods(unittest.TestCase):
         self.assertEqual(len(detect_streams), 0)
 
 
+class SyntheticTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(42)
+        wavelet = np.sin(np.arange(200) / 5.) * np.hanning(200)
+        starttime = UTCDateTime(2019, 1, 1)
+        stachans = [('A', 'HHZ'), ('A', 'HHN'), ('A', 'HHE'), ('B', 'HHZ')]
+        cls.template = Stream([Trace(
+            data=wavelet + 0.05 * np.random.randn(200), header={
+                'station': station, 'channel': channel,
+                'sampling_rate': 100.0, 'starttime': starttime})
+            for station, channel in stachans])
+        cls.detection_streams, cls.detections = [], []
+        for i in range(10):
+            st = Stream()
+            for station, channel in stachans:
+                data = np.random.randn(240) * 0.3
+                shift = np.random.randint(0, 40)
+                data[shift:shift + 200] += wavelet
+                st += Trace(data=data, header={
+                    'station': station, 'channel': channel,
+                    'sampling_rate': 100.0,
+                    'starttime': starttime + i * 100})
+            if i % 3 == 0:
+                st.remove(st[1])
+            cls.detection_streams.append(st)
+            cls.detections.append(Detection(
+                template_name='test_template',
+                detect_time=starttime + i * 100, no_chans=len(st),
+                detect_val=2.0, threshold=1.0, typeofdet='corr',
+                threshold_type='MAD', threshold_input=8.0))
+
+    def test_batch_day_loop(self):
+        """Check that batched correlations give the same picks."""
+        for interpolate in [False, True]:
+            catalogs = [_day_loop(
+                detection_streams=self.detection_streams,
+                template=self.template, min_cc=0.4,
+                detections=self.detections, horizontal_chans=['E', 'N'],
+                vertical_chans=['Z'], interpolate=interpolate, cores=False,
+                parallel=False, batch=batch) for batch in [False, True]]
+            self.assertEqual(len(catalogs[0]), len(catalogs[1]))
+            for event, batch_event in zip(*catalogs):
+                self.assertEqual(event.resource_id, batch_event.resource_id)
+                self.assertEqual(len(event.picks), len(batch_event.picks))
+                for pick, batch_pick in zip(event.picks, batch_event.picks):
+                    self.assertEqual(pick.waveform_id, batch_pick.waveform_id)
+                    self.assertEqual(pick.phase_hint, batch_pick.phase_hint)
+                    self.assertAlmostEqual(
+                        pick.time - batch_pick.time, 0, places=2)
+
+    def test_prepare_data_views(self):
+        """Check that prepared data are views of the continuous data."""
+        starttime = self.detections[0].detect_time
+        detect_data = Stream([Trace(
+            data=np.random.randn(20000), header={
+                'station': tr.stats.station, 'channel': tr.stats.channel,
+                'sampling_rate': 100.0, 'starttime': starttime})
+            for tr in self.template])
+        detect_data[0].data = np.ma.masked_array(
+            detect_data[0].data, mask=np.zeros(20000, dtype=bool))
+        detect_data[0].data.mask[950:1050] = True
+        delays = {tr.stats.station + '.' + tr.stats.channel: 0.0
+                  for tr in self.template}
+        detections = [self.detections[0].copy() for _ in range(3)]
+        for detection, offset in zip(detections, [-1, 10, 199]):
+            detection.detect_time = starttime + offset
+        with warnings.catch_warnings(record=True):
+            detect_streams = _prepare_data(
+                detect_data=detect_data, detections=detections,
+                template=('test_template', self.template), delays=delays,
+                shift_len=0.2, plot=False)
+        # The first and last windows are not complete, the gap is not used
+        self.assertEqual(len(detect_streams), 1)
+        detect_stream = detect_streams[0][1]
+        self.assertEqual(len(detect_stream), len(self.template) - 1)
+        for tr in detect_stream:
+            self.assertEqual(tr.stats.npts, 241)
+            self.assertEqual(tr.stats.starttime, starttime + 9.8)
+            self.assertTrue(np.shares_memory(
+                tr.data, detect_data.select(id=tr.id)[0].data))
+
+    def test_correlation_loop(self):
+        """Check that picks from retained correlations match lag_calc."""
+        detections = []
+        for detection, st in zip(self.detections, self.detection_streams):
+            detection = detection.copy()
+            detection.correlations = Stream()
+            for tr in st:
+                template = self.template.select(
+                    station=tr.stats.station, channel=tr.stats.channel)[0]
+                ccc = normxcorr2(template.data.astype(np.float32),
+                                 tr.data.astype(np.float32))[0]
+                detection.correlations += Trace(data=ccc, header={
+                    'station': tr.stats.station, 'channel': tr.stats.channel,
+                    'sampling_rate': 100.0, 'starttime': tr.stats.starttime})
+            detections.append(detection)
+        self.assertTrue(all(_has_correlations(d, 0.2) for d in detections))
+        self.assertFalse(_has_correlations(detections[0], 0.3))
+        for interpolate in [False, True]:
+            catalog = _day_loop(
+                detection_streams=self.detection_streams,
+                template=self.template, min_cc=0.4,
+                detections=self.detections, horizontal_chans=['E', 'N'],
+                vertical_chans=['Z'], interpolate=interpolate, cores=False,
+                parallel=False)
+            retained = _correlation_loop(
+                detections=detections, shift_len=0.2, min_cc=0.4,
+                horizontal_chans=['E', 'N'], vertical_chans=['Z'],
+                interpolate=interpolate)
+            self.assertEqual(len(catalog), len(retained))
+            for event, retained_event in zip(catalog, retained):
+                self.assertEqual(len(event.picks), len(retained_event.picks))
+                for pick, retained_pick in zip(
+                        event.picks, retained_event.picks):
+                    self.assertEqual(
+                        pick.waveform_id, retained_pick.waveform_id)
+                    self.assertAlmostEqual(
+                        pick.time - retained_pick.time, 0, places=4)
+
+    def test_lag_calc_detections_unaltered(self):
+        """Check that detections are not changed when adjusted for delays."""
+        template = self.template.copy()
+        template[-1].stats.starttime += 0.5
+        starttime = self.detections[0].detect_time
+        detect_data = Stream([Trace(
+            data=np.random.randn(6000), header={
+                'station': tr.stats.station, 'channel': tr.stats.channel,
+                'sampling_rate': 100.0, 'starttime': starttime})
+            for tr in template])
+        detection = self.detections[0].copy()
+        detection.detect_time = starttime + 20
+        detection.chans = [('B', 'HHZ')]
+        catalog = lag_calc(
+            detections=[detection], detect_data=detect_data,
+            template_names=['test_template'], templates=[template],
+            shift_len=0.2, min_cc=-1.0, parallel=False)
+        self.assertEqual(detection.detect_time, starttime + 20)
+        self.assertEqual(len(catalog), 1)
+        pick_times = [pick.time for pick in catalog[0].picks]
+        self.assertTrue(all(
+            abs(pick_time - (starttime + 19.5)) <= 0.21
+            for pick_time in pick_times[:-1]))
+
+    def test_lag_calc_units(self):
+        """Check that picking units of detections in a pool matches serial."""
+        starttime = self.detections[0].detect_time
+        wavelet = self.template[0].data
+        detect_data = Stream()
+        for tr in self.template:
+            data = np.random.randn(110000) * 0.3
+            for i in range(10):
+                shift = 1000 + i * 10000 + np.random.randint(0, 40)
+                data[shift:shift + 200] += wavelet
+            detect_data += Trace(data=data, header={
+                'station': tr.stats.station, 'channel': tr.stats.channel,
+                'sampling_rate': 100.0, 'starttime': starttime})
+        detections = []
+        for i, detection in enumerate(self.detections):
+            detection = detection.copy()
+            detection.detect_time = starttime + 10.2 + i * 100
+            detection.chans = [(tr.stats.station, tr.stats.channel)
+                               for tr in self.template]
+            detection.id = 'detection_%i' % i
+            detections.append(detection)
+        kwargs = dict(
+            detections=detections, detect_data=detect_data,
+            template_names=['test_template'], templates=[self.template],
+            shift_len=0.2, min_cc=0.4)
+        catalog = lag_calc(parallel=False, **kwargs)
+        self.assertEqual(len(catalog), len(detections))
+        with WorkerPool(processes=2) as pool:
+            unit_catalog = lag_calc(
+                pool=pool, unit_size=3, max_windows=4, **kwargs)
+        self.assertEqual(len(catalog), len(unit_catalog))
+        for event, unit_event in zip(catalog, unit_catalog):
+            self.assertEqual(event.resource_id, unit_event.resource_id)
+            self.assertEqual(
+                [(pick.waveform_id, pick.time) for pick in event.picks],
+                [(pick.waveform_id, pick.time)
+                 for pick in unit_event.picks])
+
+
 class ShortTests(unittest.TestCase):
     def test_error(self):
         with self.assertRaises(LagCalcError):
@@ -247,6 +463,30 @@ class ShortTests(unittest.TestCase):
         self.assertTrue('Less than 5 samples' in str(w[0].message))
         self.assertTrue('Residual in quadratic fit' in str(w[1].message))
 
+    def test_interp_array(self):
+        """Check vectorised interpolation against interpolating each row."""
+        samples = np.arange(41)
+        cccs = np.array([np.exp(-((samples - centre) / width) ** 2)
+                         for centre, width in [(20, 5), (3.3, 8), (30.7, 2)]])
+        bad_ccc = np.array([-0.21483282, -0.59443731, 0.1898917, -0.67516038,
+                            0.60129057, -0.71043723, 0.16709118, 0.96839009,
+                            1.58283915, -0.3053663])
+        cccs = np.concatenate([cccs, [np.pad(bad_ccc, (0, 31), 'constant')]])
+        with warnings.catch_warnings(record=True):
+            shifts, coeffs, unstable = _xcorr_interp_array(cccs, 0.1)
+            for ccc, shift, coeff in zip(cccs[:-1], shifts, coeffs):
+                expected_shift, expected_coeff = _xcorr_interp(ccc, 0.1)
+                self.assertAlmostEqual(shift, expected_shift)
+                self.assertAlmostEqual(coeff, expected_coeff)
+        self.assertEqual(unstable.tolist(), [False, False, False, False])
+        # Too few samples around the peak
+        synth_template = np.sin(np.arange(0, 2, 0.001))
+        ccc = normxcorr2(synth_template[11:], synth_template[0:-10])[0]
+        shifts, coeffs, unstable = _xcorr_interp_array(ccc, 0.01)
+        self.assertTrue(unstable[0])
+        self.assertEqual(shifts[0], ccc.argmax() * 0.01)
+        self.assertEqual(coeffs[0], ccc.max())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -7,25 +7,54 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import copy
+import gc
+import glob
 import os
+import shutil
 import unittest
 import pytest
 
 import numpy as np
 from obspy import read, UTCDateTime, read_events, Catalog, Stream, Trace
 from obspy.clients.fdsn import Client
-from obspy.core.event import Pick, Event
+from obspy.core.event import Pick, Event, WaveformStreamID
 from obspy.core.util.base import NamedTemporaryFile
 
 from eqcorrscan.core.match_filter import MatchFilterError
 from eqcorrscan.core.match_filter import match_filter, normxcorr2, Detection
 from eqcorrscan.core.match_filter import read_detections, get_catalog
 from eqcorrscan.core.match_filter import write_catalog, extract_from_stream
+from eqcorrscan.core.match_filter import extract_array_from_stream
 from eqcorrscan.core.match_filter import Tribe, Template, Party, Family
 from eqcorrscan.core.match_filter import read_party, read_tribe, _spike_test
+from eqcorrscan.core.match_filter import _group_process, _prefetch
+from eqcorrscan.core.match_filter import _client_windows
+from eqcorrscan.core.match_filter import (
+    _write_journal_window, _read_journal_manifest, _read_journal,
+    _clear_journal)
 from eqcorrscan.utils import pre_processing, catalog_utils
 from eqcorrscan.utils.correlate import fftw_normxcorr, numpy_normxcorr
 from eqcorrscan.utils.catalog_utils import filter_picks
+from eqcorrscan.utils.timer import time_func
+
+
+class _StandInClient(object):
+    """Local client serving data from a stream, failing the first requests."""
+    def __init__(self, st, fail=0):
+        self.st = st
+        self.fail = fail
+        self.requests = 0
+
+    def get_waveforms_bulk(self, bulk_info):
+        self.requests += 1
+        if self.requests <= self.fail:
+            raise IOError("Stand-in server unavailable")
+        st = Stream()
+        for net, sta, loc, chan, starttime, endtime in bulk_info:
+            st += self.st.select(
+                network=net, station=sta, location=loc, channel=chan).slice(
+                starttime, endtime).copy()
+        return st
 
 
 class TestCoreMethods(unittest.TestCase):
@@ -103,6 +132,317 @@ class TestCoreMethods(unittest.TestCase):
         with self.assertRaises(MatchFilterError):
             _spike_test(stream)
 
+    def test_group_process_once(self):
+        """Check that chunk views match processing chunks separately."""
+        np.random.seed(42)
+        stream = Stream([Trace(
+            data=np.random.randn(13000), header={
+                'station': station, 'channel': 'HHZ',
+                'sampling_rate': 100.0,
+                'starttime': UTCDateTime(2020, 1, 1)})
+            for station in ['A', 'B', 'C']])
+        template = Template(
+            name='a', lowcut=2.0, highcut=8.0, samp_rate=100.0,
+            filt_order=4, process_length=40.0, prepick=0.1)
+        chunks = _group_process(
+            template_group=[template], parallel=False, debug=0, cores=1,
+            stream=stream.copy(), daylong=False, ignore_length=False,
+            overlap=5.0)
+        views = _group_process(
+            template_group=[template], parallel=False, debug=0, cores=1,
+            stream=stream.copy(), daylong=False, ignore_length=False,
+            overlap=5.0, process_once=True)
+        self.assertEqual(len(chunks), len(views))
+        for chunk, view in zip(chunks, views):
+            for tr, view_tr in zip(chunk.sort(), view.sort()):
+                self.assertEqual(tr.stats.starttime, view_tr.stats.starttime)
+                self.assertEqual(tr.stats.npts, view_tr.stats.npts)
+                # Filter edge-effects differ at chunk boundaries
+                self.assertTrue(np.allclose(
+                    tr.data[500:-500], view_tr.data[500:-500], atol=1e-6))
+        # Data processed once can also be returned as one stream
+        whole = _group_process(
+            template_group=[template], parallel=False, debug=0, cores=1,
+            stream=stream.copy(), daylong=False, ignore_length=False,
+            overlap=5.0, process_once=True, chunk=False)
+        self.assertEqual(len(whole), 1)
+        for tr in views[-1]:
+            whole_tr = whole[0].select(id=tr.id)[0]
+            self.assertEqual(whole_tr.stats.starttime,
+                             views[0][0].stats.starttime)
+            self.assertEqual(whole_tr.stats.endtime, tr.stats.endtime)
+            self.assertTrue(np.array_equal(
+                whole_tr.data[-tr.stats.npts:], tr.data))
+
+    def test_prefetch(self):
+        """Check that prefetching keeps order and is bounded."""
+        produced = []
+
+        def _generate(n, fail_at=None):
+            for i in range(n):
+                if i == fail_at:
+                    raise ValueError("Failed at %i" % i)
+                produced.append(i)
+                yield i
+
+        for n_items in [0, 1, 3]:
+            del produced[:]
+            for i in _prefetch(_generate(10), n_items=n_items):
+                # Only n_items + 1 items should be made ahead of use
+                self.assertLessEqual(len(produced), i + n_items + 2)
+            self.assertEqual(produced, list(range(10)))
+            self.assertEqual(
+                list(_prefetch(_generate(10), n_items=n_items)),
+                list(range(10)))
+            with self.assertRaises(ValueError):
+                list(_prefetch(_generate(10, fail_at=5), n_items=n_items))
+        # Stopping early should stop the producer
+        del produced[:]
+        for i in _prefetch(_generate(100), n_items=2):
+            if i == 3:
+                break
+        self.assertLess(len(produced), 10)
+
+    def test_client_windows(self):
+        """Check downloading with retries, prefetching and caching."""
+        np.random.seed(42)
+        starttime = UTCDateTime(2020, 1, 1)
+        st = Stream([Trace(
+            data=np.random.randn(50000), header={
+                'network': 'NZ', 'station': station, 'channel': 'HHZ',
+                'sampling_rate': 100.0, 'starttime': starttime})
+            for station in ['A', 'B']])
+        kwargs = dict(
+            template_channel_ids=[('NZ', 'A', '*', 'HHZ'),
+                                  ('NZ', 'B', '*', 'HHZ')],
+            starttime=starttime + 20, data_length=100.0, n_windows=3,
+            pad=5.0, buff=10.0, retry_delay=0.01)
+        client = _StandInClient(st, fail=2)
+        windows = list(_client_windows(client=client, **kwargs))
+        self.assertEqual(client.requests, 5)
+        self.assertEqual([i for i, _ in windows], [0, 1, 2])
+        for i, window in windows:
+            self.assertEqual(len(window), 2)
+            for tr in window:
+                self.assertEqual(
+                    tr.stats.starttime, starttime + 15 + (i * 100))
+                self.assertEqual(tr.stats.endtime, starttime + 125 + (i * 100))
+        with self.assertRaises(MatchFilterError):
+            list(_client_windows(
+                client=_StandInClient(st, fail=3), retries=3, **kwargs))
+        # Skipped windows should not be downloaded
+        client = _StandInClient(st)
+        skipped = list(_client_windows(
+            client=client, skip_windows={1}, **kwargs))
+        self.assertEqual([i for i, _ in skipped], [0, 2])
+        self.assertEqual(client.requests, 2)
+        cache_dir = 'test_waveform_cache'
+        try:
+            for n_items in [0, 2]:
+                client = _StandInClient(st)
+                cached = list(_prefetch(_client_windows(
+                    client=client, waveform_cache=cache_dir, **kwargs),
+                    n_items=n_items))
+                for (_, window), (_, cached_window) in zip(windows, cached):
+                    for tr, cached_tr in zip(window, cached_window):
+                        self.assertEqual(tr.id, cached_tr.id)
+                        self.assertEqual(tr.stats.starttime,
+                                         cached_tr.stats.starttime)
+                        self.assertTrue(np.array_equal(
+                            tr.data, cached_tr.data))
+                # Only the first run should download
+                self.assertEqual(client.requests, 3 if n_items == 0 else 0)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def test_extract_array(self):
+        """Check that extracted windows match slicing the stream."""
+        starttime = UTCDateTime(2017, 1, 1, 0, 0, 0.0037)
+        st = Stream([Trace(
+            data=np.random.randn(10000).astype(np.float32), header={
+                'station': station, 'channel': 'HHZ', 'sampling_rate': 50.0,
+                'starttime': starttime}) for station in ['A', 'B']])
+        detections = []
+        for offset in [0.5, 20.013, 100.37, 198.0]:
+            detection = Detection(
+                template_name='a', detect_time=starttime + offset,
+                no_chans=2, detect_val=1, threshold=0.5, typeofdet='corr',
+                threshold_type='abs', threshold_input=0.5)
+            detection.event = Event(picks=[Pick(
+                time=starttime + offset + 0.011 * i,
+                waveform_id=WaveformStreamID(
+                    station_code=station, channel_code='HHZ'))
+                for i, station in enumerate(['A', 'B', 'C'])])
+            detections.append(detection)
+        streams = extract_from_stream(st, detections, pad=1.0, length=4.0)
+        data, chans, valid, array_streams = extract_array_from_stream(
+            st, detections, pad=1.0, length=4.0, return_streams=True)
+        self.assertEqual(data.shape, (4, 3, 201))
+        self.assertEqual(chans, [('A', 'HHZ'), ('B', 'HHZ'), ('C', 'HHZ')])
+        # Windows off the start and end of the data, or without data
+        self.assertFalse(valid[0].any())
+        self.assertFalse(valid[-1].any())
+        self.assertFalse(valid[:, 2].any())
+        self.assertTrue(valid[1:-1, 0:2].all())
+        for detection, stream, array_stream in zip(
+                detections, streams, array_streams):
+            for pick in detection.event.picks:
+                expected = st.select(
+                    station=pick.waveform_id.station_code).slice(
+                    pick.time - 1.0, pick.time + 3.0)
+                if len(expected) == 0:
+                    continue
+                tr = stream.select(
+                    station=pick.waveform_id.station_code)[0]
+                self.assertEqual(tr.stats.starttime,
+                                 expected[0].stats.starttime)
+                self.assertTrue(np.array_equal(tr.data, expected[0].data))
+                if expected[0].stats.npts != 201:
+                    continue
+                array_tr = array_stream.select(
+                    station=pick.waveform_id.station_code)[0]
+                self.assertEqual(array_tr.stats.starttime,
+                                 expected[0].stats.starttime)
+                self.assertTrue(np.array_equal(
+                    array_tr.data, expected[0].data))
+        # Extracted streams must not share memory with the input stream
+        for stream in streams:
+            for tr in stream:
+                self.assertFalse(np.shares_memory(
+                    tr.data, st.select(station=tr.stats.station)[0].data))
+        with self.assertRaises(MatchFilterError):
+            st[1].stats.sampling_rate = 100.0
+            extract_array_from_stream(st, detections, pad=1.0, length=4.0)
+
+    def test_progress_journal(self):
+        """Check writing, reading and clearing a progress journal."""
+        starttime = UTCDateTime(2020, 1, 1)
+        templates = [Template(name=name, st=Stream([Trace(
+            data=np.random.randn(100), header={
+                'network': 'NZ', 'station': 'A', 'channel': 'HHZ',
+                'sampling_rate': 100.0, 'starttime': starttime})]))
+            for name in ['a', 'b']]
+        journal = 'test_progress_journal'
+        windows = [[], [('a', 10.0), ('b', 20.0), ('a', 30.0)], [('b', 50.0)]]
+        try:
+            for i, window in enumerate(windows):
+                party = Party([Family(template=template, detections=[
+                    Detection(
+                        template_name=name, detect_time=starttime + offset,
+                        no_chans=1, detect_val=0.8, threshold=0.5,
+                        typeofdet='corr', threshold_type='MAD',
+                        threshold_input=8.0, chans=[('A', 'HHZ')])
+                    for name, offset in window if name == template.name])
+                    for template in templates])
+                _write_journal_window(
+                    dirname=journal, index=i, starttime=starttime + i * 100,
+                    endtime=starttime + (i + 1) * 100, party=party)
+            # An interrupted write should not be read
+            with open(os.path.join(journal, 'journal_manifest.csv'),
+                      'a') as f:
+                f.write('3, 2020-01-01T00:05:00')
+            completed = _read_journal_manifest(journal)
+            self.assertEqual(sorted(completed.keys()), [0, 1, 2])
+            self.assertEqual(completed[1][0], starttime + 100)
+            party = _read_journal(dirname=journal, templates=templates)
+            self.assertEqual(len(party.families), 2)
+            self.assertEqual(len(party), 4)
+            self.assertEqual(
+                sorted(d.detect_time - starttime for d in party[0]),
+                [10.0, 30.0])
+            self.assertEqual(
+                sorted(d.detect_time - starttime for d in party[1]),
+                [20.0, 50.0])
+            self.assertEqual(len(party[1][0].event.picks), 1)
+            # Only the requested windows should be read
+            party = _read_journal(
+                dirname=journal, templates=templates,
+                windows={2: completed[2]})
+            self.assertEqual([len(f) for f in party], [0, 1])
+            _clear_journal(journal)
+            self.assertEqual(_read_journal_manifest(journal), {})
+            self.assertEqual(os.listdir(journal), [])
+        finally:
+            shutil.rmtree(journal, ignore_errors=True)
+
+    def test_group_process_cache(self):
+        """Check that cached processed data match processing."""
+        np.random.seed(42)
+        stream = Stream([Trace(
+            data=np.random.randn(13000), header={
+                'station': station, 'channel': 'HHZ',
+                'sampling_rate': 100.0,
+                'starttime': UTCDateTime(2020, 1, 1)})
+            for station in ['A', 'B', 'C']])
+        template = Template(
+            name='a', lowcut=2.0, highcut=8.0, samp_rate=100.0,
+            filt_order=4, process_length=40.0, prepick=0.1)
+        chunks = _group_process(
+            template_group=[template], parallel=False, debug=0, cores=1,
+            stream=stream.copy(), daylong=False, ignore_length=False,
+            overlap=5.0)
+        cache_dir = 'test_process_cache'
+        try:
+            cache = pre_processing.ProcessedDataCache(cache_dir)
+            for _ in range(2):
+                cached = _group_process(
+                    template_group=[template], parallel=False, debug=0,
+                    cores=1, stream=stream.copy(), daylong=False,
+                    ignore_length=False, overlap=5.0, process_cache=cache)
+                self.assertEqual(len(chunks), len(cached))
+                for chunk, cached_chunk in zip(chunks, cached):
+                    self.assertEqual(chunk, cached_chunk)
+            self.assertEqual(cache.misses, 3 * len(chunks))
+            self.assertEqual(cache.hits, 3 * len(chunks))
+            # Different processing should not use the cached data
+            template.highcut = 9.0
+            _group_process(
+                template_group=[template], parallel=False, debug=0, cores=1,
+                stream=stream.copy(), daylong=False, ignore_length=False,
+                overlap=5.0, process_cache=cache)
+            self.assertEqual(cache.misses, 6 * len(chunks))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def test_lag_calc_process_cache(self):
+        """Check that lag-calc re-uses data processed for detection."""
+        np.random.seed(42)
+        starttime = UTCDateTime(2020, 1, 1)
+        wavelet = np.random.randn(300) * np.hanning(300) * 20
+        stream = Stream()
+        for station in ['A', 'B', 'C']:
+            data = np.random.randn(60000) * 10
+            for detect_time in [100, 250, 400]:
+                data[detect_time * 100:detect_time * 100 + 300] += \
+                    wavelet * 50
+            stream += Trace(data=data, header={
+                'station': station, 'channel': 'HHZ', 'network': 'NZ',
+                'sampling_rate': 100.0, 'starttime': starttime})
+        template_st = pre_processing.shortproc(
+            stream.slice(starttime + 99, starttime + 106).copy(),
+            lowcut=2.0, highcut=20.0, filt_order=4, samp_rate=100.0)
+        template_st.trim(starttime + 99.9, starttime + 102.9)
+        tribe = Tribe([Template(
+            name='a', st=template_st, lowcut=2.0, highcut=20.0,
+            samp_rate=100.0, filt_order=4, process_length=300.0,
+            prepick=0.1)])
+        cache_dir = 'test_process_cache'
+        try:
+            cache = pre_processing.ProcessedDataCache(cache_dir)
+            party = tribe.detect(
+                stream=stream, threshold=8.0, threshold_type='MAD',
+                trig_int=2.0, plotvar=False, parallel_process=False,
+                process_cache=cache)
+            self.assertEqual(len(party), 3)
+            hits = cache.hits
+            catalog = party.lag_calc(
+                stream=stream, pre_processed=False, parallel=False,
+                process_cache=cache)
+            self.assertEqual(len(catalog), 3)
+            self.assertGreater(cache.hits, hits)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
 
 @pytest.mark.serial
 class TestSynthData(unittest.TestCase):
@@ -165,6 +505,43 @@ class TestSynthData(unittest.TestCase):
                      threshold=8, threshold_type='MAD', trig_int=1,
                      plotvar=False, debug=3)
 
+    def test_retain_correlations(self):
+        """Check that retained correlations are those of each channel."""
+        np.random.seed(42)
+        wavelet = np.sin(np.arange(100) / 4.) * np.hanning(100)
+        starttime = UTCDateTime(2019, 1, 1)
+        delays = {'A': 0, 'B': 30, 'C': 55}
+        stream, template = Stream(), Stream()
+        for station, delay in delays.items():
+            data = np.random.randn(6000) * 0.2
+            for onset in [1000, 3000, 5000]:
+                data[onset + delay:onset + delay + 100] += wavelet
+            header = {'station': station, 'channel': 'HHZ',
+                      'sampling_rate': 100.0, 'starttime': starttime}
+            stream += Trace(data=data.astype(np.float32), header=header)
+            template += Trace(
+                data=data[3000 + delay:3100 + delay].astype(np.float32),
+                header=header)
+            template[-1].stats.starttime = starttime + (3000 + delay) / 100.
+        detections = match_filter(
+            template_names=['a'], template_list=[template], st=stream,
+            threshold=8.0, threshold_type='MAD', trig_int=2.0,
+            plotvar=False, retain_correlations=0.2)
+        self.assertEqual(len(detections), 3)
+        for detection in detections:
+            self.assertEqual(len(detection.correlations), 3)
+            self.assertAlmostEqual(
+                sum(tr.data[20] for tr in detection.correlations),
+                detection.detect_val, 3)
+            for tr in detection.correlations:
+                self.assertEqual(tr.stats.npts, 41)
+                template_tr = template.select(station=tr.stats.station)[0]
+                data = stream.select(station=tr.stats.station)[0].slice(
+                    tr.stats.starttime, tr.stats.starttime + 1.39).data
+                self.assertTrue(np.allclose(
+                    tr.data, normxcorr2(template_tr.data, data)[0],
+                    atol=1e-4))
+
 
 @pytest.mark.network
 class TestGeoNetCase(unittest.TestCase):
@@ -722,13 +1099,21 @@ class TestMatchObjectHeavy(unittest.TestCase):
             client=client, starttime=self.t1 + 2.75, endtime=self.t2,
             threshold=8.0, threshold_type='MAD', trig_int=6.0,
             daylong=False, plotvar=False, save_progress=True)
-        self.assertTrue(os.path.isfile("eqcorrscan_temporary_party.tgz"))
-        saved_party = Party().read("eqcorrscan_temporary_party.tgz")
-        self.assertEqual(party, saved_party)
-        os.remove("eqcorrscan_temporary_party.tgz")
+        self.assertTrue(os.path.isfile(os.path.join(
+            "eqcorrscan_temporary_party", "journal_manifest.csv")))
+        # Resuming a completed run should read all detections from the
+        # journal
+        resumed_party = self.tribe.copy().client_detect(
+            client=client, starttime=self.t1 + 2.75, endtime=self.t2,
+            threshold=8.0, threshold_type='MAD', trig_int=6.0,
+            daylong=False, plotvar=False, save_progress=True, resume=True)
+        shutil.rmtree("eqcorrscan_temporary_party")
         compare_families(
             party=party, party_in=self.party, float_tol=0.05,
             check_event=False)
+        compare_families(
+            party=resumed_party, party_in=party, float_tol=0.05,
+            check_event=False)
 
     @pytest.mark.network
     def test_party_lag_calc(self):
@@ -792,6 +1177,34 @@ class TestMatchObjectHeavy(unittest.TestCase):
         catalog = self.party.lag_calc(stream=self.st, pre_processed=True)
         self.assertEqual(len(catalog), 3)
 
+    def test_party_lag_calc_retained_correlations(self):
+        """Test that lag-calc can use correlations retained at detection."""
+        party = self.tribe.detect(
+            stream=self.unproc_st, threshold=8.0, threshold_type='MAD',
+            trig_int=6.0, daylong=False, plotvar=False,
+            retain_correlations=0.3)
+        for family in party:
+            for detection in family:
+                self.assertEqual(
+                    len(detection.correlations), detection.no_chans)
+        catalog = party.lag_calc(
+            stream=None, pre_processed=False, shift_len=0.2)
+        recalculated = party.copy()
+        for family in recalculated:
+            for detection in family:
+                detection.correlations = None
+        with self.assertRaises(MatchFilterError):
+            recalculated.lag_calc(stream=None, pre_processed=False)
+        recalculated = recalculated.lag_calc(
+            stream=self.unproc_st, pre_processed=False, shift_len=0.2)
+        self.assertEqual(len(catalog), len(recalculated))
+        for event, recalculated_event in zip(catalog, recalculated):
+            self.assertEqual(
+                sorted((p.waveform_id.get_seed_string(), p.time)
+                       for p in event.picks),
+                sorted((p.waveform_id.get_seed_string(), p.time)
+                       for p in recalculated_event.picks))
+
     @pytest.mark.network
     def test_day_long_methods(self):
         """Conduct a test using day-long data."""
@@ -925,6 +1338,157 @@ class TestMatchObjectLight(unittest.TestCase):
             if os.path.isfile('test_tribe_QML.tgz'):
                 os.remove('test_tribe_QML.tgz')
 
+    def test_tribe_io_npz(self):
+        """Test reading and writing Tribe objects with npz catalogs."""
+        try:
+            if os.path.isfile('test_tribe_npz.tgz'):
+                os.remove('test_tribe_npz.tgz')
+            self.tribe.write(filename='test_tribe_npz', catalog_format="NPZ")
+            tribe_back = read_tribe('test_tribe_npz.tgz')
+            self.assertEqual(len(self.tribe), len(tribe_back))
+            for template_in in self.tribe:
+                template_back = tribe_back.select(template_in.name)
+                event_in, event_back = template_in.event, template_back.event
+                self.assertEqual(event_in.resource_id, event_back.resource_id)
+                self.assertEqual(
+                    [c.text for c in event_in.comments],
+                    [c.text for c in event_back.comments])
+                for key in ['time', 'latitude', 'longitude', 'depth']:
+                    self.assertEqual(
+                        [origin[key] for origin in event_in.origins],
+                        [origin[key] for origin in event_back.origins])
+                self.assertEqual(
+                    [(m.mag, m.magnitude_type) for m in event_in.magnitudes],
+                    [(m.mag, m.magnitude_type)
+                     for m in event_back.magnitudes])
+                for pick_in, pick_back in zip(
+                        event_in.picks, event_back.picks):
+                    for key in ['time', 'waveform_id', 'phase_hint', 'onset',
+                                'polarity', 'evaluation_mode']:
+                        self.assertEqual(pick_in[key], pick_back[key])
+                template_back.event = event_in
+                self.assertEqual(template_in, template_back)
+        finally:
+            if os.path.isfile('test_tribe_npz.tgz'):
+                os.remove('test_tribe_npz.tgz')
+
+    def test_tribe_io_parallel(self):
+        """Test reading Tribe objects using multiple threads."""
+        try:
+            if os.path.isfile('test_tribe_parallel.tgz'):
+                os.remove('test_tribe_parallel.tgz')
+            self.tribe.write(filename='test_tribe_parallel')
+            tribe_back = read_tribe('test_tribe_parallel.tgz', cores=2)
+            self.assertEqual(self.tribe, tribe_back)
+        finally:
+            if os.path.isfile('test_tribe_parallel.tgz'):
+                os.remove('test_tribe_parallel.tgz')
+
+    def test_tribe_io_resample_method(self):
+        """Test that the resampling method survives a Tribe round-trip."""
+        tribe = self.tribe.copy()
+        tribe[0].resample_method = 'polyphase'
+        self.assertFalse(tribe[0].same_processing(tribe[1]))
+        try:
+            if os.path.isfile('test_tribe_resample.tgz'):
+                os.remove('test_tribe_resample.tgz')
+            tribe.write(filename='test_tribe_resample')
+            tribe_back = read_tribe('test_tribe_resample.tgz')
+            self.assertEqual(tribe, tribe_back)
+            self.assertEqual(
+                tribe_back.select(tribe[0].name).resample_method,
+                'polyphase')
+        finally:
+            if os.path.isfile('test_tribe_resample.tgz'):
+                os.remove('test_tribe_resample.tgz')
+
+    def test_tribe_io_lazy(self):
+        """Test lazily reading Tribe objects."""
+        try:
+            if os.path.isfile('test_tribe_lazy.tgz'):
+                os.remove('test_tribe_lazy.tgz')
+            self.tribe.write(filename='test_tribe_lazy')
+            tribe_back = read_tribe(
+                'test_tribe_lazy.tgz', lazy=True, cache_size=1)
+            for template in tribe_back:
+                self.assertFalse('st' in template.__dict__)
+            self.assertEqual(self.tribe, tribe_back)
+            self.assertEqual(len(tribe_back[0]._store._cache), 1)
+            template = tribe_back[0].copy()
+            template.st = template.st.copy()
+            self.assertEqual(template, tribe_back[0])
+            # Extracted files are removed once no copies of the store remain
+            temp_dir = os.path.dirname(os.path.dirname(
+                tribe_back[0]._store.files[tribe_back[0].name]))
+            self.assertTrue(os.path.isdir(temp_dir))
+            tribe_copy = tribe_back.copy()
+            del tribe_back, template
+            gc.collect()
+            self.assertTrue(os.path.isdir(temp_dir))
+            self.assertEqual(self.tribe, tribe_copy)
+            del tribe_copy
+            gc.collect()
+            self.assertFalse(os.path.isdir(temp_dir))
+        finally:
+            if os.path.isfile('test_tribe_lazy.tgz'):
+                os.remove('test_tribe_lazy.tgz')
+
+    def test_tribe_io_incremental(self):
+        """Test only writing changed templates."""
+        try:
+            if os.path.isdir('test_tribe_incremental'):
+                shutil.rmtree('test_tribe_incremental')
+            self.tribe.write(filename='test_tribe_incremental',
+                             compress=False, incremental=True)
+            tribe = read_tribe('test_tribe_incremental', lazy=True)
+            ms_files = glob.glob(
+                os.path.join('test_tribe_incremental', '*.ms'))
+            for ms_file in ms_files:
+                os.utime(ms_file, (0, 0))
+            removed = tribe[0].name
+            tribe.remove(tribe[0])
+            template = tribe[0].copy()
+            template.st = template.st.copy()
+            template.name = 'new_template'
+            template.event = None
+            tribe += template
+            tribe.write(filename='test_tribe_incremental', compress=False,
+                        incremental=True, cores=2)
+            for ms_file in ms_files:
+                if os.path.basename(ms_file) == removed + '.ms':
+                    self.assertFalse(os.path.isfile(ms_file))
+                else:
+                    self.assertEqual(os.path.getmtime(ms_file), 0)
+            self.assertEqual(tribe, read_tribe('test_tribe_incremental'))
+            manifest_file = os.path.join(
+                'test_tribe_incremental', 'tribe_manifest.csv')
+            self.assertTrue(os.path.isfile(manifest_file))
+            # The manifest is only kept for incremental writes
+            tribe.write(filename='test_tribe_incremental', compress=False)
+            self.assertFalse(os.path.isfile(manifest_file))
+            self.assertEqual(tribe, read_tribe('test_tribe_incremental'))
+            # Changed templates are appended to the compressed archive
+            tribe.write(filename='test_tribe_incremental', incremental=True)
+            archive_size = os.path.getsize('test_tribe_incremental.tgz')
+            tribe[0].lowcut = 3.0
+            tribe.write(filename='test_tribe_incremental', incremental=True)
+            appended = os.path.getsize(
+                'test_tribe_incremental.tgz') - archive_size
+            self.assertGreater(appended, 0)
+            self.assertLess(appended, archive_size / 2)
+            for lazy in [False, True]:
+                self.assertEqual(tribe, read_tribe(
+                    'test_tribe_incremental.tgz', lazy=lazy))
+            tribe.remove(tribe[0])
+            tribe.write(filename='test_tribe_incremental', incremental=True)
+            self.assertEqual(
+                tribe, read_tribe('test_tribe_incremental.tgz'))
+        finally:
+            if os.path.isdir('test_tribe_incremental'):
+                shutil.rmtree('test_tribe_incremental')
+            if os.path.isfile('test_tribe_incremental.tgz'):
+                os.remove('test_tribe_incremental.tgz')
+
     def test_tribe_io_sc3ml(self):
         """Test reading and writing or Tribe objects using tar form."""
         try:
@@ -1167,6 +1731,68 @@ class TestMatchObjectLight(unittest.TestCase):
             if os.path.isfile('test_party_out_no_cat2.tgz'):
                 os.remove('test_party_out_no_cat2.tgz')
 
+    def test_party_io_npz(self):
+        """Test reading and writing party objects with binary families."""
+        if os.path.isfile('test_party_out_npz.tgz'):
+            os.remove('test_party_out_npz.tgz')
+        try:
+            self.party.write(
+                filename='test_party_out_npz', detection_format='npz')
+            party_back = read_party(fname='test_party_out_npz.tgz')
+            self.assertTrue(self.party.__eq__(party_back, verbose=True))
+        finally:
+            if os.path.isfile('test_party_out_npz.tgz'):
+                os.remove('test_party_out_npz.tgz')
+
+    def test_party_io_lazy(self):
+        """Test building the detections of npz families on access."""
+        if os.path.isfile('test_party_out_lazy.tgz'):
+            os.remove('test_party_out_lazy.tgz')
+        try:
+            self.party.write(
+                filename='test_party_out_lazy', detection_format='npz')
+            party_back = read_party(
+                fname='test_party_out_lazy.tgz', lazy=True)
+            for family in party_back:
+                self.assertFalse('detections' in family.__dict__)
+            family = party_back[0]
+            self.assertEqual(
+                family, self.party.select(family.template.name))
+            self.assertTrue('detections' in family.__dict__)
+            self.assertFalse('_columns' in family.__dict__)
+            self.assertTrue(self.party.__eq__(party_back, verbose=True))
+        finally:
+            if os.path.isfile('test_party_out_lazy.tgz'):
+                os.remove('test_party_out_lazy.tgz')
+
+    def test_party_io_select(self):
+        """Test reading selected families and detections from a party."""
+        if os.path.isfile('test_party_out_select.tgz'):
+            os.remove('test_party_out_select.tgz')
+        family = self.party.sort()[1]
+        times = sorted([d.detect_time for d in family])
+        try:
+            for detection_format in ['csv', 'npz']:
+                self.party.write(
+                    filename='test_party_out_select',
+                    detection_format=detection_format)
+                party_back = read_party(
+                    fname='test_party_out_select.tgz',
+                    template_names=[family.template.name])
+                self.assertEqual(len(party_back.families), 1)
+                self.assertEqual(party_back[0], family)
+                party_back = read_party(
+                    fname='test_party_out_select.tgz',
+                    starttime=times[0], endtime=times[0])
+                self.assertEqual(len(party_back.families), 4)
+                self.assertEqual(
+                    len(party_back.select(family.template.name)),
+                    len([t for t in times if t == times[0]]))
+                os.remove('test_party_out_select.tgz')
+        finally:
+            if os.path.isfile('test_party_out_select.tgz'):
+                os.remove('test_party_out_select.tgz')
+
     def test_family_methods(self):
         """Test basic methods on Family objects."""
         family = self.family.copy()
@@ -1239,6 +1865,55 @@ class TestMatchObjectLight(unittest.TestCase):
         self.assertEqual(family.catalog, get_catalog(family.detections))
 
 
+class TestPartyIOSpeeds:
+    """ Time reading of large synthetic parties """
+    n_detections = 500
+
+    @pytest.fixture(scope='class')
+    def large_party(self):
+        """ a party with n_detections in each family """
+        party = Party().read()
+        families = []
+        for family in party:
+            template = family.template
+            chans = [(tr.stats.station, tr.stats.channel)
+                     for tr in template.st]
+            detections = []
+            for i in range(self.n_detections):
+                detection = Detection(
+                    template_name=template.name,
+                    detect_time=UTCDateTime(2012, 1, 1) + (i * 10.5),
+                    no_chans=len(chans), detect_val=len(chans) * 0.5,
+                    threshold=len(chans) * 0.2, typeofdet='corr',
+                    threshold_type='absolute',
+                    threshold_input=len(chans) * 0.2, chans=chans)
+                detection._calculate_event(template=template)
+                detections.append(detection)
+            families.append(Family(template=template, detections=detections))
+        return Party(families=families)
+
+    @pytest.mark.parametrize('detection_format', ['csv', 'npz'])
+    def test_large_party_read(self, large_party, detection_format):
+        """ read a large party back in with the detection catalog """
+        filename = 'test_large_party_' + detection_format
+        if os.path.isfile(filename + '.tgz'):
+            os.remove(filename + '.tgz')
+        try:
+            large_party.write(
+                filename=filename, detection_format=detection_format)
+            party_back = time_func(
+                read_party, 'read_party ' + detection_format,
+                fname=filename + '.tgz')
+            assert len(party_back) == len(large_party)
+            for family in large_party:
+                family_back = party_back.select(family.template.name)
+                assert family_back.detections[-1].event is not None
+                assert family.detections == family_back.detections
+        finally:
+            if os.path.isfile(filename + '.tgz'):
+                os.remove(filename + '.tgz')
+
+
 def compare_families(party, party_in, float_tol=0.001, check_event=True):
     party.sort()
     party_in.sort()
@@ -8,12 +8,15 @@ from __future__ import unicode_literals
 
 import unittest
 import os
+import shutil
+import tempfile
 import numpy as np
 
-from obspy import read, Trace, UTCDateTime
+from obspy import read, Stream, Trace, UTCDateTime
 
 from eqcorrscan.utils.pre_processing import process, dayproc, shortproc
-from eqcorrscan.utils.pre_processing import _check_daylong
+from eqcorrscan.utils.pre_processing import _check_daylong, _resample_2d
+from eqcorrscan.utils.pre_processing import batch_process, ProcessedDataCache
 
 
 class TestPreProcessing(unittest.TestCase):
@@ -327,6 +330,148 @@ class TestPreProcessing(unittest.TestCase):
         self.assertTrue(np.all(
             processed.trim(self.gap_starttime, self.gap_endtime).data) == 0)
 
+    def test_batch_dayproc(self):
+        """Check that batched processing matches trace-by-trace."""
+        for parallel in [False, True]:
+            processed = dayproc(
+                st=self.st.copy(), lowcut=0.1, highcut=0.4, filt_order=3,
+                samp_rate=1, starttime=self.day_start, debug=0,
+                parallel=False, num_cores=2)
+            batched = dayproc(
+                st=self.st.copy(), lowcut=0.1, highcut=0.4, filt_order=3,
+                samp_rate=1, starttime=self.day_start, debug=0,
+                parallel=parallel, num_cores=2, batch=True)
+            self.assertEqual(len(processed), len(batched))
+            for tr, batch_tr in zip(processed, batched):
+                self.assertEqual(tr.id, batch_tr.id)
+                self.assertEqual(tr.stats.starttime, batch_tr.stats.starttime)
+                self.assertTrue(np.allclose(tr.data, batch_tr.data))
+
+    def test_batch_masked_trace(self):
+        """Check that batched processing handles gaps."""
+        tr = self.gappy_trace
+        processed = process(tr=tr.copy(), lowcut=0.1, highcut=0.4,
+                            filt_order=3, samp_rate=1, debug=0,
+                            starttime=False, clip=False, length=3600,
+                            seisan_chan_names=True, ignore_length=False)
+        batched = batch_process(
+            st=Stream([tr.copy(), self.st[1].copy()]), lowcut=0.1,
+            highcut=0.4, filt_order=3, samp_rate=1, debug=0,
+            starttime=False, clip=False, length=3600,
+            seisan_chan_names=True, ignore_length=False)
+        self.assertEqual(len(batched), 2)
+        self.assertEqual(batched[0].id, processed.id)
+        self.assertEqual(batched[0].stats.starttime, processed.stats.starttime)
+        self.assertEqual(batched[0].stats.npts, processed.stats.npts)
+        self.assertTrue(np.allclose(batched[0].data, processed.data))
+
+    def test_batch_resample(self):
+        """Check that batched resampling matches obspy's resampling."""
+        st = self.short_stream.copy().detrend('simple')
+        for samp_rate in [0.5, 0.3]:
+            resampled = _resample_2d(
+                np.vstack([tr.data for tr in st]).astype(np.float64),
+                sampling_rate=1.0, samp_rate=samp_rate)
+            for tr, data in zip(st, resampled):
+                expected = tr.copy().resample(samp_rate, window='hann')
+                self.assertTrue(np.allclose(expected.data, data))
+
+    def test_threaded_processing(self):
+        """Check that thread-based processing matches serial processing."""
+        st = self.short_stream.copy()
+        st[0] = self.gappy_trace.copy()
+        processed = shortproc(
+            st=st.copy(), lowcut=0.1, highcut=0.4, filt_order=3,
+            samp_rate=1, debug=0, parallel=False)
+        threaded = shortproc(
+            st=st, lowcut=0.1, highcut=0.4, filt_order=3, samp_rate=1,
+            debug=0, parallel=True, num_cores=2, threaded=True)
+        self.assertEqual(processed, threaded)
+        self.assertIs(threaded, st)
+        processed = dayproc(
+            st=self.st.copy(), lowcut=0.1, highcut=0.4, filt_order=3,
+            samp_rate=1, starttime=self.day_start, debug=0, parallel=False)
+        threaded = dayproc(
+            st=self.st.copy(), lowcut=0.1, highcut=0.4, filt_order=3,
+            samp_rate=1, starttime=self.day_start, debug=0, parallel=True,
+            num_cores=2, threaded=True)
+        self.assertEqual(processed, threaded)
+
+    def test_float32_processing(self):
+        """Check that data can be processed into float32."""
+        st = self.st.copy()
+        start = st[0].stats.starttime
+        st[0] = (st[0].copy().trim(start, start + 40000) +
+                 st[0].copy().trim(start + 41000, start + 86400))
+        kwargs = dict(lowcut=0.1, highcut=0.4, filt_order=3, samp_rate=1,
+                      debug=0, starttime=self.day_start, parallel=False)
+        for batch in [False, True]:
+            processed = dayproc(st=st.copy(), batch=batch, **kwargs)
+            processed_32 = dayproc(
+                st=st.copy(), batch=batch, dtype=np.float32, **kwargs)
+            for tr, tr_32 in zip(processed, processed_32):
+                self.assertEqual(tr_32.data.dtype, np.float32)
+                self.assertEqual(tr.stats.npts, tr_32.stats.npts)
+                self.assertTrue(np.allclose(
+                    tr.data, tr_32.data, atol=1e-5 * np.abs(tr.data).max()))
+
+    def test_processed_cache(self):
+        """Check that the processed data cache is keyed and bounded."""
+        cache_dir = tempfile.mkdtemp()
+        kwargs = dict(lowcut=0.1, highcut=0.4, filt_order=3, samp_rate=1,
+                      debug=0, parallel=False)
+        try:
+            cache = ProcessedDataCache(cache_dir)
+            processed = shortproc(st=self.short_stream.copy(), **kwargs)
+            cached = cache.process(shortproc, self.short_stream.copy(),
+                                   **kwargs)
+            self.assertEqual(processed, cached)
+            cached = cache.process(shortproc, self.short_stream.copy(),
+                                   **kwargs)
+            self.assertEqual(processed, cached)
+            self.assertEqual((cache.hits, cache.misses),
+                             (self.nchans, self.nchans))
+            # Headers are stored as JSON, not pickles
+            extensions = set(os.path.splitext(fname)[1]
+                             for fname in os.listdir(cache_dir))
+            self.assertEqual(extensions, {'.json', '.npy'})
+            # Changed raw data should be re-processed
+            st = self.short_stream.copy()
+            st[0].data[100] += 10
+            cache.process(shortproc, st, **kwargs)
+            self.assertEqual(cache.misses, self.nchans + 1)
+            cache.clear()
+            self.assertEqual(len(os.listdir(cache_dir)), 0)
+            # Least recently used channels should be evicted
+            cache.process(shortproc, self.short_stream[0:1].copy(), **kwargs)
+            cache.max_size = cache._entries()[0][1]
+            cache.process(shortproc, self.short_stream[1:2].copy(), **kwargs)
+            entries = cache._entries()
+            self.assertEqual(len(entries), 1)
+            self.assertTrue(entries[0][0].startswith(self.short_stream[1].id))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def test_polyphase_resample(self):
+        """Check polyphase resampling in single and batched processing."""
+        processed = shortproc(
+            st=self.short_stream.copy(), lowcut=0.05, highcut=0.2,
+            filt_order=3, samp_rate=0.5, debug=0, parallel=False,
+            resample_method='polyphase')
+        batched = shortproc(
+            st=self.short_stream.copy(), lowcut=0.05, highcut=0.2,
+            filt_order=3, samp_rate=0.5, debug=0, parallel=False,
+            resample_method='polyphase', batch=True)
+        for tr, batch_tr, raw in zip(processed, batched, self.short_stream):
+            self.assertEqual(tr.stats.sampling_rate, 0.5)
+            self.assertEqual(tr.stats.starttime, raw.stats.starttime)
+            self.assertEqual(tr.stats.npts, int(raw.stats.npts / 2))
+            self.assertTrue(np.allclose(tr.data, batch_tr.data))
+        with self.assertRaises(NotImplementedError):
+            shortproc(
+                st=self.short_stream.copy(), lowcut=0.05, highcut=0.2,
+                filt_order=3, samp_rate=0.5, debug=0, parallel=False,
+                resample_method='linear')
 
 
 if __name__ == '__main__':
@@ -116,6 +116,38 @@ class TestAlignRealData(unittest.TestCase):
         known_ccs = [round(cc, 3) for cc in known_ccs]
         self.assertEqual(ccs, list(known_ccs))
 
+    def test_known_align_interpolate(self):
+        """Test that interpolated shifts are close to known shifts."""
+        shifts, ccs = align_traces(trace_list=self.trace_list, shift_len=200,
+                                   interpolate=True)
+        known_shifts, known_ccs = align_traces(
+            trace_list=self.trace_list, shift_len=200)
+        delta = self.trace_list[0].stats.delta
+        self.assertNotEqual(shifts, known_shifts)
+        for shift, cc, known_shift, known_cc in zip(
+                shifts, ccs, known_shifts, known_ccs):
+            self.assertLessEqual(abs(shift - known_shift), 2 * delta)
+            self.assertEqual(np.sign(cc), np.sign(known_cc))
+            self.assertGreaterEqual(abs(cc), abs(known_cc) - 0.01)
+
+    def test_align_interpolate_negative(self):
+        """Test interpolating the positive peak of a negative correlation."""
+        x = np.arange(300, dtype=float)
+        # A decreasing image and an increasing trace are always anti-correlated
+        master = Trace(data=-x - 15 * np.sin(x / 20.),
+                       header={'sampling_rate': 100.0})
+        trace = Trace(data=np.arange(100, dtype=float),
+                      header={'sampling_rate': 100.0})
+        known_shifts, known_ccs = align_traces(
+            trace_list=[trace], shift_len=20, master=master, positive=True)
+        self.assertLess(known_ccs[0], 0)
+        shifts, ccs = align_traces(
+            trace_list=[trace], shift_len=20, master=master, positive=True,
+            interpolate=True)
+        self.assertLessEqual(abs(shifts[0] - known_shifts[0]),
+                             2 * master.stats.delta)
+        self.assertAlmostEqual(ccs[0], known_ccs[0], 2)
+
 if __name__ == '__main__':
     """
     Run stacking tests
@@ -0,0 +1,138 @@
+"""
+Functions for testing the utils.worker_pool functions.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import time
+import unittest
+import numpy as np
+
+from multiprocessing import TimeoutError
+from obspy import read, Trace
+
+from eqcorrscan.utils.pre_processing import shortproc
+from eqcorrscan.utils.worker_pool import (
+    WorkerPool, pool_context, shared_memory, _SharedArray)
+
+
+def _double(tr):
+    tr.data = tr.data * 2
+    return tr
+
+
+def _stream_length(st):
+    return sum(tr.stats.npts for tr in st)
+
+
+def _identity(obj):
+    return obj
+
+
+def _slow_sum(data):
+    time.sleep(1)
+    return data.sum()
+
+
+class WorkerPoolTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        testing_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)), 'test_data',
+            'day_vols', 'Y2012', 'R086.01', '*')
+        st = read(testing_path)
+        cls.st = st.trim(st[0].stats.starttime, st[0].stats.starttime + 3600)
+        cls.pool = WorkerPool(processes=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_trace_round_trip(self):
+        """Check that traces come back intact from the workers."""
+        tr = Trace(np.arange(100, dtype=np.float32))
+        tr.stats.station = 'TEST'
+        doubled = self.pool.apply_async(_double, (tr, )).get()
+        self.assertEqual(doubled.stats.station, 'TEST')
+        self.assertEqual(doubled.data.dtype, np.float32)
+        self.assertTrue(np.array_equal(doubled.data, tr.data * 2))
+        # Input should not be changed
+        self.assertEqual(tr.data[1], 1)
+
+    def test_nested_round_trip(self):
+        """Check that lists and dicts of streams and arrays are shared."""
+        obj = {'stream': self.st.copy(), 'arrays': [np.ones(4), 'a']}
+        back = self.pool.apply_async(_identity, (obj, )).get()
+        self.assertEqual(back['stream'], self.st)
+        self.assertTrue(np.array_equal(back['arrays'][0], np.ones(4)))
+        self.assertEqual(back['arrays'][1], 'a')
+
+    def test_masked_trace(self):
+        """Masked data cannot be shared, but should still be processed."""
+        tr = Trace(np.ma.masked_array(
+            np.arange(10, dtype=np.float64), mask=[False] * 5 + [True] * 5))
+        doubled = self.pool.apply_async(_double, (tr, )).get()
+        self.assertTrue(np.ma.is_masked(doubled.data))
+        self.assertEqual(doubled.data[4], 8)
+
+    def test_share_once(self):
+        """Check that shared objects can be re-used and sliced."""
+        shared = self.pool.share([self.st, np.arange(10)])
+        try:
+            lengths = [self.pool.apply_async(_stream_length, (shared[0], ))
+                       for _ in range(3)]
+            for length in lengths:
+                self.assertEqual(length.get(), _stream_length(self.st))
+            window = self.pool.apply_async(_identity, (shared[1][2:5], ))
+            self.assertTrue(np.array_equal(window.get(), [2, 3, 4]))
+        finally:
+            self.pool.release(shared)
+
+    @unittest.skipIf(shared_memory is None, "No shared memory support")
+    def test_memory_freed(self):
+        """Check that shared memory is unlinked once results are returned."""
+        shared = self.pool.share(np.arange(10))
+        self.assertIsInstance(shared, _SharedArray)
+        self.pool.release(shared)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=shared.name)
+
+    @unittest.skipIf(shared_memory is None, "No shared memory support")
+    def test_timeout_keeps_arguments(self):
+        """Check that arguments are not freed while a task is running."""
+        result = self.pool.apply_async(_slow_sum, (np.arange(10), ))
+        names = [shm.name for shm in result._blocks]
+        with self.assertRaises(TimeoutError):
+            result.get(timeout=0.01)
+        for name in names:
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+        self.assertEqual(result.get(), 45)
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+
+    def test_pool_context(self):
+        """Check that given pools are not closed by the context manager."""
+        with pool_context(self.pool) as pool:
+            self.assertIs(pool, self.pool)
+        result = self.pool.apply_async(_identity, (1, ))
+        self.assertEqual(result.get(), 1)
+
+    def test_shortproc_pool(self):
+        """Check that processing in a persistent pool matches serial."""
+        processed = shortproc(
+            st=self.st.copy(), lowcut=0.1, highcut=0.4, filt_order=3,
+            samp_rate=1, debug=0, parallel=False)
+        for _ in range(2):
+            pooled = shortproc(
+                st=self.st.copy(), lowcut=0.1, highcut=0.4, filt_order=3,
+                samp_rate=1, debug=0, pool=self.pool)
+            self.assertEqual(processed, pooled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,9 +18,15 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import glob
+import io
 import os
+import sqlite3
+import threading
 import warnings
-import glob
+from collections import OrderedDict
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from obspy import read, UTCDateTime, Stream
 from obspy.clients.fdsn.header import FDSNException
@@ -28,7 +34,8 @@ from obspy.clients.seishub import Client as SeishubClient
 from obspy.clients.fdsn import Client as FDSNClient
 
 
-def read_data(archive, arc_type, day, stachans, length=86400):
+def read_data(archive, arc_type, day, stachans, length=86400,
+              index_file=None):
     """
     Function to read the appropriate data from an archive for a day.
 
@@ -36,10 +43,12 @@ def read_data(archive, arc_type, day, stachans, length=86400):
     :param archive:
         The archive source - if arc_type is seishub, this should be a url,
         if the arc_type is FDSN then this can be either a url or a known obspy
-        client.  If arc_type is day_vols, then this is the path to the top
-        directory.
+        client.  If arc_type is day_vols, directory or SDS, then this is the
+        path to the top directory. If arc_type is SDS this can also be an
+        :class:`SDSArchive`, which keeps its cache of files between calls.
     :type arc_type: str
-    :param arc_type: The type of archive, can be: seishub, FDSN, day_volumes
+    :param arc_type:
+        The type of archive, can be: seishub, FDSN, day_vols, directory, SDS
     :type day: datetime.date
     :param day: Date to retrieve data for
     :type stachans: list
@@ -47,6 +56,11 @@ def read_data(archive, arc_type, day, stachans, length=86400):
         will not fail if stations are not available, but will warn.
     :type length: float
     :param length: Data length to extract in seconds, defaults to 1 day.
+    :type index_file: str
+    :param index_file:
+        SQLite file to keep the :class:`ArchiveIndex` of a day_vols or
+        directory archive in, re-used and updated between calls. If None, a
+        temporary in-memory index is used.
 
     :returns: Stream of data
     :rtype: obspy.core.stream.Stream
@@ -59,6 +73,23 @@ def read_data(archive, arc_type, day, stachans, length=86400):
         possible to allow for a more general situation.  If you require more \
         speed you will need to re-write this.
 
+    .. note:: If arc_type is SDS, then the archive should follow the \
+        SeisComP Data Structure of \
+        year/network/station/channel.D/network.station.location.channel.D.\
+        year.julday. Only the miniseed records covering the requested data \
+        are decoded, and channels are read concurrently, see \
+        :class:`SDSArchive`.
+
+    .. note:: If arc_type is directory, then all files below the archive \
+        directory are indexed, whatever their naming and length, and files \
+        with data between day and day + length are read.
+
+    .. note:: For day_vols and directory archives, the headers of files are \
+        read once into an index of station, channel, time-span and file \
+        path, and data are found with one index lookup per channel. Using an \
+        index_file keeps the index between calls, when only new or changed \
+        files (by modification time and size) are read again.
+
     .. rubric:: Example
 
     >>> from obspy import UTCDateTime
@@ -98,89 +129,514 @@ def read_data(archive, arc_type, day, stachans, length=86400):
 | 1.0 Hz, 86400 samples
     """
     st = []
-    available_stations = _check_available_data(archive, arc_type, day)
-    for station in stachans:
-        if len(station[1]) == 2:
-            # Cope with two char channel naming in seisan
-            station_map = (station[0], station[1][0] + '*' + station[1][1])
-            available_stations_map = [(sta[0], sta[1][0] + '*' + sta[1][-1])
-                                      for sta in available_stations]
-        else:
-            station_map = station
-            available_stations_map = available_stations
-        if station_map not in available_stations_map:
-            msg = ' '.join([station[0], station_map[1], 'is not available for',
-                            day.strftime('%Y/%m/%d')])
-            warnings.warn(msg)
-            continue
-        if arc_type.lower() == 'seishub':
-            client = SeishubClient(archive)
-            st += client.get_waveforms(
-                    network='*', station=station_map[0], location='*',
-                    channel=station_map[1], starttime=UTCDateTime(day),
-                    endtime=UTCDateTime(day) + length)
-        elif arc_type.upper() == "FDSN":
-            client = FDSNClient(archive)
-            try:
-                st += client.get_waveforms(
-                    network='*', station=station_map[0], location='*',
-                    channel=station_map[1], starttime=UTCDateTime(day),
-                    endtime=UTCDateTime(day) + length)
-            except FDSNException:
-                warnings.warn('No data on server despite station being ' +
-                              'available...')
+    index = None
+    if arc_type.upper() == 'SDS':
+        if not isinstance(archive, SDSArchive):
+            archive = SDSArchive(archive)
+        available_stations = _check_available_data(
+            archive, arc_type, day, length=length)
+        bulk = []
+        for station in stachans:
+            station_map = _station_map(station, available_stations, day)
+            if station_map is None:
                 continue
-        elif arc_type.lower() == 'day_vols':
-            wavfiles = _get_station_file(os.path.join(
-                archive, day.strftime('Y%Y' + os.sep + 'R%j.01')),
-                station_map[0], station_map[1])
-            for wavfile in wavfiles:
-                st += read(wavfile, starttime=day, endtime=day + length)
+            bulk.append(('*', station_map[0], '*', station_map[1],
+                         UTCDateTime(day), UTCDateTime(day) + length))
+        return archive.get_waveforms_bulk(bulk)
+    if arc_type.lower() in ['day_vols', 'directory']:
+        index = ArchiveIndex(index_file=index_file or ':memory:')
+    try:
+        available_stations = _check_available_data(
+            archive, arc_type, day, index=index, length=length)
+        for station in stachans:
+            st += _read_station(
+                archive=archive, arc_type=arc_type, day=day,
+                station=station, available_stations=available_stations,
+                length=length, index=index)
+    finally:
+        if index is not None:
+            index.close()
     st = Stream(st)
     return st
 
 
-def _get_station_file(path_name, station, channel, debug=0):
+def _read_station(archive, arc_type, day, station, available_stations,
+                  length=86400, index=None):
+    """
+    Read the data for one station and channel from an archive.
+
+    :type archive: str
+    :param archive: The archive source, see read_data.
+    :type arc_type: str
+    :param arc_type: The type of archive, see read_data.
+    :type day: datetime.date
+    :param day: Date to retrieve data for
+    :type station: tuple
+    :param station: Tuple of (station, channel)
+    :type available_stations: list
+    :param available_stations:
+        List of (station, channel) available in the archive.
+    :type length: float
+    :param length: Data length to extract in seconds.
+    :type index: :class:`ArchiveIndex`
+    :param index: Index of a day_vols or directory archive.
+
+    :returns: list of traces
+    """
+    st = []
+    station_map = _station_map(station, available_stations, day)
+    if station_map is None:
+        return st
+    if arc_type.lower() == 'seishub':
+        client = SeishubClient(archive)
+        st += client.get_waveforms(
+                network='*', station=station_map[0], location='*',
+                channel=station_map[1], starttime=UTCDateTime(day),
+                endtime=UTCDateTime(day) + length)
+    elif arc_type.upper() == "FDSN":
+        client = FDSNClient(archive)
+        try:
+            st += client.get_waveforms(
+                network='*', station=station_map[0], location='*',
+                channel=station_map[1], starttime=UTCDateTime(day),
+                endtime=UTCDateTime(day) + length)
+        except FDSNException:
+            warnings.warn('No data on server despite station being ' +
+                          'available...')
+    elif arc_type.lower() in ['day_vols', 'directory']:
+        wavfiles = index.get_files(
+            station=station_map[0], channel=station_map[1],
+            starttime=UTCDateTime(day), endtime=UTCDateTime(day) + length,
+            directory=_index_directory(archive, arc_type, day))
+        for wavfile in wavfiles:
+            st += read(wavfile, starttime=UTCDateTime(day),
+                       endtime=UTCDateTime(day) + length)
+    return st
+
+
+def _station_map(station, available_stations, day):
     """
-    Helper function to find the correct file.
+    Map a requested station and channel to the names used in an archive.
+
+    :type station: tuple
+    :param station: Tuple of (station, channel)
+    :type available_stations: list
+    :param available_stations:
+        List of (station, channel) available in the archive.
+    :type day: datetime.date
+    :param day: Date data are requested for, used for warnings.
 
-    :type path_name: str
-    :param path_name: Path to files to check.
-    :type station: str
-    :type channel: str
+    :returns:
+        tuple of (station, channel), or None, with a warning, if not
+        available.
+    """
+    if len(station[1]) == 2:
+        # Cope with two char channel naming in seisan
+        station_map = (station[0], station[1][0] + '*' + station[1][1])
+        available_stations_map = [(sta[0], sta[1][0] + '*' + sta[1][-1])
+                                  for sta in available_stations]
+    else:
+        station_map = station
+        available_stations_map = available_stations
+    if station_map not in available_stations_map:
+        msg = ' '.join([station[0], station_map[1], 'is not available for',
+                        day.strftime('%Y/%m/%d')])
+        warnings.warn(msg)
+        return None
+    return station_map
+
+
+class SDSArchive(object):
+    """
+    Reader of SeisComP Data Structure (SDS) miniseed archives.
+
+    Reads are windowed: only the miniseed records covering the requested
+    time-span are decoded. The raw contents of recently used day files are
+    kept in a least-recently-used cache, so many short windows from the same
+    day only read the file from disk once. Bulk requests are read
+    concurrently in threads. Can be used as a client with
+    :meth:`eqcorrscan.core.match_filter.Tribe.client_detect`.
+
+    :type root: str
+    :param root: Path to the top directory of the archive.
+    :type cache_size: int
+    :param cache_size: Maximum number of day files to keep in memory.
+    :type max_workers: int
+    :param max_workers:
+        Maximum number of threads for bulk requests, defaults to the number
+        of cores.
+    :type data_type: str
+    :param data_type: SDS data type, usually "D" for data.
+    :type fileborder_seconds: float
+    :param fileborder_seconds:
+        Files for adjacent days are also read if the request is within this
+        many seconds of a day boundary, to get records that cross day files.
 
-    :returns: list of filenames, str
+    .. rubric:: Example
+
+    >>> import shutil
+    >>> import tempfile
+    >>> import eqcorrscan
+    >>> TEST_PATH = os.path.dirname(eqcorrscan.__file__) + '/tests/test_data'
+    >>> st = read(os.path.join(
+    ...     TEST_PATH, 'day_vols', 'Y2012', 'R086.01', 'WHYM*'))
+    >>> root = tempfile.mkdtemp()
+    >>> path = os.path.join(root, '2012', 'AF', 'WHYM', 'SHZ.D')
+    >>> os.makedirs(path)
+    >>> st.write(os.path.join(path, 'AF.WHYM..SHZ.D.2012.086'),
+    ...          format='MSEED')
+    >>> archive = SDSArchive(root)
+    >>> print(archive.get_waveforms(
+    ...     'AF', 'WHYM', '', 'SHZ', UTCDateTime(2012, 3, 26, 12),
+    ...     UTCDateTime(2012, 3, 26, 12, 1)))
+    1 Trace(s) in Stream:
+    AF.WHYM..SHZ | 2012-03-26T12:00:00.000000Z - 2012-03-26T12:01:00.000000Z \
+| 1.0 Hz, 61 samples
+    >>> shutil.rmtree(root)
+    """
+    def __init__(self, root, cache_size=32, max_workers=None,
+                 data_type='D', fileborder_seconds=30):
+        self.root = root
+        self.cache_size = cache_size
+        self.max_workers = max_workers or cpu_count()
+        self.data_type = data_type
+        self.fileborder_seconds = fileborder_seconds
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _day_pattern(self, network, station, location, channel, day):
+        return os.path.join(
+            self.root, day.strftime('%Y'), network, station,
+            '{0}.{1}'.format(channel, self.data_type),
+            '.'.join([network, station, location, channel, self.data_type,
+                      day.strftime('%Y'), day.strftime('%j')]))
+
+    def _get_files(self, network, station, location, channel, starttime,
+                   endtime):
+        """Find the day files that could hold data for a request."""
+        files = []
+        for day in _days(starttime - self.fileborder_seconds,
+                         endtime + self.fileborder_seconds):
+            files.extend(sorted(glob.glob(self._day_pattern(
+                network, station, location, channel, day))))
+        return files
+
+    def _read_file(self, path):
+        """Get the contents of a day file, through the cache."""
+        with self._lock:
+            if path in self._cache:
+                self.hits += 1
+                data = self._cache.pop(path)
+                self._cache[path] = data
+                return data
+            self.misses += 1
+        with open(path, 'rb') as f:
+            data = f.read()
+        with self._lock:
+            self._cache[path] = data
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    def clear(self):
+        """Empty the cache of day files."""
+        with self._lock:
+            self._cache.clear()
+
+    def get_waveforms(self, network, station, location, channel, starttime,
+                      endtime):
+        """
+        Read data for a channel from the archive.
+
+        Codes can contain wildcards, as for
+        :meth:`obspy.clients.filesystem.sds.Client.get_waveforms`.
+
+        :type network: str
+        :param network: Network code
+        :type station: str
+        :param station: Station code
+        :type location: str
+        :param location: Location code
+        :type channel: str
+        :param channel: Channel code
+        :type starttime: :class:`obspy.core.UTCDateTime`
+        :param starttime: Start of data to read
+        :type endtime: :class:`obspy.core.UTCDateTime`
+        :param endtime: End of data to read
+
+        :returns: :class:`obspy.core.stream.Stream`
+        """
+        starttime, endtime = UTCDateTime(starttime), UTCDateTime(endtime)
+        st = Stream()
+        for path in self._get_files(network, station, location, channel,
+                                    starttime, endtime):
+            st += _read_window(self._read_file(path), starttime, endtime)
+        # Join records from adjacent day files
+        st.merge(method=-1)
+        st.trim(starttime, endtime)
+        return st
+
+    def get_waveforms_bulk(self, bulk):
+        """
+        Read data for many channels concurrently.
+
+        :type bulk: list
+        :param bulk:
+            List of (network, station, location, channel, starttime,
+            endtime) tuples.
+
+        :returns: :class:`obspy.core.stream.Stream`
+        """
+        st = Stream()
+        if len(bulk) == 0:
+            return st
+        pool = ThreadPool(processes=min(self.max_workers, len(bulk)))
+        try:
+            streams = pool.map(lambda args: self.get_waveforms(*args), bulk)
+        finally:
+            pool.close()
+            pool.join()
+        for _st in streams:
+            st += _st
+        return st
+
+    def available(self, starttime, endtime):
+        """
+        Find the stations and channels with day files within a time-span.
+
+        :type starttime: :class:`obspy.core.UTCDateTime`
+        :param starttime: Start of time-span
+        :type endtime: :class:`obspy.core.UTCDateTime`
+        :param endtime: End of time-span
+
+        :returns: list of tuples of (station, channel)
+        """
+        available_stations = set()
+        for day in _days(UTCDateTime(starttime), UTCDateTime(endtime)):
+            for path in glob.glob(self._day_pattern(
+                    '*', '*', '*', '*', day)):
+                codes = os.path.basename(path).split('.')
+                available_stations.add((codes[1], codes[3]))
+        return sorted(available_stations)
+
+
+def _read_window(data, starttime, endtime):
+    """Decode the miniseed records of raw data covering a time-span."""
+    try:
+        return read(io.BytesIO(data), format='MSEED', starttime=starttime,
+                    endtime=endtime)
+    except TypeError:
+        # obspy fails to report that file-like objects have no data in the
+        # time-span, as it does for files.
+        return Stream()
+
+
+def _days(starttime, endtime):
+    """Get the start of each day between two times."""
+    day = UTCDateTime(starttime.date)
+    while day <= endtime:
+        yield day
+        day += 86400
+
+
+class ArchiveIndex(object):
     """
-    wavfiles = glob.glob(path_name + os.sep + '*')
+    Persistent index of the waveform files in a directory archive.
 
-    out_files = [_check_data(wavfile, station, channel, debug=debug)
-                 for wavfile in wavfiles]
-    out_files = list(set(out_files))
-    return out_files
+    The station, channel, time-span and path of every trace in the files
+    of indexed directories are stored in an SQLite database, along with the
+    modification time and size of the files. Updating a directory only reads
+    the headers of new or changed files, and finding the files for a channel
+    is a single lookup.
 
+    :type index_file: str
+    :param index_file:
+        SQLite file to store the index in, created if it does not exist.
+        Use ':memory:' for an index that is not kept.
 
-def _check_data(wavfile, station, channel, debug=0):
+    .. rubric:: Example
+
+    >>> import eqcorrscan
+    >>> from obspy import UTCDateTime
+    >>> TEST_PATH = os.path.dirname(eqcorrscan.__file__) + '/tests/test_data'
+    >>> day_dir = os.path.join(TEST_PATH, 'day_vols', 'Y2012', 'R086.01')
+    >>> index = ArchiveIndex()
+    >>> index.update(day_dir)
+    3
+    >>> index.update(day_dir)
+    0
+    >>> files = index.get_files(
+    ...     station='WHYM', channel='SHZ', starttime=UTCDateTime(2012, 3, 26),
+    ...     endtime=UTCDateTime(2012, 3, 27))
+    >>> print([os.path.basename(f) for f in files])
+    ['WHYM.AF..SHZ.2012.086']
+    >>> index.close()
     """
-    Inner loop for parallel checks.
-
-    :type wavfile: str
-    :param wavfile: Wavefile path name to look in.
-    :type station: str
-    :param station: Channel name to check for
-    :type channel: str
-    :param channel: Channel name to check for
-    :type debug: int
-    :param debug: Debug level, if > 1, will output what it it working on.
+    def __init__(self, index_file=':memory:'):
+        self.index_file = index_file
+        self._conn = sqlite3.connect(index_file)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, "
+                "directory TEXT, mtime REAL, size INTEGER)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS traces (path TEXT, "
+                "directory TEXT, network TEXT, station TEXT, location TEXT, "
+                "channel TEXT, starttime REAL, endtime REAL)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS files_directory ON files "
+                "(directory)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS traces_channel ON traces "
+                "(station, channel, starttime, endtime)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the index database."""
+        self._conn.close()
+
+    def update(self, directory, recursive=False):
+        """
+        Index new and changed files in a directory, and forget removed files.
+
+        :type directory: str
+        :param directory: Directory to index.
+        :type recursive: bool
+        :param recursive: Whether to also index all sub-directories.
+
+        :returns: Number of files whose headers were read.
+        """
+        if recursive:
+            directories = [dirpath for dirpath, _, _ in os.walk(directory)]
+        else:
+            directories = [directory]
+        n_read = 0
+        for dirname in directories:
+            n_read += self._update_directory(os.path.abspath(dirname))
+        return n_read
+
+    def _update_directory(self, directory):
+        indexed = {
+            path: (mtime, size) for path, mtime, size in self._conn.execute(
+                "SELECT path, mtime, size FROM files WHERE directory = ?",
+                (directory, ))}
+        current = {}
+        if os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                path = os.path.join(directory, filename)
+                if not os.path.isfile(path) or _same_file(
+                        path, self.index_file):
+                    continue
+                stat = os.stat(path)
+                current.update({path: (stat.st_mtime, stat.st_size)})
+        n_read = 0
+        with self._conn:
+            for path in set(indexed.keys()) - set(current.keys()):
+                self._forget(path)
+            for path, (mtime, size) in current.items():
+                if indexed.get(path) == (mtime, size):
+                    continue
+                self._forget(path)
+                self._conn.execute(
+                    "INSERT INTO files VALUES (?, ?, ?, ?)",
+                    (path, directory, mtime, size))
+                n_read += 1
+                try:
+                    headers = read(path, headonly=True)
+                except Exception:
+                    # Not a waveform file, remembered so it is not re-read
+                    continue
+                self._conn.executemany(
+                    "INSERT INTO traces VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(path, directory, tr.stats.network, tr.stats.station,
+                      tr.stats.location, tr.stats.channel,
+                      tr.stats.starttime.timestamp,
+                      tr.stats.endtime.timestamp) for tr in headers])
+        return n_read
+
+    def _forget(self, path):
+        self._conn.execute("DELETE FROM files WHERE path = ?", (path, ))
+        self._conn.execute("DELETE FROM traces WHERE path = ?", (path, ))
+
+    def get_files(self, station, channel, starttime, endtime,
+                  directory=None):
+        """
+        Find the files with data for a channel within a time-span.
+
+        :type station: str
+        :param station: Station name, can contain wildcards.
+        :type channel: str
+        :param channel: Channel name, can contain wildcards.
+        :type starttime: :class:`obspy.core.UTCDateTime`
+        :param starttime: Start of time-span
+        :type endtime: :class:`obspy.core.UTCDateTime`
+        :param endtime: End of time-span
+        :type directory: str
+        :param directory: Only find files in this directory.
+
+        :returns: list of file paths
+        """
+        query = ("SELECT DISTINCT path FROM traces WHERE station GLOB ? AND "
+                 "channel GLOB ? AND starttime <= ? AND endtime >= ?")
+        args = (station, channel, UTCDateTime(endtime).timestamp,
+                UTCDateTime(starttime).timestamp)
+        if directory is not None:
+            query += " AND directory = ?"
+            args += (os.path.abspath(directory), )
+        return sorted(row[0] for row in self._conn.execute(query, args))
+
+    def available(self, starttime, endtime, directory=None):
+        """
+        Find the stations and channels with data within a time-span.
+
+        :type starttime: :class:`obspy.core.UTCDateTime`
+        :param starttime: Start of time-span
+        :type endtime: :class:`obspy.core.UTCDateTime`
+        :param endtime: End of time-span
+        :type directory: str
+        :param directory: Only find data in this directory.
+
+        :returns: list of tuples of (station, channel)
+        """
+        query = ("SELECT DISTINCT station, channel FROM traces WHERE "
+                 "starttime <= ? AND endtime >= ?")
+        args = (UTCDateTime(endtime).timestamp,
+                UTCDateTime(starttime).timestamp)
+        if directory is not None:
+            query += " AND directory = ?"
+            args += (os.path.abspath(directory), )
+        return sorted(self._conn.execute(query, args))
+
+
+def _same_file(path, other):
+    """Check if path is the file other, which may not exist."""
+    try:
+        return os.path.samefile(path, other)
+    except OSError:
+        return False
+
+
+def _index_directory(archive, arc_type, day):
     """
-    if debug > 1:
-        print('Checking ' + wavfile)
-    st = read(wavfile, headonly=True)
-    for tr in st:
-        if tr.stats.station == station and tr.stats.channel == channel:
-            return wavfile
+    Get the directory of an archive holding the data for a day.
+
+    :returns: str, or None if data can be anywhere in the archive.
+    """
+    if arc_type.lower() == 'day_vols':
+        return os.path.join(archive, day.strftime('Y%Y'),
+                            day.strftime('R%j.01'))
+    return None
 
 
-def _check_available_data(archive, arc_type, day):
+def _check_available_data(archive, arc_type, day, index=None,
+                          length=86400):
     """
     Function to check what stations are available in the archive for a given \
     day.
@@ -191,6 +647,14 @@ def _check_available_data(archive, arc_type, day):
     :param arc_type: The type of archive, can be:
     :type day: datetime.date
     :param day: Date to retrieve data for
+    :type index: :class:`ArchiveIndex`
+    :param index:
+        Index of a day_vols or directory archive, if None a temporary index
+        is used.
+    :type length: float
+    :param length:
+        Data length in seconds to check for day_vols, directory and SDS
+        archives.
 
     :returns: list of tuples of (station, channel) as available.
 
@@ -198,13 +662,21 @@ def _check_available_data(archive, arc_type, day):
 
     """
     available_stations = []
-    if arc_type.lower() == 'day_vols':
-        wavefiles = glob.glob(os.path.join(archive, day.strftime('Y%Y'),
-                                           day.strftime('R%j.01'), '*'))
-        for wavefile in wavefiles:
-            header = read(wavefile, headonly=True)
-            available_stations.append((header[0].stats.station,
-                                       header[0].stats.channel))
+    if arc_type.lower() in ['day_vols', 'directory']:
+        if index is None:
+            with ArchiveIndex() as index:
+                return _check_available_data(
+                    archive, arc_type, day, index=index, length=length)
+        directory = _index_directory(archive, arc_type, day)
+        index.update(directory or archive, recursive=directory is None)
+        available_stations = index.available(
+            starttime=UTCDateTime(day), endtime=UTCDateTime(day) + length,
+            directory=directory)
+    elif arc_type.upper() == 'SDS':
+        if not isinstance(archive, SDSArchive):
+            archive = SDSArchive(archive)
+        available_stations = archive.available(
+            starttime=UTCDateTime(day), endtime=UTCDateTime(day) + length)
     elif arc_type.lower() == 'seishub':
         client = SeishubClient(archive)
         st = client.get_previews(starttime=UTCDateTime(day),
@@ -15,7 +15,9 @@ from __future__ import unicode_literals
 
 import os
 import warnings
-from multiprocessing import Pool, cpu_count
+from functools import partial
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -28,6 +30,7 @@ from eqcorrscan.utils import stacking
 from eqcorrscan.utils.archive_read import read_data
 from eqcorrscan.utils.correlate import get_array_xcorr
 from eqcorrscan.utils.mag_calc import dist_calc
+from eqcorrscan.utils.worker_pool import pool_context
 
 
 def cross_chan_coherence(st1, st2, allow_shift=False, shift_len=0.2, i=0,
@@ -90,7 +93,8 @@ def cross_chan_coherence(st1, st2, allow_shift=False, shift_len=0.2, i=0,
         return 0, i
 
 
-def distance_matrix(stream_list, allow_shift=False, shift_len=0, cores=1):
+def distance_matrix(stream_list, allow_shift=False, shift_len=0, cores=1,
+                    pool=None):
     """
     Compute distance matrix for waveforms based on cross-correlations.
 
@@ -109,6 +113,10 @@ def distance_matrix(stream_list, allow_shift=False, shift_len=0, cores=1):
     :param shift_len: How many seconds for templates to shift
     :type cores: int
     :param cores: Number of cores to parallel process using, defaults to 1.
+    :type pool: :class:`eqcorrscan.utils.worker_pool.WorkerPool`
+    :param pool:
+        Persistent worker pool to compute coherences in, if given `cores` is
+        ignored.
 
     :returns: distance matrix
     :rtype: :class:`numpy.ndarray`
@@ -121,27 +129,29 @@ def distance_matrix(stream_list, allow_shift=False, shift_len=0, cores=1):
     # Initialize square matrix
     dist_mat = np.array([np.array([0.0] * len(stream_list))] *
                         len(stream_list))
-    for i, master in enumerate(stream_list):
-        # Start a parallel processing pool
-        pool = Pool(processes=cores)
-        # Parallel processing
-        results = [pool.apply_async(cross_chan_coherence,
-                                    args=(master, stream_list[j], allow_shift,
-                                          shift_len, j))
-                   for j in range(len(stream_list))]
-        pool.close()
-        # Extract the results when they are done
-        dist_list = [p.get() for p in results]
-        # Close and join all the processes back to the master process
-        pool.join()
-        # Sort the results by the input j
-        dist_list.sort(key=lambda tup: tup[1])
-        # Sort the list into the dist_mat structure
-        for j in range(i, len(stream_list)):
-            if i == j:
-                dist_mat[i, j] = 0.0
-            else:
-                dist_mat[i, j] = 1 - dist_list[j][0]
+    with pool_context(pool, processes=cores) as worker_pool:
+        # Share the streams once rather than sending them for every pair
+        shared_streams = worker_pool.share(list(stream_list))
+        try:
+            for i in range(len(stream_list)):
+                # Parallel processing
+                results = [worker_pool.apply_async(
+                    cross_chan_coherence,
+                    args=(shared_streams[i], shared_streams[j], allow_shift,
+                          shift_len, j))
+                           for j in range(len(stream_list))]
+                # Extract the results when they are done
+                dist_list = [p.get() for p in results]
+                # Sort the results by the input j
+                dist_list.sort(key=lambda tup: tup[1])
+                # Sort the list into the dist_mat structure
+                for j in range(i, len(stream_list)):
+                    if i == j:
+                        dist_mat[i, j] = 0.0
+                    else:
+                        dist_mat[i, j] = 1 - dist_list[j][0]
+        finally:
+            worker_pool.release(shared_streams)
     # Reshape the distance matrix
     for i in range(1, len(stream_list)):
         for j in range(i):
@@ -573,7 +583,7 @@ def corr_cluster(trace_list, thresh=0.9):
 
 def extract_detections(detections, templates, archive, arc_type,
                        extract_len=90.0, outdir=None, extract_Z=True,
-                       additional_stations=[]):
+                       additional_stations=[], output_format='ms', cores=1):
     """
     Extract waveforms associated with detections
 
@@ -581,6 +591,8 @@ def extract_detections(detections, templates, archive, arc_type,
     returned as a list of :class:`obspy.core.stream.Stream` containing
     segments of extract_len.  They will also be saved if outdir is set.
     The default is unset.  The  default extract_len is 90 seconds per channel.
+    Data are read once per day for all detections on that day, and the
+    windows for each detection are sliced from the day of data.
 
     :type detections: list
     :param detections: List of :class:`eqcorrscan.core.match_filter.Detection`.
@@ -593,7 +605,8 @@ def extract_detections(detections, templates, archive, arc_type,
         Either name of archive or path to continuous data, see
         :func:`eqcorrscan.utils.archive_read` for details
     :type arc_type: str
-    :param arc_type: Type of archive, either seishub, FDSN, day_vols
+    :param arc_type:
+        Type of archive, either seishub, FDSN, day_vols, directory or SDS
     :type extract_len: float
     :param extract_len:
         Length to extract around the detection (will be equally cut around
@@ -605,7 +618,8 @@ def extract_detections(detections, templates, archive, arc_type,
         named according to the detection time, NOT than the waveform
         start time. Detections will be saved into template subdirectories.
         Files written will be multiplexed miniseed files, the encoding will
-        be chosen automatically and will likely be float.
+        be chosen automatically and will likely be float. See output_format
+        for writing one file per template and day instead.
     :type extract_Z: bool
     :param extract_Z:
         Set to True to also extract Z channels for detections delays will be
@@ -615,6 +629,14 @@ def extract_detections(detections, templates, archive, arc_type,
     :param additional_stations:
         List of tuples of (station, channel) to also extract data
         for using an average delay.
+    :type output_format: str
+    :param output_format:
+        Format to save detections in if outdir is set, either 'ms' to write
+        one miniseed file per detection, or 'npz' to write the detections
+        of each template for each day into one file named by the day, which
+        can be read with :func:`read_extracted_detections`.
+    :type cores: int
+    :param cores: Number of days to read and extract from concurrently.
 
     :returns: list of :class:`obspy.core.streams.Stream`
     :rtype: list
@@ -690,6 +712,9 @@ def extract_detections(detections, templates, archive, arc_type,
     Cutting for detections at: 2012/03/26 18:05:00
     Written file: ./temp2/2012-03-26_18-05-00.ms
     """
+    if output_format not in ['ms', 'npz']:
+        raise NotImplementedError(
+            "output_format {0} is not supported".format(output_format))
     # Sort the template according to start-times, needed so that stachan[i]
     # corresponds to delays[i]
     all_delays = []  # List of tuples of template name, delays
@@ -704,14 +729,10 @@ def extract_detections(detections, templates, archive, arc_type,
         all_stachans.append((template[0], stachans))
     # Sort the detections and group by day
     detections.sort(key=lambda d: d.detect_time)
-    detection_days = [detection.detect_time.date
-                      for detection in detections]
-    detection_days = list(set(detection_days))
-    detection_days.sort()
-    detection_days = [UTCDateTime(d) for d in detection_days]
-
-    # Initialize output list
-    detection_wavefiles = []
+    day_detections = {}
+    for detection in detections:
+        day_detections.setdefault(
+            detection.detect_time.date, []).append(detection)
 
     # Also include Z channels when extracting detections
     if extract_Z:
@@ -747,52 +768,172 @@ def extract_detections(detections, templates, archive, arc_type,
                     print('Added station ' + '.'.join(sta))
                     template[1].append(sta)
                     all_delays[t][1].append(av_delay)
-    del stachans
-    # Loop through the days
-    for detection_day in detection_days:
-        print('Working on detections for day: ' + str(detection_day))
-        stachans = list(set([stachans[1] for stachans in all_stachans][0]))
-        # List of all unique stachans - read in all data
-        st = read_data(archive=archive, arc_type=arc_type, day=detection_day,
-                       stachans=stachans)
-        st.merge(fill_value='interpolate')
-        day_detections = [detection for detection in detections
-                          if UTCDateTime(detection.detect_time.date) ==
-                          detection_day]
-        del stachans, delays
-        for detection in day_detections:
-            print('Cutting for detections at: ' +
-                  detection.detect_time.strftime('%Y/%m/%d %H:%M:%S'))
-            detect_wav = st.copy()
-            for tr in detect_wav:
-                t1 = UTCDateTime(detection.detect_time) - extract_len / 2
-                t2 = UTCDateTime(detection.detect_time) + extract_len / 2
-                tr.trim(starttime=t1, endtime=t2)
-            if outdir:
-                if not os.path.isdir(os.path.join(outdir,
-                                                  detection.template_name)):
-                    os.makedirs(os.path.join(outdir, detection.template_name))
-                detect_wav.write(os.path.join(outdir, detection.template_name,
-                                              detection.detect_time.
-                                              strftime('%Y-%m-%d_%H-%M-%S') +
-                                              '.ms'),
-                                 format='MSEED')
-                print('Written file: %s' %
-                      '/'.join([outdir, detection.template_name,
-                                detection.detect_time.
-                               strftime('%Y-%m-%d_%H-%M-%S') + '.ms']))
-            if not outdir:
-                detection_wavefiles.append(detect_wav)
-            del detect_wav
-        del st
-        if outdir:
-            detection_wavefiles = []
+    # List of all unique stachans - read in all data
+    stachans = sorted(set(
+        stachan for template in all_stachans for stachan in template[1]))
+    extract = partial(
+        _extract_day, archive=archive, arc_type=arc_type, stachans=stachans,
+        extract_len=extract_len, outdir=outdir, output_format=output_format)
+    args = [(UTCDateTime(detection_day), day_detections[detection_day])
+            for detection_day in sorted(day_detections.keys())]
+    if cores > 1 and len(args) > 1:
+        pool = ThreadPool(processes=min(cores, len(args)))
+        try:
+            day_wavefiles = pool.map(lambda arg: extract(*arg), args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        day_wavefiles = [extract(*arg) for arg in args]
     if not outdir:
-        return detection_wavefiles
+        return [detect_wav for wavefiles in day_wavefiles
+                for detect_wav in wavefiles]
     else:
         return
 
 
+def _extract_day(detection_day, detections, archive, arc_type, stachans,
+                 extract_len, outdir=None, output_format='ms'):
+    """
+    Extract waveforms for all the detections on one day.
+
+    :type detection_day: obspy.core.UTCDateTime
+    :param detection_day: Start of the day.
+    :type detections: list
+    :param detections: Detections made on the day, sorted by time.
+    :type archive: str
+    :param archive: Archive to read from, see extract_detections.
+    :type arc_type: str
+    :param arc_type: Type of archive, see extract_detections.
+    :type stachans: list
+    :param stachans: Tuples of (station, channel) to read.
+    :type extract_len: float
+    :param extract_len: Length to extract around each detection in seconds.
+    :type outdir: str
+    :param outdir: Directory to write detections to, see extract_detections.
+    :type output_format: str
+    :param output_format: Format to write detections in.
+
+    :returns: list of :class:`obspy.core.streams.Stream`, empty if written.
+    """
+    print('Working on detections for day: ' + str(detection_day))
+    st = read_data(archive=archive, arc_type=arc_type, day=detection_day,
+                   stachans=stachans)
+    st.merge(fill_value='interpolate')
+    detection_wavefiles = []
+    for detection in detections:
+        print('Cutting for detections at: ' +
+              detection.detect_time.strftime('%Y/%m/%d %H:%M:%S'))
+        t1 = UTCDateTime(detection.detect_time) - extract_len / 2
+        t2 = UTCDateTime(detection.detect_time) + extract_len / 2
+        # Only copy the data in the window, not the whole day
+        detect_wav = st.slice(
+            starttime=t1, endtime=t2, keep_empty_traces=True).copy()
+        if outdir and output_format == 'ms':
+            _makedirs(os.path.join(outdir, detection.template_name))
+            detect_wav.write(os.path.join(outdir, detection.template_name,
+                                          detection.detect_time.
+                                          strftime('%Y-%m-%d_%H-%M-%S') +
+                                          '.ms'),
+                             format='MSEED')
+            print('Written file: %s' %
+                  '/'.join([outdir, detection.template_name,
+                            detection.detect_time.
+                           strftime('%Y-%m-%d_%H-%M-%S') + '.ms']))
+        else:
+            detection_wavefiles.append(detect_wav)
+    if outdir and output_format == 'npz':
+        template_names = sorted(set(d.template_name for d in detections))
+        for template_name in template_names:
+            _makedirs(os.path.join(outdir, template_name))
+            filename = os.path.join(
+                outdir, template_name,
+                detection_day.strftime('%Y-%m-%d') + '.npz')
+            _write_extracted(
+                streams=[detect_wav for detection, detect_wav in zip(
+                    detections, detection_wavefiles)
+                    if detection.template_name == template_name],
+                detections=[d for d in detections
+                            if d.template_name == template_name],
+                filename=filename)
+            print('Written file: %s' % filename)
+        detection_wavefiles = []
+    return detection_wavefiles
+
+
+def _makedirs(dirname):
+    """Make a directory if it does not exist, safe to call from threads."""
+    try:
+        os.makedirs(dirname)
+    except OSError:
+        if not os.path.isdir(dirname):
+            raise
+
+
+def _write_extracted(streams, detections, filename):
+    """
+    Write the waveforms of many detections to one columnar numpy file.
+
+    :type streams: list
+    :param streams: List of :class:`obspy.core.stream.Stream`
+    :type detections: list
+    :param detections: Detection for each stream.
+    :type filename: str
+    :param filename: File to write to.
+    """
+    traces = [(i, tr) for i, st in enumerate(streams) for tr in st]
+    data = [tr.data for _, tr in traces]
+    columns = {
+        'template_name': np.array(
+            [d.template_name for d in detections], dtype=np.str_),
+        'detect_time': np.array(
+            [d.detect_time.ns for d in detections], dtype=np.int64),
+        'trace_detection': np.array(
+            [i for i, _ in traces], dtype=np.int64),
+        'trace_id': np.array([tr.id for _, tr in traces], dtype=np.str_),
+        'starttime': np.array(
+            [tr.stats.starttime.ns for _, tr in traces], dtype=np.int64),
+        'sampling_rate': np.array(
+            [tr.stats.sampling_rate for _, tr in traces], dtype=np.float64),
+        'data_offset': np.cumsum([0] + [len(d) for d in data]),
+        'data': np.concatenate(data) if len(data) else np.empty(0)}
+    with open(filename, 'wb') as f:
+        np.savez(f, **columns)
+
+
+def read_extracted_detections(filename):
+    """
+    Read detection waveforms written by extract_detections in npz format.
+
+    :type filename: str
+    :param filename:
+        File written by :func:`extract_detections` with
+        `output_format='npz'`.
+
+    :returns:
+        list of :class:`obspy.core.streams.Stream`, one per detection in time
+        order.
+    """
+    with np.load(filename, allow_pickle=False) as columns:
+        n_detections = len(columns['detect_time'])
+        trace_detection = columns['trace_detection']
+        trace_ids = columns['trace_id'].tolist()
+        starttimes = columns['starttime']
+        sampling_rates = columns['sampling_rate']
+        data_offset = columns['data_offset']
+        data = columns['data']
+    streams = [Stream() for _ in range(n_detections)]
+    for i, trace_id in enumerate(trace_ids):
+        network, station, location, channel = trace_id.split('.')
+        streams[trace_detection[i]] += Trace(
+            data=data[data_offset[i]:data_offset[i + 1]], header={
+                'network': network, 'station': station,
+                'location': location, 'channel': channel,
+                'starttime': UTCDateTime(ns=int(starttimes[i])),
+                'sampling_rate': sampling_rates[i]})
+    return streams
+
+
 def dist_mat_km(catalog):
     """
     Compute the distance matrix for all a catalog using epicentral separation.
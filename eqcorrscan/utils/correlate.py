@@ -173,7 +173,8 @@ def pool_boy(Pool, traces, **kwargs):
     pool.join()
 
 
-def _pool_normxcorr(templates, stream, pool, func, *args, **kwargs):
+def _pool_normxcorr(templates, stream, pool, func, stack=True, *args,
+                    **kwargs):
     chans = [[] for _i in range(len(templates))]
     array_dict_tuple = _get_array_dicts(templates, stream)
     stream_dict, template_dict, pad_dict, seed_ids = array_dict_tuple
@@ -187,7 +188,10 @@ def _pool_normxcorr(templates, stream, pool, func, *args, **kwargs):
     except KeyboardInterrupt as e:  # pragma: no cover
         pool.terminate()
         raise e
-    cccsums = np.sum(xcorrs, axis=0)
+    if stack:
+        cccsums = np.sum(xcorrs, axis=0)
+    else:
+        cccsums = np.stack(xcorrs, axis=1)
     no_chans = np.sum(np.array(tr_chans).astype(np.int), axis=0)
     for seed_id, tr_chan in zip(seed_ids, tr_chans):
         for chan, state in zip(chans, tr_chan):
@@ -202,7 +206,8 @@ def _general_multithread(func):
 
     def multithread(templates, stream, *args, **kwargs):
         with pool_boy(ThreadPool, len(stream), **kwargs) as pool:
-            return _pool_normxcorr(templates, stream, pool=pool, func=func)
+            return _pool_normxcorr(templates, stream, pool=pool, func=func,
+                                   stack=kwargs.get('stack', True))
 
     return multithread
 
@@ -210,7 +215,8 @@ def _general_multithread(func):
 def _general_multiprocess(func):
     def multiproc(templates, stream, *args, **kwargs):
         with pool_boy(ProcessPool, len(stream), **kwargs) as pool:
-            return _pool_normxcorr(templates, stream, pool=pool, func=func)
+            return _pool_normxcorr(templates, stream, pool=pool, func=func,
+                                   stack=kwargs.get('stack', True))
 
     return multiproc
 
@@ -221,13 +227,22 @@ def _general_serial(func):
         chans = [[] for _ in range(len(templates))]
         array_dict_tuple = _get_array_dicts(templates, stream)
         stream_dict, template_dict, pad_dict, seed_ids = array_dict_tuple
-        cccsums = np.zeros([len(templates),
-                            len(stream[0]) - len(templates[0][0]) + 1])
-        for seed_id in seed_ids:
+        stack = kwargs.get('stack', True)
+        if stack:
+            cccsums = np.zeros([len(templates),
+                                len(stream[0]) - len(templates[0][0]) + 1])
+        else:
+            cccsums = np.zeros([len(templates), len(seed_ids),
+                                len(stream[0]) - len(templates[0][0]) + 1],
+                               dtype=np.float32)
+        for i, seed_id in enumerate(seed_ids):
             tr_cc, tr_chans = func(template_dict[seed_id],
                                    stream_dict[seed_id],
                                    pad_dict[seed_id])
-            cccsums = np.sum([cccsums, tr_cc], axis=0)
+            if stack:
+                cccsums = np.sum([cccsums, tr_cc], axis=0)
+            else:
+                cccsums[:, i] = tr_cc
             no_chans += tr_chans.astype(np.int)
             for chan, state in zip(chans, tr_chans):
                 if state:
@@ -543,8 +558,8 @@ def fftw_normxcorr(templates, stream, pads, threaded=False, *args, **kwargs):
 
     # Check that stream is non-zero and above variance threshold
     if not np.all(stream == 0) and np.var(stream) < 1e-8:
-        # Apply gain
-        stream *= 1e8
+        # Apply gain, without changing the input data
+        stream = stream * 1e8
         warnings.warn("Low variance found for, applying gain "
                       "to stabilise correlations")
     ret = func(
@@ -599,6 +614,9 @@ def _time_threaded_normxcorr(templates, stream, *args, **kwargs):
         list of list of tuples of station, channel for all cross-correlations.
     :rtype: list
     """
+    if not kwargs.get('stack', True):
+        return _general_serial(time_multi_normxcorr)(
+            templates, stream, *args, **kwargs)
     no_chans = np.zeros(len(templates))
     chans = [[] for _ in range(len(templates))]
     array_dict_tuple = _get_array_dicts(templates, stream)
@@ -659,6 +677,10 @@ def _fftw_stream_xcorr(templates, stream, *args, **kwargs):
         num_cores_outer = 1
     elif num_cores_outer is not None and num_cores_inner is None:
         num_cores_inner = 1
+    if not kwargs.get('stack', True):
+        # Correlations are summed in the C routine
+        return _general_serial(fftw_normxcorr)(
+            templates, stream, *args, **kwargs)
 
     chans = [[] for _i in range(len(templates))]
     array_dict_tuple = _get_array_dicts(templates, stream)
@@ -749,8 +771,8 @@ def fftw_multi_normxcorr(template_array, stream_array, pad_array, seed_ids,
     for x in seed_ids:
         # Check that stream is non-zero and above variance threshold
         if not np.all(stream_array[x] == 0) and np.var(stream_array[x]) < 1e-8:
-            # Apply gain
-            stream_array *= 1e8
+            # Apply gain, without changing the input data
+            stream_array[x] = stream_array[x] * 1e8
             warnings.warn("Low variance found for {0}, applying gain "
                           "to stabilise correlations".format(x))
     stream_array = np.ascontiguousarray([stream_array[x] for x in seed_ids],
@@ -810,6 +832,14 @@ def get_stream_xcorr(name_or_func=None, concurrency=None):
         - multiprocess - use a process pool for concurrency;
         - concurrent - use a customized concurrency strategy for the function,
           if not defined threading will be used.
+
+    .. Note::
+        The returned callable returns the correlation sums for each template.
+        If called with `stack=False` it instead returns the correlations of
+        each channel as an array of shape (templates, channels, samples), with
+        channels in the order of the (sorted) template traces. The built-in
+        'concurrent' strategies sum correlations internally, so fall back to
+        serial correlation when `stack=False`.
     """
     func = _get_registerd_func(name_or_func)
 
@@ -820,6 +850,66 @@ def get_stream_xcorr(name_or_func=None, concurrency=None):
     return getattr(func, concur)
 
 
+# --------------------------- multi-image correlation
+
+
+def multi_image_normxcorr(template, images):
+    """
+    Compute the normalized cross-correlation of one template with many images.
+
+    All images are correlated in one vectorised FFT, which is much faster
+    than correlating them one at a time when there are many short images,
+    as in lag-calc.
+
+    :param template: 1D array of template data
+    :type template: np.ndarray
+    :param images: 2D array of images, one per row, at least as long as the
+        template.
+    :type images: np.ndarray
+
+    :return:
+        np.ndarray of cross-correlations, one row for each image. Rows are
+        NaN if the template has no variance, and correlations are zero where
+        the image has no variance.
+    """
+    template = np.asarray(template, dtype=np.float64)
+    images = np.atleast_2d(np.asarray(images, dtype=np.float64))
+    template_length = len(template)
+    image_length = images.shape[1]
+    if template_length > image_length:
+        raise CorrelationError(
+            "Images (%i samples) are shorter than the template (%i samples)"
+            % (image_length, template_length))
+    n_lags = image_length - template_length + 1
+    if images.shape[0] == 0:
+        return np.zeros((0, n_lags), dtype=np.float32)
+    # De-meaning the images does not change the correlations, but reduces
+    # rounding in the running sums below.
+    images = images - images.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        norm = (template - template.mean()) / (
+            template.std() * template_length)
+    fftshape = next_fast_len(template_length + image_length - 1)
+    res = np.fft.irfft(
+        np.fft.rfft(images, fftshape, axis=-1) *
+        np.fft.rfft(norm[::-1], fftshape), fftshape, axis=-1)[
+        :, template_length - 1:image_length]
+    # Running mean and standard deviation of the images
+    sums = np.zeros((images.shape[0], image_length + 1))
+    np.cumsum(images, axis=1, out=sums[:, 1:])
+    squares = np.zeros_like(sums)
+    np.cumsum(images ** 2, axis=1, out=squares[:, 1:])
+    mean = (sums[:, template_length:] - sums[:, :n_lags]) / template_length
+    var = ((squares[:, template_length:] - squares[:, :n_lags]) /
+           template_length) - mean ** 2
+    flat = var <= 1e-12 * np.maximum(
+        (images ** 2).mean(axis=1, keepdims=True), np.finfo(float).tiny)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ccc = res / np.sqrt(np.where(flat, 1.0, var))
+    ccc[flat & ~np.isnan(ccc)] = 0.0
+    return ccc.astype(np.float32)
+
+
 # --------------------------- stream prep functions
 
 
@@ -841,11 +931,13 @@ def _get_array_dicts(templates, stream, copy_streams=True):
     # pull common channels out of streams and templates and put in dicts
     for i, seed_id in enumerate(seed_ids):
         temps_with_seed = [template[i].data for template in templates]
-        t_ar = np.array(temps_with_seed).astype(np.float32)
+        t_ar = np.array(temps_with_seed, dtype=np.float32)
         template_dict.update({seed_id: t_ar})
+        # Data processed as float32 are used without copying
         stream_dict.update(
             {seed_id: stream.select(
-                id=seed_id.split('_')[0])[0].data.astype(np.float32)})
+                id=seed_id.split('_')[0])[0].data.astype(
+                    np.float32, copy=False)})
         pad_list = [
             int(round(template[i].stats.sampling_rate *
                       (template[i].stats.starttime - t_starts[j])))
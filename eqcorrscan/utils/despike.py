@@ -21,17 +21,18 @@ import warnings
 import numpy as np
 import matplotlib.pyplot as plt
 
-from multiprocessing import Pool, cpu_count
+from multiprocessing import cpu_count
 from obspy import Trace
 
 from eqcorrscan.utils.timer import Timer
+from eqcorrscan.utils.worker_pool import pool_context
 from eqcorrscan.utils.plotting import peaks_plot
 from eqcorrscan.core.match_filter import normxcorr2
 from eqcorrscan.utils.findpeaks import find_peaks2_short
 
 
 def median_filter(tr, multiplier=10, windowlength=0.5,
-                  interp_len=0.05, debug=0):
+                  interp_len=0.05, debug=0, pool=None):
     """
     Filter out spikes in data above a multiple of MAD of the data.
 
@@ -50,6 +51,10 @@ def median_filter(tr, multiplier=10, windowlength=0.5,
     :param interp_len: Length in seconds to interpolate around spikes.
     :type debug: int
     :param debug: Debug output level between 0 and 5, higher is more output.
+    :type pool: :class:`eqcorrscan.utils.worker_pool.WorkerPool`
+    :param pool:
+        Persistent worker pool to search windows in, defaults to a temporary
+        pool using all cores.
 
     :returns: :class:`obspy.core.trace.Trace`
 
@@ -75,19 +80,22 @@ def median_filter(tr, multiplier=10, windowlength=0.5,
     _interp_len = int(interp_len * tr.stats.sampling_rate)
     peaks = []
     with Timer() as t:
-        pool = Pool(processes=num_cores)
-        results = [pool.apply_async(_median_window,
-                                    args=(data[chunk * _windowlength:
-                                               (chunk + 1) * _windowlength],
-                                          chunk * _windowlength, multiplier,
-                                          tr.stats.starttime + windowlength,
-                                          tr.stats.sampling_rate,
-                                          debug))
-                   for chunk in range(int(len(data) / _windowlength))]
-        pool.close()
-        for p in results:
-            peaks += p.get()
-        pool.join()
+        with pool_context(pool, processes=num_cores) as worker_pool:
+            # Data are shared once, and windows are slices of the shared data
+            shared_data = worker_pool.share(data)
+            try:
+                results = [worker_pool.apply_async(
+                    _median_window,
+                    args=(shared_data[chunk * _windowlength:
+                                      (chunk + 1) * _windowlength],
+                          chunk * _windowlength, multiplier,
+                          tr.stats.starttime + windowlength,
+                          tr.stats.sampling_rate, debug))
+                           for chunk in range(int(len(data) / _windowlength))]
+                for p in results:
+                    peaks += p.get()
+            finally:
+                worker_pool.release(shared_data)
         for peak in peaks:
             tr.data = _interp_gap(tr.data, peak[1], _interp_len)
     print("Despiking took: %s s" % t.secs)
@@ -14,14 +14,27 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+import hashlib
+import json
 import numpy as np
 import datetime as dt
+import warnings
 
-from multiprocessing import Pool, cpu_count
+from fractions import Fraction
+
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from obspy import Stream, Trace, UTCDateTime
 from obspy.signal.filter import bandpass, lowpass, highpass
+from scipy.signal import (
+    iirfilter, zpk2sos, sosfilt, get_window, resample_poly)
 from eqcorrscan.utils.debug_log import debug_print
+from eqcorrscan.utils.worker_pool import pool_context
+
+
+RESAMPLE_METHODS = ('fft', 'polyphase')
 
 
 def _check_daylong(tr):
@@ -59,7 +72,9 @@ def _check_daylong(tr):
 
 def shortproc(st, lowcut, highcut, filt_order, samp_rate, debug=0,
               parallel=False, num_cores=False, starttime=None, endtime=None,
-              seisan_chan_names=False, fill_gaps=True):
+              seisan_chan_names=False, fill_gaps=True, batch=False,
+              resample_method='fft', pool=None, threaded=False,
+              dtype=None):
     """
     Basic function to bandpass and downsample.
 
@@ -98,6 +113,27 @@ def shortproc(st, lowcut, highcut, filt_order, samp_rate, debug=0,
         rather than SEED convention of three) - defaults to True.
     :type fill_gaps: bool
     :param fill_gaps: Whether to pad any gaps found with zeros or not.
+    :type batch: bool
+    :param batch:
+        Whether to resample and filter channels of the same length and
+        sampling-rate together as 2D arrays, see :func:`batch_process`.
+        If parallel is True, this will use `num_cores` threads.
+    :type resample_method: str
+    :param resample_method:
+        Method used to resample data, see :func:`process`.
+    :type pool: :class:`eqcorrscan.utils.worker_pool.WorkerPool`
+    :param pool:
+        Persistent worker pool to process traces in. If given, traces are
+        processed in parallel in this pool, and `parallel` and `num_cores`
+        are ignored.
+    :type threaded: bool
+    :param threaded:
+        If parallel is True and no pool is given, process traces in
+        `num_cores` threads rather than processes. Traces are processed in
+        place without being copied to workers, which reduces memory use;
+        the resampling and filtering routines release the GIL.
+    :type dtype: numpy.dtype
+    :param dtype: Data type of the processed data, see :func:`process`.
 
     :return: Processed stream
     :rtype: :class:`obspy.core.stream.Stream`
@@ -193,33 +229,40 @@ def shortproc(st, lowcut, highcut, filt_order, samp_rate, debug=0,
             st.remove(tr)
             debug_print('No data for %s.%s after trim' %
                         (tr.stats.station, tr.stats.channel), 1, debug)
-    if parallel:
+    if batch:
+        st = batch_process(
+            st=st, lowcut=lowcut, highcut=highcut, filt_order=filt_order,
+            samp_rate=samp_rate, debug=debug, starttime=starttime, clip=clip,
+            length=length, seisan_chan_names=seisan_chan_names,
+            fill_gaps=fill_gaps, cores=num_cores if parallel else 1,
+            resample_method=resample_method, dtype=dtype)
+    elif parallel or pool is not None:
         if not num_cores:
             num_cores = cpu_count()
         if num_cores > len(st):
             num_cores = len(st)
-        pool = Pool(processes=num_cores)
-        results = [pool.apply_async(process, (tr,), {
+        kwargs = {
             'lowcut': lowcut, 'highcut': highcut, 'filt_order': filt_order,
             'samp_rate': samp_rate, 'debug': debug, 'starttime': starttime,
             'clip': clip, 'seisan_chan_names': seisan_chan_names,
-            'fill_gaps': fill_gaps, 'length': length})
-                   for tr in st]
-        pool.close()
-        try:
-            stream_list = [p.get() for p in results]
-        except KeyboardInterrupt as e:  # pragma: no cover
-            pool.terminate()
-            raise e
-        pool.join()
-        st = Stream(stream_list)
+            'fill_gaps': fill_gaps, 'length': length,
+            'resample_method': resample_method, 'dtype': dtype}
+        if threaded and pool is None:
+            _thread_process(st, cores=num_cores, **kwargs)
+        else:
+            with pool_context(pool, processes=num_cores) as worker_pool:
+                results = [worker_pool.apply_async(process, (tr,), kwargs)
+                           for tr in st]
+                stream_list = [p.get() for p in results]
+            st = Stream(stream_list)
     else:
         for i, tr in enumerate(st):
             st[i] = process(
                 tr=tr, lowcut=lowcut, highcut=highcut, filt_order=filt_order,
                 samp_rate=samp_rate, debug=debug, starttime=starttime,
                 clip=clip, seisan_chan_names=seisan_chan_names,
-                fill_gaps=fill_gaps, length=length)
+                fill_gaps=fill_gaps, length=length,
+                resample_method=resample_method, dtype=dtype)
     if tracein:
         st.merge()
         return st[0]
@@ -228,7 +271,9 @@ def shortproc(st, lowcut, highcut, filt_order, samp_rate, debug=0,
 
 def dayproc(st, lowcut, highcut, filt_order, samp_rate, starttime, debug=0,
             parallel=True, num_cores=False, ignore_length=False,
-            seisan_chan_names=False, fill_gaps=True):
+            seisan_chan_names=False, fill_gaps=True, batch=False,
+            resample_method='fft', pool=None, threaded=False,
+            dtype=None):
     """
     Wrapper for dayproc to parallel multiple traces in a stream.
 
@@ -265,6 +310,27 @@ def dayproc(st, lowcut, highcut, filt_order, samp_rate, starttime, debug=0,
         rather than SEED convention of three) - defaults to True.
     :type fill_gaps: bool
     :param fill_gaps: Whether to pad any gaps found with zeros or not.
+    :type batch: bool
+    :param batch:
+        Whether to resample and filter channels of the same length and
+        sampling-rate together as 2D arrays, see :func:`batch_process`.
+        If parallel is True, this will use `num_cores` threads.
+    :type resample_method: str
+    :param resample_method:
+        Method used to resample data, see :func:`process`.
+    :type pool: :class:`eqcorrscan.utils.worker_pool.WorkerPool`
+    :param pool:
+        Persistent worker pool to process traces in. If given, traces are
+        processed in parallel in this pool, and `parallel` and `num_cores`
+        are ignored.
+    :type threaded: bool
+    :param threaded:
+        If parallel is True and no pool is given, process traces in
+        `num_cores` threads rather than processes. Traces are processed in
+        place without being copied to workers, which reduces memory use;
+        the resampling and filtering routines release the GIL.
+    :type dtype: numpy.dtype
+    :param dtype: Data type of the processed data, see :func:`process`.
 
     :return: Processed stream.
     :rtype: :class:`obspy.core.stream.Stream`
@@ -348,33 +414,41 @@ def dayproc(st, lowcut, highcut, filt_order, samp_rate, starttime, debug=0,
         if not len(set(startdates)) == 1:
             raise NotImplementedError('Traces start on different days')
         starttime = UTCDateTime(startdates[0])
-    if parallel:
+    if batch:
+        st = batch_process(
+            st=st, lowcut=lowcut, highcut=highcut, filt_order=filt_order,
+            samp_rate=samp_rate, debug=debug, starttime=starttime, clip=True,
+            length=86400, ignore_length=ignore_length,
+            seisan_chan_names=seisan_chan_names, fill_gaps=fill_gaps,
+            cores=num_cores if parallel else 1,
+            resample_method=resample_method, dtype=dtype)
+    elif parallel or pool is not None:
         if not num_cores:
             num_cores = cpu_count()
         if num_cores > len(st):
             num_cores = len(st)
-        pool = Pool(processes=num_cores)
-        results = [pool.apply_async(process, (tr,), {
+        kwargs = {
             'lowcut': lowcut, 'highcut': highcut, 'filt_order': filt_order,
             'samp_rate': samp_rate, 'debug': debug, 'starttime': starttime,
             'clip': True, 'ignore_length': ignore_length, 'length': 86400,
-            'seisan_chan_names': seisan_chan_names, 'fill_gaps': fill_gaps})
-                   for tr in st]
-        pool.close()
-        try:
-            stream_list = [p.get() for p in results]
-        except KeyboardInterrupt as e:  # pragma: no cover
-            pool.terminate()
-            raise e
-        pool.join()
-        st = Stream(stream_list)
+            'seisan_chan_names': seisan_chan_names, 'fill_gaps': fill_gaps,
+            'resample_method': resample_method, 'dtype': dtype}
+        if threaded and pool is None:
+            _thread_process(st, cores=num_cores, **kwargs)
+        else:
+            with pool_context(pool, processes=num_cores) as worker_pool:
+                results = [worker_pool.apply_async(process, (tr,), kwargs)
+                           for tr in st]
+                stream_list = [p.get() for p in results]
+            st = Stream(stream_list)
     else:
         for i, tr in enumerate(st):
             st[i] = process(
                 tr=tr, lowcut=lowcut, highcut=highcut, filt_order=filt_order,
                 samp_rate=samp_rate, debug=debug, starttime=starttime,
                 clip=True, length=86400, ignore_length=ignore_length,
-                seisan_chan_names=seisan_chan_names, fill_gaps=fill_gaps)
+                seisan_chan_names=seisan_chan_names, fill_gaps=fill_gaps,
+                resample_method=resample_method, dtype=dtype)
     for tr in st:
         if len(tr.data) == 0:
             st.remove(tr)
@@ -386,7 +460,8 @@ def dayproc(st, lowcut, highcut, filt_order, samp_rate, starttime, debug=0,
 
 def process(tr, lowcut, highcut, filt_order, samp_rate, debug,
             starttime=False, clip=False, length=86400,
-            seisan_chan_names=False, ignore_length=False, fill_gaps=True):
+            seisan_chan_names=False, ignore_length=False, fill_gaps=True,
+            resample_method='fft', dtype=None):
     """
     Basic function to process data, usually called by dayproc or shortproc.
 
@@ -425,6 +500,22 @@ def process(tr, lowcut, highcut, filt_order, samp_rate, debug,
     :param ignore_length: See warning in dayproc.
     :type fill_gaps: bool
     :param fill_gaps: Whether to pad any gaps found with zeros or not.
+    :type resample_method: str
+    :param resample_method:
+        Method used to resample data, either 'fft' (default) to resample
+        in the frequency domain using
+        :meth:`obspy.core.trace.Trace.resample`, or 'polyphase' to use
+        rational up/down polyphase filtering with
+        :func:`scipy.signal.resample_poly`. Polyphase resampling is faster
+        for long traces, does not assume periodic data, and applies an
+        anti-alias filter, after which filtering is applied at the new
+        sampling-rate.
+    :type dtype: numpy.dtype
+    :param dtype:
+        Data type of the processed data. Data are cast after filtering, and
+        gaps and pads are filled in this type. Use `numpy.float32` to
+        produce data ready for correlation at half the memory. Defaults
+        to None, which keeps the type produced by filtering (float64).
 
     :return: Processed trace.
     :type: :class:`obspy.core.stream.Trace`
@@ -437,6 +528,511 @@ def process(tr, lowcut, highcut, filt_order, samp_rate, debug,
         calculated within gaps. If your data have gaps you should pass a merged
         stream without the `fill_value` argument (e.g.: `tr = tr.merge()`).
     """
+    if resample_method not in RESAMPLE_METHODS:
+        raise NotImplementedError(
+            "%s is not a recognised resample_method" % resample_method)
+    tr, state = _process_start(
+        tr=tr, highcut=highcut, samp_rate=samp_rate, debug=debug,
+        starttime=starttime, clip=clip, length=length,
+        ignore_length=ignore_length)
+    # Check sampling rate and resample
+    if tr.stats.sampling_rate != samp_rate:
+        debug_print('Resampling', 1, debug)
+        if resample_method == 'polyphase':
+            tr.data = _resample_poly(
+                tr.data.astype(np.float64), tr.stats.sampling_rate,
+                samp_rate)
+            tr.stats.sampling_rate = samp_rate
+        else:
+            tr.resample(samp_rate)
+    # Filtering section
+    tr = tr.detrend('simple')    # Detrend data again before filtering
+    if highcut and lowcut:
+        debug_print('Bandpassing', 1, debug)
+        tr.data = bandpass(tr.data, lowcut, highcut,
+                           tr.stats.sampling_rate, filt_order, True)
+    elif highcut:
+        debug_print('Lowpassing', 1, debug)
+        tr.data = lowpass(tr.data, highcut, tr.stats.sampling_rate,
+                          filt_order, True)
+    elif lowcut:
+        debug_print('Highpassing', 1, debug)
+        tr.data = highpass(tr.data, lowcut, tr.stats.sampling_rate,
+                           filt_order, True)
+    else:
+        debug_print('No filters applied', 2, debug)
+    if dtype is not None:
+        tr.data = tr.data.astype(dtype, copy=False)
+    return _process_end(
+        tr=tr, state=state, debug=debug, clip=clip, length=length,
+        seisan_chan_names=seisan_chan_names, fill_gaps=fill_gaps)
+
+
+def batch_process(st, lowcut, highcut, filt_order, samp_rate, debug,
+                  starttime=False, clip=False, length=86400,
+                  seisan_chan_names=False, ignore_length=False, fill_gaps=True,
+                  cores=1, resample_method='fft', dtype=None):
+    """
+    Process multiple traces, resampling and filtering channels together.
+
+    Performs the same processing as :func:`process`, but traces with the
+    same number of samples and sampling-rate are stacked into a 2D array,
+    and resampling, detrending and filtering are applied along the time
+    axis of the array in single calls, with the filter designed once.
+    Header, length and gap handling is done trace-by-trace as in
+    :func:`process`.
+
+    :type st: obspy.core.stream.Stream
+    :param st: Stream to process
+    :type lowcut: float
+    :param lowcut: Low cut in Hz, if set to None and highcut is set, will use \
+        a lowpass filter.
+    :type highcut: float
+    :param highcut: High cut in Hz, if set to None and lowcut is set, will \
+        use a highpass filter.
+    :type filt_order: int
+    :param filt_order: Number of corners for filter.
+    :type samp_rate: float
+    :param samp_rate: Desired sampling rate in Hz.
+    :type debug: int
+    :param debug: Debug output level from 0-5, higher numbers = more output.
+    :type starttime: obspy.core.utcdatetime.UTCDateTime
+    :param starttime: Desired start of traces
+    :type clip: bool
+    :param clip: Whether to expect, and enforce a set length of data or not.
+    :type length: float
+    :param length: Use to set a fixed length for data from the given starttime.
+    :type seisan_chan_names: bool
+    :param seisan_chan_names:
+        Whether channels are named like seisan channels (which are two letters
+        rather than SEED convention of three) - defaults to True.
+    :type ignore_length: bool
+    :param ignore_length: See warning in dayproc.
+    :type fill_gaps: bool
+    :param fill_gaps: Whether to pad any gaps found with zeros or not.
+    :type cores: int
+    :param cores:
+        Number of threads to split channels between for resampling and
+        filtering, the scipy filtering routines release the GIL.
+    :type resample_method: str
+    :param resample_method:
+        Method used to resample data, see :func:`process`.
+    :type dtype: numpy.dtype
+    :param dtype: Data type of the processed data, see :func:`process`.
+
+    :return: Processed stream.
+    :rtype: :class:`obspy.core.stream.Stream`
+
+    .. note::
+        Resampling uses the same frequency-domain method as
+        :meth:`obspy.core.trace.Trace.resample`, and filtering uses the same
+        zero-phase Butterworth filters as :func:`process`, so the results
+        are the same as :func:`process` within floating-point precision.
+    """
+    if highcut and highcut >= 0.5 * samp_rate:
+        raise IOError('Highcut must be lower than the nyquist')
+    if resample_method not in RESAMPLE_METHODS:
+        raise NotImplementedError(
+            "%s is not a recognised resample_method" % resample_method)
+    prepared = [_process_start(
+        tr=tr, highcut=highcut, samp_rate=samp_rate, debug=debug,
+        starttime=starttime, clip=clip, length=length,
+        ignore_length=ignore_length) for tr in st]
+    groups = {}
+    for i, (tr, state) in enumerate(prepared):
+        key = (tr.stats.npts, tr.stats.sampling_rate)
+        groups.update({key: groups.get(key, []) + [i]})
+    for (npts, sampling_rate), indices in groups.items():
+        debug_print('Processing %i channels of %i samples together' %
+                    (len(indices), npts), 1, debug)
+        data = np.vstack([prepared[i][0].data for i in indices]).astype(
+            np.float64, copy=False)
+        n_blocks = min(cores or cpu_count(), len(indices))
+        kwargs = {
+            'sampling_rate': sampling_rate, 'samp_rate': samp_rate,
+            'lowcut': lowcut, 'highcut': highcut, 'filt_order': filt_order,
+            'debug': debug, 'resample_method': resample_method}
+        if n_blocks > 1:
+            pool = ThreadPool(processes=n_blocks)
+            try:
+                results = [pool.apply_async(_process_2d, (block,), kwargs)
+                           for block in np.array_split(data, n_blocks)]
+                data = np.vstack([result.get() for result in results])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            data = _process_2d(data, **kwargs)
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        for row, i in zip(data, indices):
+            tr = prepared[i][0]
+            tr.data = row
+            tr.stats.sampling_rate = samp_rate
+    return Stream([_process_end(
+        tr=tr, state=state, debug=debug, clip=clip, length=length,
+        seisan_chan_names=seisan_chan_names, fill_gaps=fill_gaps)
+        for tr, state in prepared])
+
+
+class ProcessedDataCache(object):
+    """
+    On-disk cache of processed continuous data.
+
+    Processed channels are stored as memory-mappable numpy arrays with
+    JSON headers, keyed by seed id, the processing function and its
+    parameters (filter, sampling-rate, start and end-time or day, ...) and a
+    checksum of the raw data. Stored channels are evicted least recently
+    used first once the cache exceeds `max_size`.
+
+    :type path: str
+    :param path: Directory to store processed data in, created if needed.
+    :type max_size: int
+    :param max_size:
+        Maximum size of the cache in bytes, if None the cache is unbounded.
+
+    .. rubric:: Example
+
+    >>> import tempfile
+    >>> from obspy import read
+    >>> cache = ProcessedDataCache(path=tempfile.mkdtemp())
+    >>> st = read()
+    >>> processed = cache.process(
+    ...     shortproc, st.copy(), lowcut=1.0, highcut=10.0, filt_order=4,
+    ...     samp_rate=100.0, parallel=False)
+    >>> processed_again = cache.process(
+    ...     shortproc, st.copy(), lowcut=1.0, highcut=10.0, filt_order=4,
+    ...     samp_rate=100.0, parallel=False)
+    >>> print(cache.hits, cache.misses)
+    3 3
+    """
+    # Arguments that do not change the processed data
+    ignored_kwargs = ('debug', 'parallel', 'num_cores', 'pool', 'threaded',
+                      'batch')
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __repr__(self):
+        return "ProcessedDataCache(path={0}, max_size={1})".format(
+            self.path, self.max_size)
+
+    def process(self, func, st, **kwargs):
+        """
+        Process a stream, re-using processed channels held in the cache.
+
+        Channels not in the cache are processed together by func and stored.
+
+        :type func: callable
+        :param func: Processing function, e.g. :func:`shortproc`.
+        :type st: obspy.core.stream.Stream
+        :param st: Raw data to process.
+        :param kwargs: Arguments for func.
+
+        :return: Processed stream.
+        :rtype: :class:`obspy.core.stream.Stream`
+        """
+        seed_ids = []
+        for tr in st:
+            if tr.id not in seed_ids:
+                seed_ids.append(tr.id)
+        processed, keys, missing = {}, {}, Stream()
+        for seed_id in seed_ids:
+            traces = [tr for tr in st if tr.id == seed_id]
+            key = self._key(func, seed_id, traces, kwargs)
+            cached = self._get(key, traces)
+            if cached is None:
+                keys[seed_id] = key
+                missing.traces.extend(traces)
+            else:
+                self.hits += 1
+                processed[seed_id] = cached
+        if len(missing) > 0:
+            self.misses += len(keys)
+            new = func(st=missing, **kwargs)
+            if isinstance(new, Trace):
+                new = Stream([new])
+            for seed_id, key in keys.items():
+                traces = [tr for tr in new if tr.id == seed_id]
+                self._put(key, traces)
+                processed[seed_id] = traces
+        return Stream([tr for seed_id in seed_ids
+                       for tr in processed[seed_id]])
+
+    def clear(self):
+        """Remove all processed data from the cache."""
+        for entry in self._entries():
+            self._remove(entry[0])
+
+    def _key(self, func, seed_id, traces, kwargs):
+        params = sorted((key, str(value)) for key, value in kwargs.items()
+                        if key not in self.ignored_kwargs)
+        md5 = hashlib.md5(repr((func.__name__, params)).encode("utf-8"))
+        for tr in traces:
+            md5.update(repr((str(tr.stats.starttime),
+                             tr.stats.sampling_rate)).encode("utf-8"))
+            if isinstance(tr.data, np.ma.MaskedArray):
+                md5.update(np.ma.getmaskarray(tr.data).tobytes())
+                md5.update(np.ascontiguousarray(tr.data.data).tobytes())
+            else:
+                md5.update(np.ascontiguousarray(tr.data).tobytes())
+        start = kwargs.get('starttime') or traces[0].stats.starttime
+        return "{0}_{1}_{2}".format(
+            seed_id, UTCDateTime(start).strftime("%Y%m%dT%H%M%S"),
+            md5.hexdigest())
+
+    def _get(self, key, raw):
+        header_file = os.path.join(self.path, key + ".json")
+        try:
+            with open(header_file, "r") as f:
+                headers = json.load(f)
+            traces = []
+            for i, header in enumerate(headers):
+                data_file = os.path.join(self.path, "{0}_{1}.npy".format(
+                    key, i))
+                if header['npts'] > 0:
+                    data = np.load(data_file, mmap_mode='c',
+                                   allow_pickle=False)
+                else:
+                    data = np.load(data_file, allow_pickle=False)
+                # Other header fields are kept from the raw data by processing
+                stats = raw[min(i, len(raw) - 1)].stats.copy()
+                stats.network, stats.station, stats.location, \
+                    stats.channel = header['id'].split('.')
+                stats.sampling_rate = header['sampling_rate']
+                stats.starttime = UTCDateTime(ns=header['starttime'])
+                stats.processing = header['processing']
+                traces.append(Trace(data=data, header=stats))
+        except (IOError, OSError, EOFError, ValueError, KeyError):
+            return None
+        # Mark as recently used
+        os.utime(header_file, None)
+        return traces
+
+    def _put(self, key, traces):
+        for i, tr in enumerate(traces):
+            data_file = os.path.join(self.path, "{0}_{1}.npy".format(key, i))
+            with open(data_file + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(tr.data))
+            os.rename(data_file + ".tmp", data_file)
+        # The header is written last so that only complete entries are read
+        header_file = os.path.join(self.path, key + ".json")
+        with open(header_file + ".tmp", "w") as f:
+            json.dump([{
+                'id': tr.id, 'starttime': tr.stats.starttime.ns,
+                'sampling_rate': tr.stats.sampling_rate,
+                'npts': tr.stats.npts,
+                'processing': list(tr.stats.get('processing', []))}
+                for tr in traces], f)
+        os.rename(header_file + ".tmp", header_file)
+        if self.max_size is not None:
+            self._evict()
+
+    def _entries(self):
+        """Get a list of (key, size, last-used time) for entries."""
+        sizes, used = {}, {}
+        for fname in os.listdir(self.path):
+            full_path = os.path.join(self.path, fname)
+            if fname.endswith(".json"):
+                key = fname[:-5]
+                used[key] = os.path.getmtime(full_path)
+            elif fname.endswith(".npy"):
+                key = fname[:-4].rsplit("_", 1)[0]
+            else:
+                continue
+            sizes[key] = sizes.get(key, 0) + os.path.getsize(full_path)
+        return [(key, sizes[key], used[key]) for key in used]
+
+    def _remove(self, key):
+        header_file = os.path.join(self.path, key + ".json")
+        with open(header_file, "r") as f:
+            n_traces = len(json.load(f))
+        os.remove(header_file)
+        for i in range(n_traces):
+            data_file = os.path.join(self.path, "{0}_{1}.npy".format(key, i))
+            if os.path.isfile(data_file):
+                os.remove(data_file)
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(entry[1] for entry in entries)
+        while total > self.max_size and len(entries) > 0:
+            key, size, _ = entries.pop(0)
+            self._remove(key)
+            total -= size
+
+
+def _process_2d(data, sampling_rate, samp_rate, lowcut, highcut, filt_order,
+                debug=0, resample_method='fft'):
+    """
+    Resample, detrend and filter rows of a 2D array.
+
+    :type data: numpy.ndarray
+    :param data: 2D array of data, channels by samples.
+    :type sampling_rate: float
+    :param sampling_rate: Sampling-rate of data in Hz.
+    :type samp_rate: float
+    :param samp_rate: Desired sampling rate in Hz.
+    :type lowcut: float
+    :param lowcut: Low cut in Hz.
+    :type highcut: float
+    :param highcut: High cut in Hz.
+    :type filt_order: int
+    :param filt_order: Number of corners for filter.
+    :type debug: int
+    :param debug: Debug output level from 0-5, higher numbers = more output.
+    :type resample_method: str
+    :param resample_method: Method used to resample data.
+
+    :return: numpy.ndarray
+    """
+    if sampling_rate != samp_rate:
+        debug_print('Resampling', 1, debug)
+        if resample_method == 'polyphase':
+            data = _resample_poly(data, sampling_rate, samp_rate)
+        else:
+            data = _resample_2d(data, sampling_rate, samp_rate)
+    # Simple detrend, as obspy.signal.detrend.simple
+    ndat = data.shape[-1]
+    data -= data[:, :1] + np.arange(ndat) * (
+        data[:, -1:] - data[:, :1]) / float(ndat - 1)
+    sos = _design_sos(lowcut, highcut, samp_rate, filt_order, debug)
+    if sos is not None:
+        # Zero-phase, as obspy.signal.filter.bandpass(..., zerophase=True)
+        data = sosfilt(sos, data, axis=-1)
+        data = sosfilt(sos, data[:, ::-1], axis=-1)[:, ::-1]
+    return data
+
+
+def _design_sos(lowcut, highcut, samp_rate, filt_order, debug=0):
+    """
+    Design a Butterworth filter in the same way as obspy.signal.filter.
+
+    :return: Second-order sections, or None if no filter is required.
+    """
+    fe = 0.5 * samp_rate
+    if highcut and lowcut and highcut / fe - 1.0 <= -1e-6:
+        debug_print('Bandpassing', 1, debug)
+        if lowcut / fe > 1:
+            raise ValueError(
+                "Selected low corner frequency is above Nyquist.")
+        z, p, k = iirfilter(filt_order, [lowcut / fe, highcut / fe],
+                            btype='band', ftype='butter', output='zpk')
+    elif highcut and not lowcut:
+        debug_print('Lowpassing', 1, debug)
+        f = highcut / fe
+        if f > 1:
+            f = 1.0
+            warnings.warn("Selected corner frequency is above Nyquist. "
+                          "Setting Nyquist as high corner.")
+        z, p, k = iirfilter(filt_order, f, btype='lowpass', ftype='butter',
+                            output='zpk')
+    elif lowcut:
+        debug_print('Highpassing', 1, debug)
+        if lowcut / fe > 1:
+            raise ValueError("Selected corner frequency is above Nyquist.")
+        z, p, k = iirfilter(filt_order, lowcut / fe, btype='highpass',
+                            ftype='butter', output='zpk')
+    else:
+        debug_print('No filters applied', 2, debug)
+        return None
+    return zpk2sos(z, p, k)
+
+
+def _resample_2d(data, sampling_rate, samp_rate):
+    """
+    Resample rows of a 2D array in the frequency domain.
+
+    Follows :meth:`obspy.core.trace.Trace.resample` using the default
+    Hann window and no automatic anti-alias filter.
+
+    :type data: numpy.ndarray
+    :param data: 2D array of data, channels by samples.
+    :type sampling_rate: float
+    :param sampling_rate: Sampling-rate of data in Hz.
+    :type samp_rate: float
+    :param samp_rate: Desired sampling rate in Hz.
+
+    :return: numpy.ndarray
+    """
+    npts = data.shape[-1]
+    factor = sampling_rate / float(samp_rate)
+    x = np.fft.rfft(data, axis=-1)
+    x *= np.fft.ifftshift(get_window('hann', npts))[:npts // 2 + 1]
+    num = int(npts / factor)
+    df = sampling_rate / float(npts)
+    f = df * np.arange(0, npts // 2 + 1, dtype=np.int32)
+    large_f = (1.0 / num * samp_rate) * np.arange(
+        0, num // 2 + 1, dtype=np.int32)
+    # Linear interpolation of the spectra, as numpy.interp, for all rows
+    index = np.clip(np.searchsorted(f, large_f, side='right') - 1,
+                    0, len(f) - 2)
+    weight = np.clip((large_f - f[index]) / (f[index + 1] - f[index]), 0, 1)
+    large_y = x[:, index] * (1 - weight) + x[:, index + 1] * weight
+    return np.fft.irfft(large_y, n=num, axis=-1) * (float(num) / float(npts))
+
+
+def _thread_process(st, cores, **kwargs):
+    """
+    Process the traces of a stream in place using a pool of threads.
+
+    :type st: obspy.core.stream.Stream
+    :param st: Stream to process, traces are replaced by processed traces.
+    :type cores: int
+    :param cores: Number of threads to use.
+    :param kwargs: Arguments for :func:`process`.
+    """
+    pool = ThreadPool(processes=cores)
+    try:
+        results = [pool.apply_async(process, (tr,), kwargs) for tr in st]
+        for i, result in enumerate(results):
+            st.traces[i] = result.get()
+    finally:
+        pool.close()
+        pool.join()
+    return st
+
+
+def _resample_poly(data, sampling_rate, samp_rate):
+    """
+    Resample data along the last axis using polyphase filtering.
+
+    The output has the same number of samples as frequency-domain
+    resampling, and the first sample is at the same time as the input.
+
+    :type data: numpy.ndarray
+    :param data: 1D or 2D array of data, time along the last axis.
+    :type sampling_rate: float
+    :param sampling_rate: Sampling-rate of data in Hz.
+    :type samp_rate: float
+    :param samp_rate: Desired sampling rate in Hz.
+
+    :return: numpy.ndarray
+    """
+    ratio = Fraction(samp_rate / float(sampling_rate)).limit_denominator(1000)
+    if abs(float(ratio) - samp_rate / float(sampling_rate)) > 1e-9:
+        raise NotImplementedError(
+            "Cannot resample from %s Hz to %s Hz with a rational up/down "
+            "ratio" % (sampling_rate, samp_rate))
+    num = int(data.shape[-1] / (sampling_rate / float(samp_rate)))
+    return resample_poly(
+        data, ratio.numerator, ratio.denominator, axis=-1)[..., :num]
+
+
+def _process_start(tr, highcut, samp_rate, debug, starttime, clip, length,
+                   ignore_length):
+    """
+    Gap-fill, check, detrend and enforce the length of a trace.
+
+    First stage of :func:`process`, see there for parameters.
+
+    :return: Trace and dict of state needed by :func:`_process_end`.
+    """
     # Add sanity check
     if highcut and highcut >= 0.5 * samp_rate:
         raise IOError('Highcut must be lower than the nyquist')
@@ -512,26 +1108,33 @@ def process(tr, lowcut, highcut, filt_order, samp_rate, debug,
                                  tr.stats.station + '.' + tr.stats.channel)
         debug_print('I now have %i data points after enforcing length'
                     % len(tr.data), 0, debug)
-    # Check sampling rate and resample
-    if tr.stats.sampling_rate != samp_rate:
-        debug_print('Resampling', 1, debug)
-        tr.resample(samp_rate)
-    # Filtering section
-    tr = tr.detrend('simple')    # Detrend data again before filtering
-    if highcut and lowcut:
-        debug_print('Bandpassing', 1, debug)
-        tr.data = bandpass(tr.data, lowcut, highcut,
-                           tr.stats.sampling_rate, filt_order, True)
-    elif highcut:
-        debug_print('Lowpassing', 1, debug)
-        tr.data = lowpass(tr.data, highcut, tr.stats.sampling_rate,
-                          filt_order, True)
-    elif lowcut:
-        debug_print('Highpassing', 1, debug)
-        tr.data = highpass(tr.data, lowcut, tr.stats.sampling_rate,
-                           filt_order, True)
-    else:
-        debug_print('No filters applied', 2, debug)
+    state = {'day': day, 'gappy': gappy, 'padded': padded,
+             'starttime': starttime}
+    if gappy:
+        state.update({'gaps': gaps})
+    if padded:
+        state.update({'pre_pad_secs': pre_pad_secs,
+                      'post_pad_secs': post_pad_secs})
+    return tr, state
+
+
+def _process_end(tr, state, debug, clip, length, seisan_chan_names,
+                 fill_gaps):
+    """
+    Re-apply pads and gaps, and enforce the length of a processed trace.
+
+    Final stage of :func:`process`, see there for parameters.
+
+    :type state: dict
+    :param state: State returned by :func:`_process_start`.
+
+    :return: Processed trace.
+    """
+    day, gappy, padded = state['day'], state['gappy'], state['padded']
+    starttime = state['starttime']
+    if padded:
+        pre_pad_secs = state['pre_pad_secs']
+        post_pad_secs = state['post_pad_secs']
     # Account for two letter channel names in s-files and therefore templates
     if seisan_chan_names:
         tr.stats.channel = tr.stats.channel[0] + tr.stats.channel[-1]
@@ -544,8 +1147,10 @@ def process(tr, lowcut, highcut, filt_order, samp_rate, debug,
     if padded:
         debug_print("Reapplying zero pads post processing", 1, debug)
         debug_print(str(tr), 2, debug)
-        pre_pad = np.zeros(int(pre_pad_secs * tr.stats.sampling_rate))
-        post_pad = np.zeros(int(post_pad_secs * tr.stats.sampling_rate))
+        pre_pad = np.zeros(int(pre_pad_secs * tr.stats.sampling_rate),
+                           dtype=tr.data.dtype)
+        post_pad = np.zeros(int(post_pad_secs * tr.stats.sampling_rate),
+                            dtype=tr.data.dtype)
         pre_pad_len = len(pre_pad)
         post_pad_len = len(post_pad)
         debug_print("Taking only valid data between %i and %i samples" %
@@ -571,7 +1176,7 @@ def process(tr, lowcut, highcut, filt_order, samp_rate, debug,
                                  tr.stats.station + '.' + tr.stats.channel)
     # Replace the gaps with zeros
     if gappy:
-        tr = _zero_pad_gaps(tr, gaps, fill_gaps=fill_gaps)
+        tr = _zero_pad_gaps(tr, state['gaps'], fill_gaps=fill_gaps)
     # Final visual check for debug
     if debug > 4:
         tr.plot()
@@ -610,11 +1215,13 @@ def _zero_pad_gaps(tr, gaps, fill_gaps=True):
         if tr.stats.starttime != start_in:
             # pad with zeros
             tr.data = np.concatenate(
-                [np.zeros(int(tr.stats.starttime - start_in)), tr.data])
+                [np.zeros(int(tr.stats.starttime - start_in),
+                          dtype=tr.data.dtype), tr.data])
             tr.stats.starttime = start_in
         if tr.stats.endtime != end_in:
             tr.data = np.concatenate(
-                [tr.data, np.zeros(int(end_in - tr.stats.endtime))])
+                [tr.data, np.zeros(int(end_in - tr.stats.endtime),
+                                   dtype=tr.data.dtype)])
     return tr
 
 
@@ -95,7 +95,7 @@ def PWS_stack(streams, weight=2, normalize=True):
 
 
 def align_traces(trace_list, shift_len, master=False, positive=False,
-                 plot=False):
+                 plot=False, interpolate=False):
     """
     Align traces relative to each other based on their cross-correlation value.
 
@@ -116,11 +116,18 @@ def align_traces(trace_list, shift_len, master=False, positive=False,
         absolute maximum, defaults to False (absolute maximum).
     :type plot: bool
     :param plot: If true, will plot each trace aligned with the master.
+    :type interpolate: bool
+    :param interpolate:
+        Interpolate the correlation functions to achieve sub-sample precision,
+        see :func:`eqcorrscan.core.lag_calc._xcorr_interp_array`. Shifts
+        and correlations of traces where the interpolation is unstable are
+        not interpolated.
 
     :returns: list of shifts and correlations for best alignment in seconds.
     :rtype: list
     """
     from eqcorrscan.core.match_filter import normxcorr2
+    from eqcorrscan.core.lag_calc import _xcorr_interp_array
     from eqcorrscan.utils.plotting import xcorr_plot
     traces = deepcopy(trace_list)
     if not master:
@@ -135,6 +142,8 @@ def align_traces(trace_list, shift_len, master=False, positive=False,
         print('Using master given by user')
     shifts = []
     ccs = []
+    cc_vecs = []
+    flips = []
     for i in range(len(traces)):
         if not master.stats.sampling_rate == traces[i].stats.sampling_rate:
             raise ValueError('Sampling rates not the same')
@@ -150,11 +159,32 @@ def align_traces(trace_list, shift_len, master=False, positive=False,
                        image=master.data.astype(np.float32), shift=shift,
                        cc=cc)
         shift -= shift_len
+        # Whether the chosen peak is the absolute minimum of cc_vec
+        flip = cc < 0
         if cc < 0 and positive:
             cc = cc_vec.max()
             shift = cc_vec.argmax() - shift_len
+            flip = False
         shifts.append(shift / master.stats.sampling_rate)
         ccs.append(cc)
+        # Flip correlations so that the chosen peak is the maximum
+        flips.append(flip)
+        cc_vecs.append(-cc_vec if flip else cc_vec)
+    if interpolate:
+        # Interpolate correlation functions of the same length together
+        lengths = {}
+        for i, cc_vec in enumerate(cc_vecs):
+            lengths.setdefault(len(cc_vec), []).append(i)
+        for indices in lengths.values():
+            interp_shifts, interp_ccs, unstable = _xcorr_interp_array(
+                cccs=np.array([cc_vecs[i] for i in indices]),
+                dt=master.stats.delta)
+            for i, shift, cc, bad in zip(
+                    indices, interp_shifts, interp_ccs, unstable):
+                if bad:
+                    continue
+                shifts[i] = shift - (shift_len / master.stats.sampling_rate)
+                ccs[i] = -cc if flips[i] else cc
     return shifts, ccs
 
 
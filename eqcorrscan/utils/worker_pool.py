@@ -0,0 +1,320 @@
+"""
+Persistent worker pool exchanging waveform data through shared memory.
+
+Creating a :class:`multiprocessing.Pool` for every call, and pickling whole
+traces to send to the workers, can cost as much as the processing itself
+for short tasks. :class:`WorkerPool` can be kept alive and passed to
+functions that accept a `pool` argument, and the data of
+:class:`obspy.core.trace.Trace`, :class:`obspy.core.stream.Stream` and
+:class:`numpy.ndarray` arguments and results are exchanged through
+:mod:`multiprocessing.shared_memory` blocks rather than pickled. On Python
+versions without :mod:`multiprocessing.shared_memory` (< 3.8) data are
+pickled as usual.
+
+:copyright:
+    EQcorrscan developers.
+
+:license:
+    GNU Lesser General Public License, Version 3
+    (https://www.gnu.org/copyleft/lesser.html)
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import contextlib
+import numpy as np
+
+from multiprocessing import Pool, cpu_count
+from obspy import Trace, Stream
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:  # pragma: no cover
+    shared_memory = None
+
+
+class WorkerPool(object):
+    """
+    Persistent pool of worker processes.
+
+    :type processes: int
+    :param processes:
+        Number of worker processes, defaults to the number of cores.
+
+    .. rubric:: Example
+
+    >>> import numpy as np
+    >>> data = np.arange(10, dtype=np.float64)
+    >>> with WorkerPool(processes=2) as pool:
+    ...     result = pool.apply_async(np.sum, (data, ))
+    ...     print(result.get())
+    45.0
+    """
+    def __init__(self, processes=None):
+        self.processes = processes or cpu_count()
+        if shared_memory is not None:
+            # Workers must share the parent's tracker of shared memory
+            # blocks, otherwise blocks freed by the parent are reported as
+            # leaked by the workers' trackers.
+            resource_tracker.ensure_running()
+        self._pool = Pool(processes=self.processes)
+        self._pending = {}
+        self._shared = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def apply_async(self, func, args=(), kwds=None):
+        """
+        Run a function in the pool.
+
+        Traces, Streams and arrays in `args` and `kwds` (including those in
+        lists, tuples and dicts) are passed through shared memory, as are
+        those in the result.
+
+        :type func: callable
+        :param func: Picklable function to run.
+        :type args: tuple
+        :param args: Positional arguments for func.
+        :type kwds: dict
+        :param kwds: Keyword arguments for func.
+
+        :return: Result with a `get` method, as for
+            :meth:`multiprocessing.pool.Pool.apply_async`.
+        """
+        blocks = []
+        try:
+            shared_args = _share(tuple(args), blocks)
+            shared_kwds = _share(dict(kwds or {}), blocks)
+        except Exception:
+            _free(blocks)
+            raise
+        result = _SharedResult(
+            self._pool.apply_async(
+                _shared_call, (func, shared_args, shared_kwds)),
+            blocks, self._pending)
+        self._pending[id(result)] = blocks
+        return result
+
+    def share(self, obj):
+        """
+        Copy the data of an object into shared memory once.
+
+        The returned object can be passed to many calls of
+        :meth:`apply_async` without copying the data again. Lists of shared
+        objects, and shared arrays, can be indexed and sliced. Memory is
+        held until :meth:`release` is called or the pool is closed.
+
+        :param obj: Trace, Stream, numpy array or list or tuple of these.
+
+        :return: Shared representation of obj.
+        """
+        blocks = []
+        try:
+            shared = _share(obj, blocks)
+        except Exception:
+            _free(blocks)
+            raise
+        self._shared[id(shared)] = (shared, blocks)
+        return shared
+
+    def release(self, shared):
+        """
+        Free the shared memory of an object returned by :meth:`share`.
+
+        :param shared: Object returned by :meth:`share`.
+        """
+        _free(self._shared.pop(id(shared), (None, []))[1])
+
+    def _release_all(self):
+        for _, blocks in self._shared.values():
+            _free(blocks)
+        self._shared = {}
+        for blocks in self._pending.values():
+            _free(blocks)
+        self._pending.clear()
+
+    def close(self):
+        """Wait for the workers to finish and free shared memory."""
+        self._pool.close()
+        self._pool.join()
+        self._release_all()
+
+    def terminate(self):
+        """Stop the workers immediately and free shared memory."""
+        self._pool.terminate()
+        self._pool.join()
+        self._release_all()
+
+
+@contextlib.contextmanager
+def pool_context(pool=None, processes=None):
+    """
+    Use a given pool, or a temporary :class:`WorkerPool`.
+
+    A temporary pool is closed on exit, or terminated if an error is
+    raised. A given pool is left open for re-use.
+
+    :type pool: :class:`WorkerPool`
+    :param pool: Pool to use, if None a temporary pool will be made.
+    :type processes: int
+    :param processes: Number of processes for a temporary pool.
+    """
+    if pool is not None:
+        yield pool
+        return
+    worker_pool = WorkerPool(processes=processes)
+    try:
+        yield worker_pool
+    except BaseException:
+        worker_pool.terminate()
+        raise
+    worker_pool.close()
+
+
+class _SharedResult(object):
+    """Result of :meth:`WorkerPool.apply_async`."""
+    def __init__(self, result, blocks, pending):
+        self._result = result
+        self._blocks = blocks
+        self._pending = pending
+
+    def ready(self):
+        return self._result.ready()
+
+    def wait(self, timeout=None):
+        self._result.wait(timeout)
+
+    def get(self, timeout=None):
+        try:
+            return _unshare(self._result.get(timeout), unlink=True)
+        finally:
+            # Workers may still be reading the arguments if the get timed
+            # out, in which case they are freed later or when the pool closes
+            if self._result.ready():
+                _free(self._blocks)
+                self._pending.pop(id(self), None)
+
+
+class _SharedArray(object):
+    """Reference to a 1D or 2D array held in shared memory."""
+    def __init__(self, name, shape, dtype, start=0, stop=None):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.start = start
+        self.stop = shape[0] if stop is None else stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise IndexError("Shared arrays only support contiguous slices")
+        start, stop, _ = item.indices(len(self))
+        return _SharedArray(
+            self.name, self.shape, self.dtype, start=self.start + start,
+            stop=self.start + max(start, stop))
+
+    def attach(self, unlink=False):
+        """Copy the data out of shared memory."""
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            view = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+            data = view[self.start:self.stop].copy()
+            del view
+        finally:
+            shm.close()
+            if unlink:
+                shm.unlink()
+        return data
+
+
+class _SharedTrace(object):
+    """Trace header with data held in shared memory."""
+    def __init__(self, stats, data):
+        self.stats = stats
+        self.data = data
+
+
+class _SharedStream(list):
+    """List of shared traces representing a Stream."""
+    pass
+
+
+def _shared_call(func, args, kwds):
+    """Run func in a worker, sharing the result back to the parent."""
+    result = func(*_unshare(args), **_unshare(kwds))
+    blocks = []
+    shared = _share(result, blocks)
+    # The parent process unlinks result blocks once it has read them.
+    for shm in blocks:
+        shm.close()
+    return shared
+
+
+def _share(obj, blocks):
+    """Replace data in obj with shared memory references."""
+    if shared_memory is None:
+        return obj
+    if isinstance(obj, Stream):
+        return _SharedStream([_share(tr, blocks) for tr in obj])
+    if isinstance(obj, Trace):
+        if isinstance(obj.data, np.ma.MaskedArray) or obj.data.nbytes == 0:
+            return obj
+        return _SharedTrace(obj.stats, _share(obj.data, blocks))
+    if isinstance(obj, np.ndarray):
+        if isinstance(obj, np.ma.MaskedArray) or obj.nbytes == 0 or \
+                obj.dtype.hasobject or obj.ndim not in (1, 2):
+            return obj
+        shm = shared_memory.SharedMemory(create=True, size=obj.nbytes)
+        blocks.append(shm)
+        view = np.ndarray(obj.shape, dtype=obj.dtype, buffer=shm.buf)
+        view[:] = obj
+        del view
+        return _SharedArray(shm.name, obj.shape, obj.dtype)
+    if type(obj) in (list, tuple):
+        return type(obj)(_share(item, blocks) for item in obj)
+    if type(obj) is dict:
+        return {key: _share(value, blocks) for key, value in obj.items()}
+    return obj
+
+
+def _unshare(obj, unlink=False):
+    """Replace shared memory references in obj with data."""
+    if isinstance(obj, _SharedArray):
+        return obj.attach(unlink=unlink)
+    if isinstance(obj, _SharedTrace):
+        return Trace(data=_unshare(obj.data, unlink=unlink), header=obj.stats)
+    if isinstance(obj, _SharedStream):
+        return Stream([_unshare(tr, unlink=unlink) for tr in obj])
+    if type(obj) in (list, tuple):
+        return type(obj)(_unshare(item, unlink=unlink) for item in obj)
+    if type(obj) is dict:
+        return {key: _unshare(value, unlink=unlink)
+                for key, value in obj.items()}
+    return obj
+
+
+def _free(blocks):
+    """Close and unlink shared memory blocks."""
+    for shm in blocks:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:  # pragma: no cover
+            pass
+    del blocks[:]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()